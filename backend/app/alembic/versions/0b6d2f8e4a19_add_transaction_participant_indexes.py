@@ -0,0 +1,46 @@
+"""Add transaction created_at and newest-first participant indexes
+
+Revision ID: 0b6d2f8e4a19
+Revises: f3a8c61e0d27
+Create Date: 2026-10-16 23:41:19.604382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6d2f8e4a19'
+down_revision = 'f3a8c61e0d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Creation times of existing transactions weren't recorded; their start
+    # date is the closest stand-in for ordering them
+    op.add_column('transaction', sa.Column('created_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "transaction" SET created_at = start_date')
+    op.alter_column('transaction', 'created_at', nullable=False)
+
+    with op.get_context().autocommit_block():
+        for role in ('renter', 'lender'):
+            op.create_index(
+                f'ix_transaction_{role}_id_created_at_id',
+                'transaction',
+                [f'{role}_id', 'created_at', 'id'],
+                unique=False,
+                postgresql_concurrently=True,
+            )
+            op.drop_index(
+                f'ix_transaction_{role}_id_id',
+                table_name='transaction',
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    for role in ('renter', 'lender'):
+        op.create_index(f'ix_transaction_{role}_id_id', 'transaction', [f'{role}_id', 'id'], unique=False)
+        op.drop_index(f'ix_transaction_{role}_id_created_at_id', table_name='transaction')
+    op.drop_column('transaction', 'created_at')
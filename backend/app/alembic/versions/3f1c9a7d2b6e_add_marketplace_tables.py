@@ -0,0 +1,109 @@
+"""Add marketplace tables
+
+Revision ID: 3f1c9a7d2b6e
+Revises: d98dd8ec85a3
+Create Date: 2026-10-16 09:12:31.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b6e'
+down_revision = 'd98dd8ec85a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # These tables used to be created only by SQLModel.metadata.create_all() in
+    # init_db, so existing deployments already have them. Only create the ones
+    # that are missing, so later migrations have a schema to build on.
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('listing'):
+        op.create_table(
+            'listing',
+            sa.Column('title', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+            sa.Column('description', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+            sa.Column('price', sa.Float(), nullable=True),
+            sa.Column('category', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+            sa.Column('location', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+            sa.Column('images', sa.JSON(), nullable=True),
+            sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('owner_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.ForeignKeyConstraint(['owner_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not inspector.has_table('transaction'):
+        op.create_table(
+            'transaction',
+            sa.Column('listing_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('renter_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('lender_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('start_date', sa.DateTime(), nullable=False),
+            sa.Column('end_date', sa.DateTime(), nullable=False),
+            sa.Column('total_price', sa.Float(), nullable=False),
+            sa.Column('status', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not inspector.has_table('message'):
+        op.create_table(
+            'message',
+            sa.Column('sender_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('receiver_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('content', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not inspector.has_table('review'):
+        op.create_table(
+            'review',
+            sa.Column('reviewer_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('reviewee_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('listing_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('rating', sa.Float(), nullable=False),
+            sa.Column('comment', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not inspector.has_table('notification'):
+        op.create_table(
+            'notification',
+            sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('title', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column('message', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column('is_read', sa.Boolean(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if not inspector.has_table('report'):
+        op.create_table(
+            'report',
+            sa.Column('reporter_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('reported_user_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('listing_id', postgresql.UUID(as_uuid=True), nullable=True),
+            sa.Column('message', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('status', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade():
+    # Left in place: on deployments older than this revision these tables
+    # hold data it never created, and upgrade adopts them again as they are
+    pass
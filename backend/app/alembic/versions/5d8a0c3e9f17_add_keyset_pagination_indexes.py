@@ -0,0 +1,45 @@
+"""Add keyset pagination indexes
+
+Revision ID: 5d8a0c3e9f17
+Revises: 7b2e4d91c0a5
+Create Date: 2026-10-16 11:26:05.318470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8a0c3e9f17'
+down_revision = '7b2e4d91c0a5'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns): each matches the filter + sort key used by the
+# cursor mode of the corresponding list endpoint
+INDEXES = [
+    ('ix_item_owner_id_id', 'item', ['owner_id', 'id']),
+    ('ix_listing_owner_id_id', 'listing', ['owner_id', 'id']),
+    ('ix_transaction_renter_id_id', 'transaction', ['renter_id', 'id']),
+    ('ix_transaction_lender_id_id', 'transaction', ['lender_id', 'id']),
+    ('ix_notification_user_id_timestamp_id', 'notification', ['user_id', 'timestamp', 'id']),
+    ('ix_report_reporter_id_timestamp_id', 'report', ['reporter_id', 'timestamp', 'id']),
+    ('ix_report_reported_user_id_timestamp_id', 'report', ['reported_user_id', 'timestamp', 'id']),
+    ('ix_review_listing_id_timestamp_id', 'review', ['listing_id', 'timestamp', 'id']),
+    ('ix_review_reviewee_id_timestamp_id', 'review', ['reviewee_id', 'timestamp', 'id']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False, postgresql_concurrently=True
+            )
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,56 @@
+"""Add full-text search vector and GIN index to listing
+
+Revision ID: 7b2e4d91c0a5
+Revises: 3f1c9a7d2b6e
+Create Date: 2026-10-16 10:03:48.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2e4d91c0a5'
+down_revision = '3f1c9a7d2b6e'
+branch_labels = None
+depends_on = None
+
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+
+def upgrade():
+    # Adding a STORED generated column rewrites the table once, which computes
+    # the vector for every existing row: this is the backfill. New and updated
+    # rows are kept current by Postgres from then on.
+    op.add_column(
+        'listing',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(SEARCH_VECTOR, persisted=True),
+            nullable=True,
+        ),
+    )
+
+    # Build the index without blocking writes on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_listing_search_vector',
+            'listing',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index('ix_listing_search_vector', table_name='listing')
+    op.drop_column('listing', 'search_vector')
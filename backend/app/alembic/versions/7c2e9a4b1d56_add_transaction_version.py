@@ -0,0 +1,29 @@
+"""Add version column to transaction
+
+Revision ID: 7c2e9a4b1d56
+Revises: 0b6d2f8e4a19
+Create Date: 2026-10-16 23:02:41.517390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e9a4b1d56'
+down_revision = '0b6d2f8e4a19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A constant default is stored in the catalog, so existing rows aren't
+    # rewritten
+    op.add_column(
+        'transaction',
+        sa.Column('version', sa.Integer(), nullable=False, server_default='1'),
+    )
+
+
+def downgrade():
+    op.drop_column('transaction', 'version')
@@ -0,0 +1,48 @@
+"""Add lender earnings rollup
+
+Revision ID: 9a41c7e3f5b8
+Revises: 7c2e9a4b1d56
+Create Date: 2026-10-16 23:24:10.648215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9a41c7e3f5b8'
+down_revision = '7c2e9a4b1d56'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'lenderearnings',
+        sa.Column('lender_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('completed_count', sa.Integer(), nullable=False),
+        sa.Column('canceled_count', sa.Integer(), nullable=False),
+        sa.Column('earnings', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('lender_id', 'day'),
+    )
+    # Existing completed and canceled transactions, counted on the day of
+    # their last instant like crud.update_lender_earnings does
+    op.execute(
+        """
+        INSERT INTO lenderearnings (lender_id, day, completed_count, canceled_count, earnings)
+        SELECT lender_id,
+               (end_date - interval '1 microsecond')::date,
+               count(*) FILTER (WHERE status = 'completed'),
+               count(*) FILTER (WHERE status = 'canceled'),
+               coalesce(sum(total_price) FILTER (WHERE status = 'completed'), 0)
+        FROM "transaction"
+        WHERE status IN ('completed', 'canceled')
+        GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('lenderearnings')
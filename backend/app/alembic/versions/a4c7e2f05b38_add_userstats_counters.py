@@ -0,0 +1,51 @@
+"""Add userstats table with per-user row counters
+
+Revision ID: a4c7e2f05b38
+Revises: 5d8a0c3e9f17
+Create Date: 2026-10-16 12:40:17.902264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e2f05b38'
+down_revision = '5d8a0c3e9f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'userstats',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False),
+        sa.Column('listing_count', sa.Integer(), nullable=False),
+        sa.Column('transaction_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+    # Seed the counters from the current rows. From here on the write paths
+    # keep them up to date in the same transaction as the change.
+    op.execute(
+        """
+        INSERT INTO userstats (user_id, item_count, listing_count, transaction_count)
+        SELECT
+            u.id,
+            (SELECT count(*) FROM item WHERE item.owner_id = u.id),
+            (SELECT count(*) FROM listing WHERE listing.owner_id = u.id),
+            (
+                SELECT count(*) FROM "transaction" t
+                WHERE t.renter_id = u.id OR t.lender_id = u.id
+            )
+        FROM "user" u
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('userstats')
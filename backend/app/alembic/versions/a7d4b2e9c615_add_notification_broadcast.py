@@ -0,0 +1,41 @@
+"""Add notificationbroadcast table
+
+Revision ID: a7d4b2e9c615
+Revises: f1a6c3e8b204
+Create Date: 2026-10-17 03:05:41.733916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4b2e9c615'
+down_revision = 'f1a6c3e8b204'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'notificationbroadcast',
+        sa.Column('title', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('message', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('category', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('audience', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('created_by', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('status', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('sent', sa.Integer(), nullable=False),
+        sa.Column('last_user_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    op.drop_table('notificationbroadcast')
@@ -0,0 +1,87 @@
+"""Partition message and notification by month
+
+Revision ID: b5d0e7f2c913
+Revises: 9a41c7e3f5b8
+Create Date: 2026-10-16 23:48:05.221094
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d0e7f2c913'
+down_revision = '9a41c7e3f5b8'
+branch_labels = None
+depends_on = None
+
+# Table, partition key and the indexes to rebuild on it, besides the primary
+# key. Must match app.models and app.partitions.
+TABLES = [
+    ('message', 'timestamp', []),
+    (
+        'notification',
+        'timestamp',
+        ['CREATE INDEX ix_notification_user_id_timestamp_id ON notification (user_id, "timestamp", id)'],
+    ),
+]
+
+# Partitions created ahead of the current month, like the default
+# PARTITION_PREMAKE_MONTHS; app/partitions.py keeps this up from here on
+PREMAKE_MONTHS = 3
+
+
+def upgrade():
+    # Postgres can't turn a table into a partitioned one in place: the rows
+    # are copied into a new partitioned table with one partition per month
+    # from the oldest row on
+    for table, column, indexes in TABLES:
+        op.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_unpartitioned"')
+        op.execute(
+            f'CREATE TABLE "{table}" (LIKE "{table}_unpartitioned" INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE ("{column}")'
+        )
+        op.execute(
+            f"""
+            DO $$
+            DECLARE
+                now_utc timestamp := now() AT TIME ZONE 'utc';
+                month date;
+            BEGIN
+                FOR month IN
+                    SELECT generate_series(
+                        date_trunc('month', least(min("{column}"), now_utc)),
+                        date_trunc('month', greatest(max("{column}"), now_utc + interval '{PREMAKE_MONTHS} months')),
+                        interval '1 month'
+                    )::date
+                    FROM "{table}_unpartitioned"
+                LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                        '{table}_' || to_char(month, '"y"YYYY"m"MM'),
+                        '{table}',
+                        month,
+                        (month + interval '1 month')::date
+                    );
+                END LOOP;
+            END $$
+            """
+        )
+        op.execute(f'INSERT INTO "{table}" SELECT * FROM "{table}_unpartitioned"')
+        op.execute(f'DROP TABLE "{table}_unpartitioned"')
+        op.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id, "{column}")')
+        for index in indexes:
+            op.execute(index)
+
+
+def downgrade():
+    for table, column, indexes in TABLES:
+        op.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_partitioned"')
+        op.execute(
+            f'CREATE TABLE "{table}" (LIKE "{table}_partitioned" INCLUDING DEFAULTS)'
+        )
+        op.execute(f'INSERT INTO "{table}" SELECT * FROM "{table}_partitioned"')
+        # Drops the partitions too
+        op.execute(f'DROP TABLE "{table}_partitioned"')
+        op.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id)')
+        for index in indexes:
+            op.execute(index)
@@ -0,0 +1,32 @@
+"""Add notificationdigest table
+
+Revision ID: c3e8f1a5d726
+Revises: a7d4b2e9c615
+Create Date: 2026-10-17 05:12:09.418327
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8f1a5d726'
+down_revision = 'a7d4b2e9c615'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'notificationdigest',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_until', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('notificationdigest')
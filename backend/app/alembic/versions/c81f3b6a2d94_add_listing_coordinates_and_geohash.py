@@ -0,0 +1,42 @@
+"""Add coordinates and geohash index to listing
+
+Revision ID: c81f3b6a2d94
+Revises: a4c7e2f05b38
+Create Date: 2026-10-16 14:02:55.671390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f3b6a2d94'
+down_revision = 'a4c7e2f05b38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing listings only have a free-text location, so there is nothing to
+    # backfill: the geohash is filled in when a listing gets coordinates.
+    op.add_column('listing', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('listing', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('listing', sa.Column('geohash', sqlmodel.sql.sqltypes.AutoString(length=12), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_listing_geohash',
+            'listing',
+            ['geohash'],
+            unique=False,
+            postgresql_ops={'geohash': 'varchar_pattern_ops'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index('ix_listing_geohash', table_name='listing')
+    op.drop_column('listing', 'geohash')
+    op.drop_column('listing', 'longitude')
+    op.drop_column('listing', 'latitude')
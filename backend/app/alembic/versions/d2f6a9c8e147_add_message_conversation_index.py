@@ -0,0 +1,44 @@
+"""Add conversation index to message
+
+Revision ID: d2f6a9c8e147
+Revises: b5d0e7f2c913
+Create Date: 2026-10-17 00:21:37.904118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f6a9c8e147'
+down_revision = 'b5d0e7f2c913'
+branch_labels = None
+depends_on = None
+
+INDEX = 'ix_message_conversation_timestamp_id'
+COLUMNS = 'LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id), "timestamp", id'
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY doesn't work on a partitioned table: create
+    # the index on the parent only, build it on each partition without
+    # blocking writes and attach those, after which it is valid. Partitions
+    # created later get it on creation.
+    op.execute(f'CREATE INDEX {INDEX} ON ONLY message ({COLUMNS})')
+    partitions = op.get_bind().execute(
+        sa.text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'message'::regclass"
+        )
+    ).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition}_conversation_idx" '
+                f'ON "{partition}" ({COLUMNS})'
+            )
+            op.execute(f'ALTER INDEX {INDEX} ATTACH PARTITION "{partition}_conversation_idx"')
+
+
+def downgrade():
+    op.drop_index(INDEX, table_name='message')
@@ -0,0 +1,32 @@
+"""Add partial index for overlapping active bookings
+
+Revision ID: e5b9d3a17c42
+Revises: c81f3b6a2d94
+Create Date: 2026-10-16 22:14:08.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9d3a17c42'
+down_revision = 'c81f3b6a2d94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transaction_listing_id_end_date_active',
+            'transaction',
+            ['listing_id', 'end_date'],
+            unique=False,
+            postgresql_where=sa.text("status IN ('pending', 'approved')"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index('ix_transaction_listing_id_end_date_active', table_name='transaction')
@@ -0,0 +1,61 @@
+"""Add conversation inbox table
+
+Revision ID: e8c3b1d7a520
+Revises: d2f6a9c8e147
+Create Date: 2026-10-17 00:52:18.310552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c3b1d7a520'
+down_revision = 'd2f6a9c8e147'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'conversation',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('other_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('last_message_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('last_sender_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('last_message', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('unread_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'other_id'),
+    )
+    # Existing conversations, from both sides, with nothing unread since
+    # read state wasn't tracked
+    op.execute(
+        """
+        INSERT INTO conversation
+        SELECT DISTINCT ON (user_id, other_id)
+            user_id, other_id, id, sender_id, left(content, 255), "timestamp", 0
+        FROM (
+            SELECT sender_id AS user_id, receiver_id AS other_id, id, sender_id, content, "timestamp"
+            FROM message
+            UNION ALL
+            SELECT receiver_id, sender_id, id, sender_id, content, "timestamp"
+            FROM message
+            WHERE receiver_id <> sender_id
+        ) AS sides
+        ORDER BY user_id, other_id, "timestamp" DESC, id DESC
+        """
+    )
+    op.create_index(
+        'ix_conversation_user_id_last_timestamp_other_id',
+        'conversation',
+        ['user_id', 'last_timestamp', 'other_id'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_conversation_user_id_last_timestamp_other_id', table_name='conversation')
+    op.drop_table('conversation')
@@ -0,0 +1,43 @@
+"""Add userstats.unread_notification_count
+
+Revision ID: f1a6c3e8b204
+Revises: e8c3b1d7a520
+Create Date: 2026-10-17 02:14:36.508127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a6c3e8b204'
+down_revision = 'e8c3b1d7a520'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'userstats',
+        sa.Column('unread_notification_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # Seed the counter from the current rows, creating the stats of users
+    # that have none yet
+    op.execute(
+        """
+        INSERT INTO userstats (
+            user_id, item_count, listing_count, transaction_count,
+            unread_notification_count
+        )
+        SELECT n.user_id, 0, 0, 0, count(*)
+        FROM notification n JOIN "user" u ON u.id = n.user_id
+        WHERE NOT n.is_read
+        GROUP BY n.user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET unread_notification_count = excluded.unread_notification_count
+        """
+    )
+
+
+def downgrade():
+    op.drop_column('userstats', 'unread_notification_count')
@@ -0,0 +1,66 @@
+"""Add listingcalendar day bitmaps for availability search
+
+Revision ID: f3a8c61e0d27
+Revises: e5b9d3a17c42
+Create Date: 2026-10-16 23:02:41.527716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8c61e0d27'
+down_revision = 'e5b9d3a17c42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'listingcalendar',
+        sa.Column('listing_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('booked', postgresql.BIT(366), nullable=False),
+        sa.ForeignKeyConstraint(['listing_id'], ['listing.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('listing_id', 'year'),
+    )
+
+    # Seed the bitmaps from the current active bookings. From here on the
+    # transaction write paths rebuild them in the same transaction.
+    op.execute(
+        """
+        INSERT INTO listingcalendar (listing_id, year, booked)
+        SELECT
+            listing_id,
+            year,
+            (
+                SELECT string_agg(CASE WHEN n = ANY(days) THEN '1' ELSE '0' END, '' ORDER BY n)
+                FROM generate_series(0, 365) AS n
+            )::bit(366)
+        FROM (
+            SELECT
+                listing_id,
+                extract(year FROM day)::int AS year,
+                array_agg(extract(doy FROM day)::int - 1) AS days
+            FROM (
+                SELECT DISTINCT
+                    t.listing_id,
+                    generate_series(
+                        t.start_date::date,
+                        (t.end_date - interval '1 microsecond')::date,
+                        interval '1 day'
+                    )::date AS day
+                FROM "transaction" t
+                JOIN listing ON listing.id = t.listing_id
+                WHERE t.status IN ('pending', 'approved') AND t.end_date > t.start_date
+            ) AS booked_days
+            GROUP BY listing_id, year
+        ) AS per_year
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('listingcalendar')
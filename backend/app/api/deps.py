@@ -1,3 +1,4 @@
+import uuid
 from collections.abc import Generator
 from typing import Annotated
 
@@ -28,6 +29,10 @@ TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
 def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    return get_token_user(session, token)
+
+
+def get_token_user(session: Session, token: str) -> User:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -49,6 +54,19 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
+def get_stream_user_id(token: str) -> uuid.UUID | None:
+    """
+    The id of the user `token` authenticates, or None, for WebSockets and
+    event streams. The session is closed before returning: a stream can
+    stay open for hours and mustn't hold a pooled connection meanwhile.
+    """
+    with Session(engine) as session:
+        try:
+            return get_token_user(session, token).id
+        except HTTPException:
+            return None
+
+
 def get_current_active_superuser(current_user: CurrentUser) -> User:
     if not current_user.is_superuser:
         raise HTTPException(
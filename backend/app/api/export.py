@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+from collections.abc import Iterator, Sequence
+from typing import Any, Literal
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import CompoundSelect, Select
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+
+ExportFormat = Literal["csv", "ndjson"]
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, list | dict):
+        return json.dumps(value)
+    return value
+
+
+def _iter_export(
+    statement: Select[Any] | CompoundSelect, columns: Sequence[str], format: ExportFormat
+) -> Iterator[str]:
+    # The request's session is already closed once the body streams, so the
+    # export runs on its own. yield_per makes psycopg use a server-side
+    # cursor: rows are fetched EXPORT_BATCH_SIZE at a time and each batch is
+    # written out before the next one is read.
+    with Session(engine) as session:
+        result = session.execute(
+            statement.execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for batch in result.partitions():
+                writer.writerows([_csv_value(value) for value in row] for row in batch)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for batch in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(columns, row, strict=True)), default=str) + "\n"
+                    for row in batch
+                )
+
+
+def stream_export(
+    statement: Select[Any] | CompoundSelect, format: ExportFormat, filename: str
+) -> StreamingResponse:
+    """
+    Stream every row of `statement` (a select, or union of selects, of plain
+    columns) as CSV, with a header row, or as NDJSON. Memory use is bounded by one batch.
+    """
+    columns = [column.key for column in statement.selected_columns]
+    return StreamingResponse(
+        _iter_export(statement, columns, format),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{format}"'
+        },
+    )
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import json
+import uuid
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any
+
+from fastapi import HTTPException
+from sqlalchemy import and_, literal, tuple_, union_all
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, SQLModel, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column: Any, value: Any) -> Any:
+    python_type = column.type.python_type
+    if python_type in (uuid.UUID, datetime) and not isinstance(value, str):
+        # uuid.UUID() would raise AttributeError
+        raise TypeError(value)
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> list[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [
+            _decode_value(column, value)
+            for column, value in zip(columns, values, strict=True)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _after_cursor(order_by: Sequence[Any], cursor: str, descending: bool) -> Any:
+    bounds = [
+        literal(value, column.type)
+        for column, value in zip(order_by, decode_cursor(cursor, order_by), strict=True)
+    ]
+    key = tuple_(*order_by)
+    values = tuple_(*bounds)
+    # Implied by the row comparison, but unlike it usable by the planner to
+    # skip partitions of tables partitioned on the first column
+    first = order_by[0] <= bounds[0] if descending else order_by[0] >= bounds[0]
+    return and_(first, key < values if descending else key > values)
+
+
+def _ordered(order_by: Sequence[Any], descending: bool) -> list[Any]:
+    return [column.desc() if descending else column for column in order_by]
+
+
+def _next_cursor(rows: list[Any], order_by: Sequence[Any], limit: int) -> str | None:
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        return encode_cursor([getattr(last, column.key) for column in order_by])
+    return None
+
+
+def paginate(
+    session: Session,
+    statement: SelectOfScalar[Any],
+    *,
+    order_by: Sequence[Any],
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    descending: bool = False,
+) -> tuple[list[Any], str | None]:
+    """
+    Run a page of `statement` ordered by the unique key `order_by`.
+
+    With a `cursor`, the page starts right after the row the cursor was built
+    from (keyset pagination) and `skip` is ignored; otherwise `skip` is used
+    as an offset. The returned cursor points at the last row of a full page
+    and is None once the end is reached.
+    """
+    if cursor is not None:
+        statement = statement.where(_after_cursor(order_by, cursor, descending))
+    else:
+        statement = statement.offset(skip)
+    statement = statement.order_by(*_ordered(order_by, descending)).limit(limit)
+    rows = list(session.exec(statement).all())
+    return rows, _next_cursor(rows, order_by, limit)
+
+
+def paginate_union(
+    session: Session,
+    model: type[SQLModel],
+    statements: Sequence[SelectOfScalar[Any]],
+    *,
+    order_by: Sequence[Any],
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    descending: bool = False,
+) -> tuple[list[Any], str | None]:
+    """
+    Like paginate, over the UNION ALL of `statements`, which select `model`
+    and must not overlap.
+
+    Each branch gets its own keyset condition, ordering and limit, so each
+    can be served by its own index scan (an OR of the branches' filters
+    usually can't), and Postgres merges the pre-sorted branches.
+    """
+    branches = []
+    for statement in statements:
+        if cursor is not None:
+            statement = statement.where(_after_cursor(order_by, cursor, descending))
+        branches.append(
+            statement.order_by(*_ordered(order_by, descending)).limit(
+                limit if cursor is not None else skip + limit
+            )
+        )
+    union = union_all(*branches).subquery()
+    entity = aliased(model, union)
+    outer_order_by = [getattr(entity, column.key) for column in order_by]
+    statement = select(entity).order_by(*_ordered(outer_order_by, descending))
+    if cursor is None:
+        statement = statement.offset(skip)
+    rows = list(session.exec(statement.limit(limit)).all())
+    return rows, _next_cursor(rows, order_by, limit)
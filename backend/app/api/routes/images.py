@@ -0,0 +1,110 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from app import images
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.models import ImagePublic
+
+router = APIRouter()
+
+# Stored files never change, their names are derived from their content
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _image_public(
+    request: Request, digest: str, extension: str, duplicate: bool
+) -> ImagePublic:
+    def url(name: str) -> str:
+        return str(request.url_for("read_image", digest=digest, name=name))
+
+    return ImagePublic(
+        digest=digest,
+        url=url(images.original_name(extension)),
+        variants={
+            name.removesuffix(".webp"): url(name) for name in images.variant_names()
+        },
+        duplicate=duplicate,
+    )
+
+
+@router.post("/", response_model=ImagePublic, dependencies=[Depends(get_current_user)])
+async def upload_image(request: Request, file: UploadFile) -> Any:
+    """
+    Upload a JPEG, PNG, GIF or WebP image.
+
+    Files are stored once per SHA-256 of their content: uploading the same
+    bytes again returns the existing image with `duplicate` set. A full-size
+    WebP and WebP thumbnails (IMAGE_THUMBNAIL_SIZES, longest side) are
+    rendered in a process pool before the response is sent.
+    """
+    try:
+        spooled, digest, extension = await run_in_threadpool(
+            images.spool_upload, file.file
+        )
+    except images.ImageTooLarge:
+        raise HTTPException(status_code=413, detail="Image too large")
+    except images.UnsupportedImage:
+        raise HTTPException(status_code=415, detail="Unsupported image format")
+
+    # Filesystem calls can block too, so none of them run on the event loop
+    if await run_in_threadpool(images.find_original, digest) is not None:
+        await run_in_threadpool(images.discard, spooled)
+        return _image_public(request, digest, extension, duplicate=True)
+
+    target_dir = images.image_dir(digest)
+    await run_in_threadpool(target_dir.mkdir, parents=True, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    pool = images.get_image_pool()
+    try:
+        await loop.run_in_executor(
+            pool,
+            images.render_variants,
+            str(spooled),
+            str(target_dir),
+            settings.IMAGE_THUMBNAIL_SIZES,
+        )
+    except BaseException as e:
+        # Shielded, so the cleanup also runs when the request is cancelled
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(images.discard, spooled, digest)
+        if isinstance(e, images.UnsupportedImage):
+            raise HTTPException(status_code=415, detail="Unsupported image format")
+        if isinstance(e, BrokenProcessPool):
+            images.reset_image_pool(pool)
+            raise HTTPException(status_code=503, detail="Image processing failed")
+        raise
+    await run_in_threadpool(images.publish, spooled, digest, extension)
+    return _image_public(request, digest, extension, duplicate=False)
+
+
+@router.get("/{digest}/{name}", name="read_image")
+def read_image(digest: str, name: str, request: Request) -> Response:
+    """
+    Serve a stored original or one of its WebP variants.
+
+    Responses carry a strong ETag and may be cached for a year.
+    """
+    if not images.DIGEST.match(digest) or not images.VARIANT_NAME.match(name):
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = images.image_dir(digest) / name
+    # Variants are rendered before the original is published
+    if images.find_original(digest) is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{digest}-{name}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if (
+        etag in [tag.strip() for tag in if_none_match.split(",")]
+        or if_none_match == "*"
+    ):
+        return Response(status_code=304, headers=headers)
+    extension = name.rsplit(".", 1)[1]
+    return FileResponse(path, media_type=images.MEDIA_TYPES[extension], headers=headers)
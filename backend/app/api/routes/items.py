@@ -4,7 +4,9 @@ from typing import Any
 from fastapi import APIRouter, HTTPException
 from sqlmodel import func, select
 
+from app import crud
 from app.api.deps import CurrentUser, SessionDep
+from app.api.pagination import paginate
 from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
 
 router = APIRouter()
@@ -12,33 +14,52 @@ router = APIRouter()
 
 @router.get("/", response_model=ItemsPublic)
 def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: SessionDep,
+    current_user: CurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    exact_count: bool = False,
 ) -> Any:
     """
     Retrieve items.
+
+    Pass the returned `next_cursor` back as `cursor` to fetch the next page
+    without an OFFSET scan.
+
+    `count` comes from the owner's stored counter, or from the planner's
+    estimate for superusers; set `exact_count` to run a COUNT(*) instead.
     """
 
     if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
+        if exact_count:
+            count_statement = select(func.count()).select_from(Item)
+            count = session.exec(count_statement).one()
+        else:
+            count = crud.estimate_row_count(session=session, model=Item)
+        statement = select(Item)
     else:
-        count_statement = (
-            select(func.count())
-            .select_from(Item)
-            .where(Item.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Item)
-            .where(Item.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        items = session.exec(statement).all()
-
-    return ItemsPublic(data=items, count=count)
+        if exact_count:
+            count_statement = (
+                select(func.count())
+                .select_from(Item)
+                .where(Item.owner_id == current_user.id)
+            )
+            count = session.exec(count_statement).one()
+        else:
+            stats = crud.get_user_stats(session=session, user_id=current_user.id)
+            count = stats.item_count
+        statement = select(Item).where(Item.owner_id == current_user.id)
+    items, next_cursor = paginate(
+        session,
+        statement,
+        order_by=[Item.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+    )
+
+    return ItemsPublic(data=items, count=count, next_cursor=next_cursor)
 
 
 @router.get("/{id}", response_model=ItemPublic)
@@ -63,6 +84,7 @@ def create_item(
     """
     item = Item.model_validate(item_in, update={"owner_id": current_user.id})
     session.add(item)
+    crud.update_user_stats(session=session, user_id=current_user.id, item_count=1)
     session.commit()
     session.refresh(item)
     return item
@@ -105,5 +127,6 @@ def delete_item(
     if not current_user.is_superuser and (item.owner_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
     session.delete(item)
+    crud.update_user_stats(session=session, user_id=item.owner_id, item_count=-1)
     session.commit()
     return Message(message="Item deleted successfully")
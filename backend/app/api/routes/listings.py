@@ -1,41 +1,68 @@
+import codecs
+import csv
+import json
 import uuid
-from typing import Any, List
-from fastapi import APIRouter, HTTPException
+from collections.abc import Iterator
+from typing import Any, List, Literal, Union
+from fastapi import APIRouter, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
 from sqlmodel import func, select
+from app import crud
 from app.api.deps import CurrentUser, SessionDep
-from app.models import Listing, ListingCreate, ListingPublic, ListingsPublic, ListingUpdate, Message, ListingSearch
+from app.api.export import ExportFormat, stream_export
+from app.api.pagination import paginate
+from app.models import User, Listing, ListingCreate, ListingPublic, ListingsPublic, ListingUpdate, Message, ListingSearch, ListingSearchResults, ListingImportReport, ListingSuggestion
 
 router = APIRouter()
 
 @router.get("/", response_model=ListingsPublic)
 def read_listings(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: SessionDep,
+    current_user: CurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    exact_count: bool = False,
 ) -> Any:
     """
     Retrieve listings.
+
+    Pass the returned `next_cursor` back as `cursor` to fetch the next page
+    without an OFFSET scan.
+
+    `count` comes from the owner's stored counter, or from the planner's
+    estimate for superusers; set `exact_count` to run a COUNT(*) instead.
     """
 
     if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Listing)
-        count = session.exec(count_statement).one()
-        statement = select(Listing).offset(skip).limit(limit)
-        listings = session.exec(statement).all()
+        if exact_count:
+            count_statement = select(func.count()).select_from(Listing)
+            count = session.exec(count_statement).one()
+        else:
+            count = crud.estimate_row_count(session=session, model=Listing)
+        statement = select(Listing)
     else:
-        count_statement = (
-            select(func.count())
-            .select_from(Listing)
-            .where(Listing.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Listing)
-            .where(Listing.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        listings = session.exec(statement).all()
-
-    return ListingsPublic(data=listings, count=count)
+        if exact_count:
+            count_statement = (
+                select(func.count())
+                .select_from(Listing)
+                .where(Listing.owner_id == current_user.id)
+            )
+            count = session.exec(count_statement).one()
+        else:
+            stats = crud.get_user_stats(session=session, user_id=current_user.id)
+            count = stats.listing_count
+        statement = select(Listing).where(Listing.owner_id == current_user.id)
+    listings, next_cursor = paginate(
+        session,
+        statement,
+        order_by=[Listing.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+    )
+
+    return ListingsPublic(data=listings, count=count, next_cursor=next_cursor)
 
 @router.post("/", response_model=ListingPublic)
 def create_listing(
@@ -48,10 +75,121 @@ def create_listing(
     """
     new_listing = Listing.model_validate(listing, update={"owner_id": current_user.id})
     session.add(new_listing)
+    crud.update_user_stats(session=session, user_id=current_user.id, listing_count=1)
     session.commit()
+    crud.invalidate_listing_caches()
+    crud.update_listing_autocomplete(added=[listing])
     session.refresh(new_listing)
     return new_listing
 
+# The upload is decoded line by line rather than wrapped in a TextIOWrapper,
+# which needs readable() and friends that SpooledTemporaryFile only has from
+# Python 3.11 on
+def _csv_rows(file: UploadFile) -> Iterator[dict[str, Any]]:
+    lines = codecs.iterdecode(file.file, "utf-8-sig")
+    for row in csv.DictReader(lines):
+        # Empty cells mean "not set", and images may be a JSON array or
+        # whitespace-separated URLs
+        values: dict[str, Any] = {key: value or None for key, value in row.items()}
+        images = values.get("images")
+        if images is not None:
+            try:
+                values["images"] = json.loads(images) if images.startswith("[") else images.split()
+            except json.JSONDecodeError:
+                pass  # left as a string, so validation reports the row
+        yield values
+
+
+def _ndjson_rows(file: UploadFile) -> Iterator[Any]:
+    for line in codecs.iterdecode(file.file, "utf-8"):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Let ListingCreate validation reject it with the row number
+            yield line
+
+
+@router.post("/import", response_model=ListingImportReport)
+def import_listings(
+    file: UploadFile,
+    session: SessionDep,
+    current_user: CurrentUser,
+    format: Literal["csv", "ndjson"] | None = None,
+    owner_id: uuid.UUID | None = None,
+) -> Any:
+    """
+    Bulk-create listings from an uploaded CSV (with a header row) or NDJSON
+    file, one listing per row.
+
+    The upload is read row by row and loaded in chunks with COPY. Rows that
+    fail validation are skipped and listed in the report. `format` defaults
+    to the file extension. Only superusers may import on behalf of another
+    `owner_id`.
+    """
+    if owner_id is not None and owner_id != current_user.id:
+        if not current_user.is_superuser:
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+        if session.get(User, owner_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+    if format is None:
+        filename = (file.filename or "").lower()
+        if filename.endswith(".csv"):
+            format = "csv"
+        elif filename.endswith((".ndjson", ".jsonl")):
+            format = "ndjson"
+        else:
+            raise HTTPException(
+                status_code=400, detail="Could not detect the file format"
+            )
+    rows = _csv_rows(file) if format == "csv" else _ndjson_rows(file)
+    try:
+        return crud.import_listings(session, rows, owner_id or current_user.id)
+    except (UnicodeDecodeError, csv.Error):
+        raise HTTPException(status_code=400, detail="Malformed import file")
+
+@router.post("/export")
+def export_listings(
+    current_user: CurrentUser,
+    search_query: ListingSearch,
+    format: ExportFormat = "csv",
+) -> StreamingResponse:
+    """
+    Stream every listing of the current user matching the search filters as
+    CSV or NDJSON, or every matching listing for superusers.
+
+    Paging, ordering by relevance/distance and facets don't apply: rows are
+    written in id order straight from a server-side cursor.
+    """
+    statement = select(
+        *(getattr(Listing, field) for field in ListingPublic.model_fields)
+    ).where(*crud.listing_search_conditions(search_query))
+    if not current_user.is_superuser:
+        statement = statement.where(Listing.owner_id == current_user.id)
+    statement = statement.order_by(Listing.id)
+    return stream_export(statement, format, "listings")
+
+@router.get("/autocomplete", response_model=List[ListingSuggestion])
+def autocomplete_listings(
+    session: SessionDep,
+    q: str = Query(min_length=1, max_length=255),
+    limit: int = Query(default=10, ge=1, le=20),
+) -> Any:
+    """
+    Suggest listing titles and categories starting with `q`, most common
+    first.
+
+    Answered from an in-memory prefix index in each worker, which is kept
+    current on listing writes and rebuilt from the database every
+    LISTING_AUTOCOMPLETE_REFRESH_SECONDS.
+    """
+    index = crud.get_listing_autocomplete_index(session)
+    return [
+        ListingSuggestion(text=text, count=count)
+        for text, count in index.search(q, limit)
+    ]
+
 @router.get("/{listing_id}", response_model=ListingPublic)
 def read_listing(
     listing_id: uuid.UUID,
@@ -61,7 +199,7 @@ def read_listing(
     """
     Get a listing by ID.
     """
-    db_listing = session.get(Listing, listing_id)
+    db_listing = crud.get_listing_cached(session, listing_id)
     if db_listing is None:
         raise HTTPException(status_code=404, detail="Listing not found")
     if not current_user.is_superuser and db_listing.owner_id != current_user.id:
@@ -83,11 +221,14 @@ def update_listing(
         raise HTTPException(status_code=404, detail="Listing not found")
     if not current_user.is_superuser and db_listing.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
+    previous = ListingPublic.model_validate(db_listing)
     updated = listing.model_dump(exclude_unset=True)
     db_listing.sqlmodel_update(updated)
     session.add(db_listing)
     session.commit()
+    crud.invalidate_listing_caches(listing_id)
     session.refresh(db_listing)
+    crud.update_listing_autocomplete(added=[db_listing], removed=[previous])
     return db_listing    
 
 @router.delete("/{listing_id}", response_model=ListingPublic)
@@ -104,31 +245,43 @@ def delete_listing(
         raise HTTPException(status_code=404, detail="Listing not found")
     if not current_user.is_superuser and db_listing.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
+    previous = ListingPublic.model_validate(db_listing)
     session.delete(db_listing)
+    crud.update_user_stats(
+        session=session, user_id=db_listing.owner_id, listing_count=-1
+    )
     session.commit()
+    crud.invalidate_listing_caches(listing_id)
+    crud.update_listing_autocomplete(removed=[previous])
     return Message(message="Listing deleted successfully")
 
-@router.post("/search", response_model=List[ListingPublic])
+@router.post(
+    "/search", response_model=Union[List[ListingPublic], ListingSearchResults]
+)
 def search_listings(
     search_query: ListingSearch,
     db: SessionDep = SessionDep
-) -> List[ListingPublic]:
-    query = select(Listing)
-
-    if search_query.title:
-        query = query.where(Listing.title.contains(search_query.title))
-    if search_query.category:
-        query = query.where(Listing.category == search_query.category)
-    if search_query.location:
-        query = query.where(Listing.location == search_query.location)
-    if search_query.min_price is not None:
-        query = query.where(Listing.price >= search_query.min_price)
-    if search_query.max_price is not None:
-        query = query.where(Listing.price <= search_query.max_price)
-
-    listings = db.exec(query).all()
+) -> Any:
+    """
+    Search listings.
+
+    With `q` set, listings are matched against the full-text index over title,
+    category and description and ordered by relevance. Results are paged with
+    `skip`/`limit`.
+
+    With `facets` set, the page is returned together with category, location
+    and price-bucket counts over all matching listings.
+
+    Pages are cached per worker until the next listing write.
+    """
+    # Once for both caches, so equivalent searches share their entries
+    search = crud.normalize_listing_search(search_query)
+    listings = crud.search_listings_cached(db, search)
 
     if not listings:
         raise HTTPException(status_code=404, detail="No listings found")
 
-    return listings
\ No newline at end of file
+    if search.facets:
+        facets = crud.get_listing_facets(db, search)
+        return ListingSearchResults(data=listings, facets=facets)
+    return listings
@@ -1,11 +1,25 @@
+import asyncio
 import uuid
 from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Query,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    WebSocketException,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import MessagePublic, MessageCreate, Message
+from app import crud, realtime
+from app.api.deps import CurrentUser, SessionDep, get_stream_user_id
+from app.api.pagination import NEXT_CURSOR_HEADER, paginate
+from app.models import Conversation, ConversationPublic, MessagePublic, MessageCreate, Message
+from app.partitions import TIMESTAMP_OUT_OF_RANGE, MissingPartition
 
 router = APIRouter()
 
@@ -15,23 +29,141 @@ def send_message(
     current_user: CurrentUser,
     db: SessionDep,
 ) -> MessagePublic:
-    db_message = Message.model_validate(message, update={"sender_id": current_user.id})
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    try:
+        db_message = crud.create_message(db, message, current_user.id)
+    except MissingPartition:
+        raise HTTPException(status_code=422, detail=TIMESTAMP_OUT_OF_RANGE)
+    realtime.publish_message(db_message)
     return db_message
 
+@router.get("/inbox", response_model=List[ConversationPublic])
+def get_inbox(
+    current_user: CurrentUser,
+    db: SessionDep,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(default=50, ge=1, le=100),
+    cursor: str | None = None,
+) -> List[ConversationPublic]:
+    """
+    The current user's conversations, most recently active first, with
+    their last message and unread count. The cursor for the next page is
+    returned in the X-Next-Cursor header.
+    """
+    query = select(Conversation).where(Conversation.user_id == current_user.id)
+    conversations, next_cursor = paginate(
+        db,
+        query,
+        order_by=[Conversation.last_timestamp, Conversation.other_id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return conversations
+
+@router.post("/conversation/{user_id}/read", response_model=ConversationPublic)
+def mark_conversation_as_read(
+    user_id: uuid.UUID,
+    current_user: CurrentUser,
+    db: SessionDep,
+) -> ConversationPublic:
+    """
+    Reset the current user's unread count of the conversation with
+    `user_id`.
+    """
+    conversation = db.get(Conversation, (current_user.id, user_id))
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    conversation.unread_count = 0
+    db.add(conversation)
+    db.commit()
+    db.refresh(conversation)
+    return conversation
+
 @router.get("/conversation/{user_id}", response_model=List[MessagePublic])
 def get_conversation(
     user_id: uuid.UUID,
     current_user: CurrentUser,
-    db: SessionDep 
+    db: SessionDep,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(default=50, ge=1, le=100),
+    cursor: str | None = None,
 ) -> List[MessagePublic]:
-    query = select(Message).where(
-        (Message.sender_id == current_user.id) & (Message.receiver_id == user_id) |
-        (Message.sender_id == user_id) & (Message.receiver_id == current_user.id)
+    """
+    Messages between the current user and `user_id`, newest first. The
+    cursor for the next (older) page is returned in the X-Next-Cursor
+    header.
+    """
+    query = select(Message).where(*crud.conversation_conditions(current_user.id, user_id))
+    messages, next_cursor = paginate(
+        db,
+        query,
+        order_by=[Message.timestamp, Message.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
     )
-    messages = db.exec(query).all()
-    if not messages:
+    if not messages and cursor is None and skip == 0:
         raise HTTPException(status_code=404, detail="No messages found")
-    return messages
\ No newline at end of file
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return messages
+
+
+async def _send_events(websocket: WebSocket, subscription: realtime.Subscription) -> None:
+    while (payload := await subscription.get()) is not None:
+        await websocket.send_text(payload)
+
+
+async def _receive_until_closed(websocket: WebSocket) -> None:
+    # Clients aren't expected to send anything, this notices them leaving
+    while True:
+        await websocket.receive_text()
+
+
+@router.websocket("/ws")
+async def message_stream(websocket: WebSocket, token: str) -> None:
+    """
+    Push the messages sent to or by the current user as they are sent, as
+    JSON events {"type": "message", "message": {...}}.
+
+    Browsers can't set headers on a WebSocket, so the access token is passed
+    in the `token` query parameter. A client that falls REALTIME_QUEUE_SIZE
+    events behind is disconnected with code 1013 and should reconnect and
+    catch up from /messages/conversation/{user_id}.
+    """
+    user_id = await run_in_threadpool(get_stream_user_id, token)
+    if user_id is None:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    await websocket.accept()
+    subscription = await realtime.hub.subscribe(realtime.message_topic(user_id))
+    tasks = [
+        asyncio.create_task(_send_events(websocket, subscription)),
+        asyncio.create_task(_receive_until_closed(websocket)),
+        asyncio.create_task(subscription.overflowed.wait()),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        realtime.hub.unsubscribe(subscription)
+        for task in tasks:
+            task.cancel()
+    if subscription.overflowed.is_set():
+        # The client may not be reading at all, don't wait on it for long
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=status.WS_1013_TRY_AGAIN_LATER), timeout=1
+            )
+        except (asyncio.TimeoutError, RuntimeError):
+            pass
+        return
+    for task in done:
+        try:
+            task.result()
+        except WebSocketDisconnect:
+            pass
@@ -1,11 +1,22 @@
+import asyncio
+import json
 import uuid
+from collections.abc import AsyncIterator
 from typing import List
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import  select
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlmodel import  Session, select
+from starlette.background import BackgroundTask
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Notification, NotificationCreate, NotificationPublic
+from app import broadcasts, crud, realtime
+from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser, get_stream_user_id
+from app.api.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, paginate
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Notification, NotificationBroadcast, NotificationBroadcastCreate, NotificationBroadcastPublic, NotificationCreate, NotificationPublic, NotificationSelection, NotificationsChanged, UnreadNotificationCount, User
+from app.partitions import TIMESTAMP_OUT_OF_RANGE, MissingPartition
 
 router = APIRouter()
 
@@ -14,23 +25,129 @@ def create_notification(
     notification: NotificationCreate,
     db: SessionDep,
 ) -> NotificationPublic:
-    db_notification = Notification.model_validate(notification)
-    db.add(db_notification)
-    db.commit()
-    db.refresh(db_notification)
+    if not db.get(User, notification.user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        db_notification = crud.create_notification(db, notification)
+    except MissingPartition:
+        raise HTTPException(status_code=422, detail=TIMESTAMP_OUT_OF_RANGE)
+    realtime.publish_notification(db_notification)
     return db_notification
 
 @router.get("/", response_model=List[NotificationPublic])
 def get_notifications(
     db: SessionDep,
     current_user: CurrentUser,
+    response: Response,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: str | None = None,
 ) -> List[NotificationPublic]:
-    query = select(Notification).where(Notification.user_id == current_user.id).offset(skip).limit(limit)
-    notifications = db.exec(query).all()
+    """
+    Newest notifications first. The cursor for the next page is returned in
+    the X-Next-Cursor header.
+    """
+    query = select(Notification).where(Notification.user_id == current_user.id)
+    notifications, next_cursor = paginate(
+        db,
+        query,
+        order_by=[Notification.timestamp, Notification.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return notifications
 
+@router.get("/unread-count", response_model=UnreadNotificationCount)
+def get_unread_notification_count(
+    db: SessionDep,
+    current_user: CurrentUser,
+    if_none_match: str | None = Header(default=None),
+) -> Response:
+    """
+    Number of the current user's unread notifications, from a counter
+    maintained with the notifications. Responses carry an ETag and are
+    private to the user; If-None-Match revalidates with a 304.
+    """
+    stats = crud.get_user_stats(session=db, user_id=current_user.id)
+    body = UnreadNotificationCount(count=stats.unread_notification_count)
+    etag = f'"{body.count}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match is not None and (
+        etag in [tag.strip() for tag in if_none_match.split(",")]
+        or if_none_match == "*"
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=body.model_dump_json(), media_type="application/json", headers=headers
+    )
+
+@router.post("/read", response_model=NotificationsChanged)
+def mark_notifications_as_read(
+    selection: NotificationSelection,
+    db: SessionDep,
+    current_user: CurrentUser,
+) -> NotificationsChanged:
+    """
+    Mark the current user's notifications with the given `ids`, created
+    before `before`, or both, as read. Returns how many were unread.
+    """
+    count = crud.mark_notifications_read(db, current_user.id, selection)
+    return NotificationsChanged(count=count)
+
+@router.post("/dismiss", response_model=NotificationsChanged)
+def dismiss_notifications(
+    selection: NotificationSelection,
+    db: SessionDep,
+    current_user: CurrentUser,
+) -> NotificationsChanged:
+    """
+    Delete the current user's notifications selected like for /read.
+    Returns how many were deleted.
+    """
+    count = crud.dismiss_notifications(db, current_user.id, selection)
+    return NotificationsChanged(count=count)
+
+@router.post(
+    "/broadcasts",
+    response_model=NotificationBroadcastPublic,
+    status_code=202,
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def create_broadcast(
+    broadcast_in: NotificationBroadcastCreate,
+    db: SessionDep,
+    current_user: CurrentUser,
+) -> NotificationBroadcast:
+    """
+    Send a notification to every user of an audience. The notifications are
+    inserted in the background, BROADCAST_CHUNK_SIZE users per transaction;
+    follow `sent` out of `total` at /notifications/broadcasts/{id}.
+    """
+    broadcast = NotificationBroadcast.model_validate(
+        broadcast_in, update={"created_by": current_user.id}
+    )
+    broadcast.total = broadcasts.count_audience(db, broadcast)
+    db.add(broadcast)
+    db.commit()
+    db.refresh(broadcast)
+    broadcasts.start_broadcast(broadcast.id)
+    return broadcast
+
+@router.get(
+    "/broadcasts/{broadcast_id}",
+    response_model=NotificationBroadcastPublic,
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def get_broadcast(broadcast_id: uuid.UUID, db: SessionDep) -> NotificationBroadcast:
+    broadcast = db.get(NotificationBroadcast, broadcast_id)
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return broadcast
+
 @router.patch("/{notification_id}", response_model=NotificationPublic)
 def mark_notification_as_read(
     notification_id: uuid.UUID,
@@ -42,8 +159,107 @@ def mark_notification_as_read(
         raise HTTPException(status_code=404, detail="Notification not found")
     if db_notification.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this notification")
-    db_notification.is_read = True
-    db.add(db_notification)
-    db.commit()
-    db.refresh(db_notification)
-    return db_notification
\ No newline at end of file
+    return crud.mark_notification_read(db, db_notification)
+
+
+def _missed_notifications(
+    user_id: uuid.UUID, last_event_id: str
+) -> list[Notification] | None:
+    # None when there are more than the stream replays
+    with Session(engine) as session:
+        notifications, _ = paginate(
+            session,
+            select(Notification).where(Notification.user_id == user_id),
+            order_by=[Notification.timestamp, Notification.id],
+            limit=settings.NOTIFICATION_STREAM_REPLAY_LIMIT + 1,
+            cursor=last_event_id,
+        )
+    if len(notifications) > settings.NOTIFICATION_STREAM_REPLAY_LIMIT:
+        return None
+    return notifications
+
+
+def _notification_event(notification: NotificationPublic, truncated: bool = False) -> str:
+    event_id = encode_cursor([notification.timestamp, notification.id])
+    data = notification.model_dump(mode="json")
+    if truncated:
+        data["truncated"] = True
+    return f"id: {event_id}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def _notification_events(
+    subscription: realtime.Subscription, missed: list[Notification] | None
+) -> AsyncIterator[str]:
+    replayed = set()
+    if missed is None:
+        yield "event: reset\ndata: {}\n\n"
+    else:
+        for notification in missed:
+            replayed.add(str(notification.id))
+            yield _notification_event(NotificationPublic.model_validate(notification))
+    while True:
+        try:
+            payload = await asyncio.wait_for(
+                subscription.get(), settings.NOTIFICATION_STREAM_HEARTBEAT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            # Keeps proxies from timing the stream out, and notices clients
+            # that went away without closing it
+            yield ": heartbeat\n\n"
+            continue
+        if payload is None:
+            # Fell behind: the client reconnects and resumes from its last
+            # event id
+            return
+        event = json.loads(payload)
+        notification = event["notification"]
+        if notification["id"] not in replayed:
+            yield _notification_event(
+                NotificationPublic.model_validate(notification),
+                event.get("truncated", False),
+            )
+
+
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_notifications(
+    token: str,
+    last_event_id: str | None = None,
+    last_event_id_header: str | None = Header(default=None, alias="Last-Event-ID"),
+) -> StreamingResponse:
+    """
+    Server-Sent Events stream of the current user's notifications as they
+    are created, for EventSource. Each event's data is a notification and
+    its id a cursor. A title or message too long for an event is cut, and
+    the data then has `"truncated": true`: the full notification is in
+    /notifications/.
+
+    EventSource can't set headers, so the access token is passed in the
+    `token` query parameter. On reconnecting it sends the id of the last
+    event it received in the Last-Event-ID header (or pass it as
+    `last_event_id`), and the notifications created since are sent first.
+    If more than NOTIFICATION_STREAM_REPLAY_LIMIT were missed, a `reset`
+    event is sent instead: reload from /notifications/.
+    """
+    last_event_id = last_event_id_header or last_event_id
+    if last_event_id is not None:
+        decode_cursor(last_event_id, [Notification.timestamp, Notification.id])
+    user_id = await run_in_threadpool(get_stream_user_id, token)
+    if user_id is None:
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+    # Subscribe before looking up missed notifications, so none created in
+    # between falls through the gap
+    subscription = await realtime.hub.subscribe(realtime.notification_topic(user_id))
+    try:
+        missed: list[Notification] | None = []
+        if last_event_id is not None:
+            missed = await run_in_threadpool(_missed_notifications, user_id, last_event_id)
+    except BaseException:
+        realtime.hub.unsubscribe(subscription)
+        raise
+    return StreamingResponse(
+        _notification_events(subscription, missed),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+        # Also runs when the client disconnects mid-stream
+        background=BackgroundTask(realtime.hub.unsubscribe, subscription),
+    )
@@ -1,10 +1,11 @@
 import uuid
 from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from sqlmodel import select
 
 from app.api.deps import CurrentUser, SessionDep
+from app.api.pagination import NEXT_CURSOR_HEADER, paginate
 from app.models import Report, ReportCreate, ReportUpdate, ReportPublic
 
 router = APIRouter()
@@ -26,13 +27,29 @@ def create_report(
 def get_reports(
     db: SessionDep,
     current_user: CurrentUser,
+    response: Response,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: str | None = None,
 ) -> List[ReportPublic]:
+    """
+    Newest reports first. The cursor for the next page is returned in the
+    X-Next-Cursor header.
+    """
     query = select(Report).where(
         (Report.reporter_id == current_user.id) | (Report.reported_user_id == current_user.id)
-    ).offset(skip).limit(limit)
-    reports = db.exec(query).all()
+    )
+    reports, next_cursor = paginate(
+        db,
+        query,
+        order_by=[Report.timestamp, Report.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return reports
 
 @router.patch("/{report_id}", response_model=ReportPublic)
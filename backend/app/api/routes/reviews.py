@@ -1,10 +1,11 @@
 import uuid
 from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from sqlmodel import select
 
 from app.api.deps import CurrentUser, SessionDep
+from app.api.pagination import NEXT_CURSOR_HEADER, paginate
 from app.models import ReviewPublic, ReviewCreate, Review
 
 router = APIRouter()
@@ -24,11 +25,29 @@ def create_review(
 @router.get("/listing/{listing_id}", response_model=List[ReviewPublic])
 def get_reviews_for_listing(
     listing_id: uuid.UUID,
-    db: SessionDep
+    db: SessionDep,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
 ) -> List[ReviewPublic]:
+    """
+    Newest reviews first. The cursor for the next page is returned in the
+    X-Next-Cursor header.
+    """
     query = select(Review).where(Review.listing_id == listing_id)
-    reviews = db.exec(query).all()
-    if not reviews:
+    reviews, next_cursor = paginate(
+        db,
+        query,
+        order_by=[Review.timestamp, Review.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if not reviews and cursor is None:
         raise HTTPException(status_code=404, detail="No reviews found for this listing")
     return reviews
 
@@ -36,9 +55,27 @@ def get_reviews_for_listing(
 def get_reviews_for_user(
     user_id: uuid.UUID,
     db: SessionDep,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
 ) -> List[ReviewPublic]:
+    """
+    Newest reviews first. The cursor for the next page is returned in the
+    X-Next-Cursor header.
+    """
     query = select(Review).where(Review.reviewee_id == user_id)
-    reviews = db.exec(query).all()
-    if not reviews:
+    reviews, next_cursor = paginate(
+        db,
+        query,
+        order_by=[Review.timestamp, Review.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if not reviews and cursor is None:
         raise HTTPException(status_code=404, detail="No reviews found for this user")
     return reviews
\ No newline at end of file
@@ -1,34 +1,151 @@
 import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from typing import Any
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from app import crud
 from app.api.deps import CurrentUser, SessionDep
-from app.models import Transaction, TransactionCreate, TransactionPublic, TransactionsPublic, TransactionUpdate, Message
-from sqlmodel import func, select
+from app.api.export import ExportFormat, stream_export
+from app.api.pagination import paginate_union
+from app.models import EarningsPeriod, Transaction, TransactionCreate, TransactionPublic, TransactionRole, TransactionStats, TransactionsPublic, TransactionUpdate
+from sqlalchemy import union_all
+from sqlmodel import select
 
 router = APIRouter()
 
+# Longest range /stats returns per period, which bounds its cost
+MAX_STATS_DAYS = {"day": 366, "month": 3660}
+
 @router.get("/", response_model=TransactionsPublic)
 def read_transactions(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: SessionDep,
+    current_user: CurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    exact_count: bool = False,
+    role: TransactionRole = "both",
+    status: str | None = None,
 ) -> Any:
     """
-    Retrieve transactions for the current user.
+    Retrieve transactions for the current user, newest first.
+
+    `role` limits them to those where the user is the renter or the lender,
+    and `status` to one status.
+
+    Without filters, `count` comes from the user's stored counter; set
+    `exact_count` to run a COUNT(*) instead. With filters it is always
+    counted.
     """
-    count_statement = (
-        select(func.count())
-        .select_from(Transaction)
-        .where((Transaction.renter_id == current_user.id) | (Transaction.lender_id == current_user.id))
+    if exact_count or role != "both" or status is not None:
+        count = crud.count_participant_transactions(
+            session, current_user.id, role, status
+        )
+    else:
+        stats = crud.get_user_stats(session=session, user_id=current_user.id)
+        count = stats.transaction_count
+    statements = [
+        select(Transaction).where(*conditions)
+        for conditions in crud.participant_conditions(current_user.id, role, status)
+    ]
+    transactions, next_cursor = paginate_union(
+        session,
+        Transaction,
+        statements,
+        order_by=[Transaction.created_at, Transaction.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
     )
-    count = session.exec(count_statement).one()
-    statement = (
-        select(Transaction)
-        .where((Transaction.renter_id == current_user.id) | (Transaction.lender_id == current_user.id))
-        .offset(skip)
-        .limit(limit)
+
+    return TransactionsPublic(data=transactions, count=count, next_cursor=next_cursor)
+
+@router.get("/export")
+def export_transactions(
+    current_user: CurrentUser, format: ExportFormat = "csv"
+) -> StreamingResponse:
+    """
+    Stream every transaction of the current user as CSV or NDJSON: those
+    where they are the renter first, then those where they are the lender.
+    """
+    columns = [getattr(Transaction, field) for field in TransactionPublic.model_fields]
+    statement = union_all(
+        *(
+            select(*columns).where(*conditions)
+            for conditions in crud.participant_conditions(current_user.id)
+        )
+    )
+    return stream_export(statement, format, "transactions")
+
+@router.get("/stats", response_model=TransactionStats)
+def read_transaction_stats(
+    session: SessionDep,
+    current_user: CurrentUser,
+    period: EarningsPeriod = "day",
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> Any:
+    """
+    Completed and canceled counts and earnings of the current user as a
+    lender, per day or month, from `start_date` up to, not including,
+    `end_date`.
+
+    Defaults to the last 30 days, or the last 12 months by month. A
+    transaction counts on the day it ends.
+    """
+    if end_date is None:
+        end_date = datetime.utcnow().date() + timedelta(days=1)
+    if start_date is None:
+        if period == "day":
+            start_date = end_date - timedelta(days=30)
+        else:
+            last_day = end_date - timedelta(days=1)
+            months = last_day.year * 12 + last_day.month - 12
+            start_date = date(months // 12, months % 12 + 1, 1)
+    if end_date <= start_date:
+        raise HTTPException(status_code=422, detail="end_date must be after start_date")
+    if (end_date - start_date).days > MAX_STATS_DAYS[period]:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {MAX_STATS_DAYS[period]} days by {period}",
+        )
+    return crud.get_lender_earnings(
+        session, current_user.id, start_date, end_date, period
     )
-    transactions = session.exec(statement).all()
 
-    return TransactionsPublic(data=transactions, count=count)
+def _etag(transaction: Transaction) -> str:
+    return f'"{transaction.version}"'
+
+def _check_if_match(if_match: str | None, transaction: Transaction) -> None:
+    if if_match is None:
+        return
+    tags = [tag.strip() for tag in if_match.split(",")]
+    if "*" not in tags and _etag(transaction) not in tags:
+        raise HTTPException(
+            status_code=409, detail="Transaction has been modified since it was read"
+        )
+
+@contextmanager
+def _transaction_errors() -> Iterator[None]:
+    try:
+        yield
+    except crud.ListingNotFound:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    except crud.BookingConflict:
+        raise HTTPException(
+            status_code=409, detail="Listing is already booked for these dates"
+        )
+    except crud.InvalidStatusChange as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (crud.InvalidBookingDates, crud.LenderMismatch) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except crud.TransactionModified:
+        raise HTTPException(
+            status_code=409, detail="Transaction has been modified since it was read"
+        )
 
 @router.post("/", response_model=TransactionPublic)
 def create_transaction(
@@ -38,65 +155,88 @@ def create_transaction(
 ) -> Any:
     """
     Create a new transaction.
+
+    Users book as the renter, and the lender must be the listing's owner.
+    Pending and approved bookings of a listing may not overlap: a conflicting
+    one is rejected with 409.
     """
-    new_transaction = Transaction.model_validate(transaction, update={"owner_id":current_user.id})
-    session.add(new_transaction)
-    session.commit()
-    session.refresh(new_transaction)
-    return new_transaction
+    if not current_user.is_superuser and transaction.renter_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    with _transaction_errors():
+        return crud.create_transaction(session, transaction)
 
 @router.get("/{transaction_id}", response_model=TransactionPublic)
 def read_transaction(
     transaction_id: uuid.UUID,
+    response: Response,
     session: SessionDep = SessionDep,
     current_user: CurrentUser = CurrentUser,
 ) -> Any:
     """
     Get a transaction by ID.
+
+    The ETag header carries its version, for If-Match on update and delete.
     """
     db_transaction = session.get(Transaction, transaction_id)
     if db_transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     if not current_user.is_superuser and db_transaction.renter_id != current_user.id and db_transaction.lender_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
+    response.headers["ETag"] = _etag(db_transaction)
     return db_transaction
 
 @router.put("/{transaction_id}", response_model=TransactionPublic)
 def update_transaction(
     transaction_id: uuid.UUID,
     transaction: TransactionUpdate,
+    response: Response,
     session: SessionDep = SessionDep,
     current_user: CurrentUser = CurrentUser,
+    if_match: str | None = Header(default=None),
 ) -> Any:
     """
     Update a transaction by ID.
+
+    With If-Match set to the ETag it was read with, the update is rejected
+    with 409 if the transaction changed since. Without it, it still fails
+    with 409 rather than overwrite a concurrent update. `status` may only
+    move pending -> approved | canceled and approved -> completed | canceled;
+    other changes are rejected with 409.
     """
     db_transaction = session.get(Transaction, transaction_id)
     if db_transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     if not current_user.is_superuser and db_transaction.renter_id != current_user.id and db_transaction.lender_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
-    updated = transaction.model_dump(exclude_unset=True)
-    db_transaction.sqlmodel_update(updated)
-    session.add(db_transaction)
-    session.commit()
-    session.refresh(db_transaction)
-    return db_transaction
+    _check_if_match(if_match, db_transaction)
+    with _transaction_errors():
+        updated = crud.update_transaction(session, transaction_id, transaction)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    response.headers["ETag"] = _etag(updated)
+    return updated
 
 @router.delete("/{transaction_id}", response_model=TransactionPublic)
 def delete_transaction(
     transaction_id: uuid.UUID,
     session: SessionDep = SessionDep,
     current_user: CurrentUser = CurrentUser,
+    if_match: str | None = Header(default=None),
 ) -> Any:
     """
     Delete a transaction by ID.
+
+    Like updates, honours If-Match and fails with 409 on a concurrent update.
     """
     db_transaction = session.get(Transaction, transaction_id)
     if db_transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     if not current_user.is_superuser and db_transaction.renter_id != current_user.id and db_transaction.lender_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
-    session.delete(db_transaction)
-    session.commit()
-    return Message(message="Item deleted successfully")
\ No newline at end of file
+    _check_if_match(if_match, db_transaction)
+    # Deleted rows can't be loaded anymore once committed
+    deleted = TransactionPublic.model_validate(db_transaction)
+    with _transaction_errors():
+        if crud.delete_transaction(session, transaction_id) is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+    return deleted
@@ -10,6 +10,7 @@ from app.api.deps import (
     SessionDep,
     get_current_active_superuser,
 )
+from app.api.pagination import paginate
 from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
 from app.models import (
@@ -34,18 +35,35 @@ router = APIRouter()
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(
+    session: SessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    exact_count: bool = False,
+) -> Any:
     """
     Retrieve users.
+
+    `count` is the planner's estimate unless `exact_count` is set.
     """
 
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    if exact_count:
+        count_statement = select(func.count()).select_from(User)
+        count = session.exec(count_statement).one()
+    else:
+        count = crud.estimate_row_count(session=session, model=User)
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    users, next_cursor = paginate(
+        session,
+        select(User),
+        order_by=[User.id],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+    )
 
-    return UsersPublic(data=users, count=count)
+    return UsersPublic(data=users, count=count, next_cursor=next_cursor)
 
 
 @router.post(
@@ -1,8 +1,12 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
+from app import crud
 from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.core.cache import TTLCache
+from app.models import CacheStats, Message
 from app.utils import generate_test_email, send_email
 
 router = APIRouter()
@@ -24,3 +28,30 @@ def test_email(email_to: EmailStr) -> Message:
         html_content=email_data.html_content,
     )
     return Message(message="Test email sent")
+
+
+def _cache_stats(cache: TTLCache[Any]) -> CacheStats:
+    return CacheStats(
+        # In the same unit as maxsize
+        size=cache.weight,
+        maxsize=cache.maxsize,
+        hits=cache.hits,
+        misses=cache.misses,
+        evictions=cache.evictions,
+        hit_rate=cache.hits / lookups if (lookups := cache.hits + cache.misses) else 0.0,
+    )
+
+
+@router.get(
+    "/cache-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def cache_stats() -> dict[str, CacheStats]:
+    """
+    Hit, miss and eviction counters of this worker's in-process caches.
+    """
+    return {
+        "listing": _cache_stats(crud.listing_cache),
+        "listing_facets": _cache_stats(crud.listing_facets_cache),
+        "listing_search": _cache_stats(crud.listing_search_cache),
+    }
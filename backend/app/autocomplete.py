@@ -0,0 +1,190 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections.abc import Callable, Iterable
+
+
+def normalize_term(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+class PrefixIndex:
+    """
+    In-memory prefix index over weighted terms, for autocomplete.
+
+    Terms are kept case-folded in a sorted list, so the terms starting with a
+    prefix are one contiguous slice found by bisection. Small slices are
+    ranked on the fly. For short prefixes with more than `scan_limit`
+    matches, the best `top_size` terms are memoized per prefix and kept
+    current as weights change; a prefix is only ranked again when one of its
+    memoized terms is removed or drops below the others' cutoff.
+
+    `load` returns (term, weight) pairs from the source of truth. It runs in
+    a background thread, first from start_loading() (or the first search,
+    which waits for it) and again once the index is older than `max_age`
+    seconds, which also picks up writes made by other worker processes.
+    add() and remove() keep this process's copy current in between.
+    """
+
+    def __init__(
+        self,
+        *,
+        load: Callable[[], Iterable[tuple[str, int]]],
+        max_age: float,
+        scan_limit: int = 256,
+        top_size: int = 20,
+    ) -> None:
+        self.load = load
+        self.max_age = max_age
+        self.scan_limit = scan_limit
+        self.top_size = top_size
+        self._weights: dict[str, int] = {}
+        # Original spelling, only where it differs from the normalized term
+        self._display: dict[str, str] = {}
+        self._keys: list[str] = []
+        self._top: dict[str, list[str]] = {}
+        self._loaded_at: float | None = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # Changes made while a load runs, replayed onto the new index so
+        # they aren't lost. One that the load already read can end up
+        # counted twice until the reload after that.
+        self._pending: list[tuple[str, int]] | None = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, text: str | None, weight: int = 1) -> None:
+        if not text:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((text, weight))
+            if self._loaded_at is None:
+                return  # replayed or picked up by the first load
+            self._apply(text, weight)
+
+    def remove(self, text: str | None, weight: int = 1) -> None:
+        self.add(text, -weight)
+
+    def _apply(self, text: str, weight: int) -> None:
+        term = normalize_term(text)
+        if not term:
+            return
+        current = self._weights.get(term)
+        new_weight = (current or 0) + weight
+        if new_weight <= 0:
+            if current is None:
+                return
+            del self._weights[term]
+            self._display.pop(term, None)
+            del self._keys[bisect_left(self._keys, term)]
+        else:
+            if current is None:
+                insort(self._keys, term)
+                if text != term:
+                    self._display[term] = text
+            self._weights[term] = new_weight
+        self._update_top(term, current or 0)
+
+    def _update_top(self, term: str, previous_weight: int) -> None:
+        # Only the memoized terms and the changed one can rank in a prefix's
+        # top list, unless the changed term leaves it or falls below its
+        # cutoff: then a term outside the list may take its place
+        weight = self._weights.get(term, 0)
+        for end in range(1, len(term) + 1):
+            prefix = term[:end]
+            terms = self._top.get(prefix)
+            if not terms:
+                continue
+            last = terms[-1]
+            cutoff = previous_weight if last == term else self._weights[last]
+            if term in terms:
+                if weight <= 0 or weight < cutoff:
+                    del self._top[prefix]
+                    continue
+                terms.remove(term)
+            elif weight <= cutoff:
+                continue
+            else:
+                terms.pop()
+            position = next(
+                (i for i, other in enumerate(terms) if self._weights[other] < weight),
+                len(terms),
+            )
+            terms.insert(position, term)
+
+    def search(self, prefix: str, limit: int) -> list[tuple[str, int]]:
+        """The `limit` heaviest terms starting with `prefix`, heaviest first."""
+        self._ensure_loaded()
+        prefix = normalize_term(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            terms = self._top.get(prefix)
+            if terms is None:
+                start = bisect_left(self._keys, prefix)
+                # Every term with the prefix sorts before prefix + U+10FFFF
+                end = bisect_left(self._keys, prefix + "\U0010ffff", lo=start)
+                memoize = end - start > self.scan_limit
+                terms = heapq.nlargest(
+                    max(limit, self.top_size) if memoize else limit,
+                    self._keys[start:end],
+                    key=self._weights.__getitem__,
+                )
+                if memoize:
+                    self._top[prefix] = terms
+            return [
+                (self._display.get(term, term), self._weights[term])
+                for term in terms[:limit]
+            ]
+
+    def start_loading(self) -> None:
+        """Start the first load in a background thread, e.g. at startup."""
+        if self._loaded_at is None and self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._reload_in_background, daemon=True).start()
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded_at is None:
+            self.start_loading()
+            # Held by the loading thread until it is done
+            with self._load_lock:
+                pass
+            if self._loaded_at is None:
+                raise RuntimeError("Loading the prefix index failed")
+        elif time.monotonic() - self._loaded_at > self.max_age:
+            if self._load_lock.acquire(blocking=False):
+                threading.Thread(target=self._reload_in_background, daemon=True).start()
+
+    def _reload_in_background(self) -> None:
+        try:
+            self._reload()
+        finally:
+            self._load_lock.release()
+
+    def _reload(self) -> None:
+        with self._lock:
+            self._pending = []
+        try:
+            weights: dict[str, int] = {}
+            display: dict[str, str] = {}
+            for text, weight in self.load():
+                term = normalize_term(text)
+                if not term:
+                    continue
+                weights[term] = weights.get(term, 0) + weight
+                if text != term:
+                    display.setdefault(term, text)
+            keys = sorted(weights)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            pending, self._pending = self._pending or [], None
+            self._weights, self._display, self._keys = weights, display, keys
+            self._top = {}
+            self._loaded_at = time.monotonic()
+            for text, weight in pending:
+                self._apply(text, weight)
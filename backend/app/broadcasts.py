@@ -0,0 +1,211 @@
+import logging
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from typing import Any
+
+from sqlalchemy import Engine, text
+from sqlmodel import Session, select
+
+from app import realtime
+from app.core.config import settings
+from app.models import NotificationBroadcast, NotificationPublic
+from app.partitions import add_months, list_partitions
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_broadcast_executor() -> ThreadPoolExecutor:
+    # One thread per server worker: broadcasts run one at a time, off the
+    # request threadpool. Created lazily so each worker process gets its own
+    # after the fork.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broadcast")
+    return _executor
+
+
+def _audience(broadcast: NotificationBroadcast) -> tuple[str, dict[str, Any]]:
+    """SQL condition on "user" u selecting the broadcast's audience."""
+    condition = "u.is_active"
+    params: dict[str, Any] = {}
+    if broadcast.audience == "listing_category":
+        condition += (
+            " AND EXISTS (SELECT 1 FROM listing"
+            " WHERE listing.owner_id = u.id AND listing.category = :category)"
+        )
+        params["category"] = broadcast.category
+    return condition, params
+
+
+def count_audience(session: Session, broadcast: NotificationBroadcast) -> int:
+    condition, params = _audience(broadcast)
+    return session.execute(
+        text(f'SELECT count(*) FROM "user" u WHERE {condition}'), params
+    ).scalar_one()
+
+
+def _chunk_timestamp(session: Session) -> datetime:
+    """
+    The time a chunk is sent, or the end of the newest notification
+    partition before it if partition maintenance fell behind.
+    """
+    now = datetime.utcnow()
+    current = now.date().replace(day=1)
+    months = {
+        month
+        for _, month, detach_pending in list_partitions(session.connection(), "notification")
+        if not detach_pending
+    }
+    earlier = max((month for month in months if month < current), default=None)
+    if current in months or earlier is None:
+        return now
+    return datetime.combine(add_months(earlier, 1), time()) - timedelta(microseconds=1)
+
+
+def send_chunk(engine: Engine, broadcast_id: uuid.UUID, chunk_size: int) -> bool:
+    """
+    Insert the notifications of the next `chunk_size` users of the audience
+    and bump their unread counters, in one transaction that also records
+    the progress, then push them to the users' event streams. Returns
+    whether users are left.
+
+    Each chunk is stamped with the time it is sent rather than the
+    broadcast's creation, so a stream resuming from an event received in
+    the meantime still replays it.
+
+    The broadcast row stays locked meanwhile, so two runners of the same
+    broadcast take turns and never send a chunk twice.
+    """
+    with Session(engine) as session:
+        broadcast = session.exec(
+            select(NotificationBroadcast)
+            .where(NotificationBroadcast.id == broadcast_id)
+            .with_for_update()
+        ).one()
+        if broadcast.status == "completed":
+            return False
+        condition, params = _audience(broadcast)
+        if broadcast.last_user_id is not None:
+            condition += " AND u.id > :after"
+            params["after"] = broadcast.last_user_id
+        timestamp = _chunk_timestamp(session)
+        # Recipients in id order, which also orders the userstats row locks
+        # like every other batch of counter updates. The ids come back as
+        # text: uuid objects are tracked by the garbage collector, and
+        # thousands of them per chunk set off full collections that stall
+        # the worker's requests
+        notified = session.execute(
+            text(
+                f"""
+                WITH recipients AS (
+                    SELECT u.id FROM "user" u
+                    WHERE {condition}
+                    ORDER BY u.id
+                    LIMIT :chunk_size
+                ),
+                notified AS (
+                    INSERT INTO notification (id, user_id, title, message, is_read, "timestamp")
+                    SELECT gen_random_uuid(), id, :title, :message, false, :timestamp
+                    FROM recipients
+                    RETURNING id, user_id
+                ),
+                counted AS (
+                    INSERT INTO userstats (
+                        user_id, item_count, listing_count, transaction_count,
+                        unread_notification_count
+                    )
+                    SELECT id, 0, 0, 0, 1 FROM recipients
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET unread_notification_count = userstats.unread_notification_count + 1
+                )
+                SELECT id::text, user_id::text FROM notified
+                """
+            ),
+            {
+                **params,
+                "chunk_size": chunk_size,
+                "title": broadcast.title,
+                "message": broadcast.message,
+                "timestamp": timestamp,
+            },
+        ).all()
+        count = len(notified)
+        broadcast.sent += count
+        if notified:
+            # Canonical uuid text sorts like the uuids themselves
+            broadcast.last_user_id = uuid.UUID(max(user_id for _, user_id in notified))
+        if count < chunk_size:
+            broadcast.status = "completed"
+            broadcast.finished_at = datetime.utcnow()
+        else:
+            broadcast.status = "running"
+        title, message = broadcast.title, broadcast.message
+        session.add(broadcast)
+        session.commit()
+    # After the commit, so nothing is pushed for a chunk that failed
+    realtime.publish_notifications(
+        NotificationPublic(
+            id=notification_id,
+            user_id=user_id,
+            title=title,
+            message=message,
+            is_read=False,
+            timestamp=timestamp,
+        )
+        for notification_id, user_id in notified
+    )
+    return count == chunk_size
+
+
+def run_broadcast(
+    engine: Engine, broadcast_id: uuid.UUID, chunk_size: int | None = None
+) -> None:
+    """Send a broadcast to the rest of its audience, chunk by chunk."""
+    try:
+        while send_chunk(engine, broadcast_id, chunk_size or settings.BROADCAST_CHUNK_SIZE):
+            pass
+    except Exception:
+        logger.exception("Broadcast %s failed", broadcast_id)
+        with Session(engine) as session:
+            broadcast = session.get(NotificationBroadcast, broadcast_id)
+            if broadcast is not None:
+                broadcast.status = "failed"
+                session.add(broadcast)
+                session.commit()
+
+
+def start_broadcast(broadcast_id: uuid.UUID) -> Future[None]:
+    """Run a broadcast in the background of this server worker."""
+    from app.core.db import engine
+
+    return get_broadcast_executor().submit(run_broadcast, engine, broadcast_id)
+
+
+def resume_broadcasts(engine: Engine) -> None:
+    """
+    Finish the broadcasts a server worker stopped or failed in the middle
+    of; each continues after its last sent chunk.
+    """
+    with Session(engine) as session:
+        broadcast_ids = session.exec(
+            select(NotificationBroadcast.id)
+            .where(NotificationBroadcast.status != "completed")
+            .order_by(NotificationBroadcast.created_at)
+        ).all()
+    for broadcast_id in broadcast_ids:
+        logger.info("Resuming broadcast %s", broadcast_id)
+        run_broadcast(engine, broadcast_id)
+
+
+def main() -> None:
+    from app.core.db import engine
+
+    logging.basicConfig(level=logging.INFO)
+    resume_broadcasts(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Generic, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    In-process LRU cache whose entries also expire `ttl` seconds after they
+    were stored.
+
+    Thread-safe, since sync path operations run in Starlette's threadpool.
+    Each worker process has its own copy, so the TTL bounds how long a worker
+    can serve a value another worker already invalidated.
+
+    `maxsize` bounds the summed weight of the entries. Every entry weighs 1
+    unless `weigh` is given, e.g. to bound a cache of lists by their total
+    length rather than by how many lists it holds.
+
+    `hits`, `misses` and `evictions` (entries dropped to stay within
+    `maxsize`) count since process start and help size the cache.
+    """
+
+    def __init__(
+        self,
+        *,
+        maxsize: int,
+        ttl: float,
+        weigh: Callable[[V], int] | None = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.weight = 0
+        self._weigh = weigh
+        self._data: OrderedDict[Hashable, tuple[float, int, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> V | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, weight, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.weight -= weight
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        weight = 1 if self._weigh is None else max(1, self._weigh(value))
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.weight -= previous[1]
+            self._data[key] = (time.monotonic() + self.ttl, weight, value)
+            self.weight += weight
+            while self.weight > self.maxsize and len(self._data) > 1:
+                _, (_, evicted_weight, _) = self._data.popitem(last=False)
+                self.weight -= evicted_weight
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.weight -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -84,6 +84,65 @@ class Settings(BaseSettings):
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
 
+    # Bulk listing import: rows validated and COPYed per chunk, and the
+    # number of per-row errors echoed back in the report
+    LISTING_IMPORT_CHUNK_SIZE: int = 1000
+    LISTING_IMPORT_MAX_ERRORS: int = 1000
+
+    # Rows fetched per server-side cursor round trip by the export endpoints
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Uploaded images, stored by the SHA-256 of their content. WebP variants
+    # are rendered in a pool of IMAGE_PROCESS_WORKERS processes per server
+    # worker.
+    IMAGE_STORAGE_DIR: str = "data/images"
+    IMAGE_MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    IMAGE_THUMBNAIL_SIZES: list[int] = [256, 1024]
+    IMAGE_PROCESS_WORKERS: int = 2
+
+    # Per-worker caches, invalidated on listing writes
+    LISTING_CACHE_SIZE: int = 10_000
+    LISTING_CACHE_TTL_SECONDS: int = 30
+    LISTING_FACETS_CACHE_SIZE: int = 1024
+    LISTING_FACETS_CACHE_TTL_SECONDS: int = 60
+    # Total listings held across all cached search result pages
+    LISTING_SEARCH_CACHE_MAX_ROWS: int = 100_000
+    LISTING_SEARCH_CACHE_TTL_SECONDS: int = 30
+    # Full rebuild interval of the autocomplete prefix index, which picks up
+    # listing writes made by other workers
+    LISTING_AUTOCOMPLETE_REFRESH_SECONDS: int = 300
+
+    # The message and notification tables are partitioned by month
+    # (app/partitions.py). Partitions are created this many months ahead,
+    # and those older than a table's retention are dropped whole; None keeps
+    # them forever.
+    PARTITION_PREMAKE_MONTHS: int = 3
+    MESSAGE_RETENTION_MONTHS: int | None = None
+    NOTIFICATION_RETENTION_MONTHS: int | None = 12
+
+    # Real-time delivery to WebSocket clients (app/realtime.py). "postgres"
+    # relays events between server workers with LISTEN/NOTIFY; "local" only
+    # reaches clients of the worker that published them.
+    REALTIME_BACKEND: Literal["postgres", "local"] = "postgres"
+    # Events buffered per connection. A client that falls further behind is
+    # disconnected and has to catch up from the message history.
+    REALTIME_QUEUE_SIZE: int = 100
+    # /notifications/stream: seconds between keep-alive comments on an idle
+    # stream, and how many missed notifications a reconnecting client is sent
+    # before it is told to reload instead
+    NOTIFICATION_STREAM_HEARTBEAT_SECONDS: float = 15
+    NOTIFICATION_STREAM_REPLAY_LIMIT: int = 100
+    # Users whose broadcast notifications are inserted per transaction by
+    # app/broadcasts.py
+    BROADCAST_CHUNK_SIZE: int = 1000
+    # Notification digest emails (app/digests.py): at most one per user per
+    # window, of the unread notifications created since the last one, up to
+    # NOTIFICATION_DIGEST_MAX_AGE_HOURS back. Each lists up to
+    # NOTIFICATION_DIGEST_MAX_ITEMS of them.
+    NOTIFICATION_DIGEST_WINDOW_MINUTES: int = 60
+    NOTIFICATION_DIGEST_MAX_AGE_HOURS: int = 24
+    NOTIFICATION_DIGEST_MAX_ITEMS: int = 10
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def emails_enabled(self) -> bool:
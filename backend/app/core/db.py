@@ -21,6 +21,10 @@ def init_db(session: Session) -> None:
     # from app.core.engine import engine
     # This works because the models are already imported and registered from app.models
     SQLModel.metadata.create_all(engine)
+    # Partitioned tables need a partition for any row to be inserted
+    from app.partitions import create_partitions
+
+    create_partitions(engine)
 
     user = session.exec(
         select(User).where(User.email == settings.FIRST_SUPERUSER)
@@ -1,10 +1,34 @@
+import json
+import threading
 import uuid
+from collections.abc import Iterable, Sequence
+from datetime import date, datetime, timedelta
+from itertools import islice
 from typing import Any, List
 
-from sqlmodel import Session, select
+from pydantic import ValidationError
 
+from sqlalchemy import Date, and_, case, cast, delete, exists, literal, literal_column, or_, text, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import BIT, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.exc import StaleDataError
+from sqlmodel import Session, SQLModel, func, select
+
+from app.autocomplete import PrefixIndex
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, Transaction, TransactionCreate, TransactionUpdate, User, UserCreate, UserUpdate, Listing, ListingCreate, ListingUpdate
+from app.geo import (
+    EARTH_RADIUS_KM,
+    BoundingBox,
+    covering_geohashes,
+    geohash_encode,
+    radius_bounding_boxes,
+    split_antimeridian,
+)
+from app.models import ACTIVE_BOOKING_STATUSES, CALENDAR_DAYS, CONVERSATION_PREVIEW_LENGTH, TRANSACTION_STATUS_TRANSITIONS, EarningsBucket, EarningsPeriod, Conversation, Item, ItemCreate, LenderEarnings, Message, MessageCreate, Notification, NotificationCreate, NotificationSelection, Transaction, TransactionBase, TransactionCreate, TransactionPublic, TransactionRole, TransactionStats, TransactionUpdate, User, UserCreate, UserStats, UserUpdate, Listing, ListingBase, ListingCalendar, ListingCreate, ListingFacets, ListingImportError, ListingImportReport, ListingPublic, ListingUpdate, ListingSearch, LISTING_SEARCH_CONFIG, FacetCount, PriceBucket
+from app.partitions import MissingPartition, is_missing_partition
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -46,9 +70,57 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     return db_user
 
 
+def get_user_stats(*, session: Session, user_id: uuid.UUID) -> UserStats:
+    stats = session.get(UserStats, user_id)
+    if stats is None:
+        return UserStats(user_id=user_id)
+    return stats
+
+
+def update_user_stats(*, session: Session, user_id: uuid.UUID, **deltas: int) -> None:
+    """
+    Atomically add `deltas` (e.g. listing_count=1) to the user's counters.
+
+    Does not commit: call it before the commit of the write it accounts for,
+    so the counter and the row change land in the same transaction.
+    """
+    statement = (
+        insert(UserStats)
+        .values(user_id=user_id, **deltas)
+        .on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                field: getattr(UserStats, field) + delta
+                for field, delta in deltas.items()
+            },
+        )
+    )
+    session.execute(statement)
+
+
+def transaction_participants(transaction: Transaction) -> set[uuid.UUID]:
+    return {transaction.renter_id, transaction.lender_id}
+
+
+def estimate_row_count(*, session: Session, model: type[SQLModel]) -> int:
+    """
+    Planner estimate of the table's row count, kept fresh by autovacuum/ANALYZE.
+
+    Falls back to an exact COUNT(*) for tables that were never analyzed.
+    """
+    estimate = session.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": f'"{model.__tablename__}"'},
+    ).scalar()
+    if estimate is None or estimate < 0:
+        return session.exec(select(func.count()).select_from(model)).one()
+    return estimate
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
+    update_user_stats(session=session, user_id=owner_id, item_count=1)
     session.commit()
     session.refresh(db_item)
     return db_item
@@ -62,67 +134,986 @@ def get_listings(db: Session, owner_id: uuid.UUID = None, skip: int = 0, limit:
         statement = statement.where(Listing.owner_id == owner_id)
     return db.exec(statement).all()
 
+def _box_conditions(box: BoundingBox) -> Any:
+    conditions = [
+        Listing.latitude.between(box.min_latitude, box.max_latitude),
+        Listing.longitude.between(box.min_longitude, box.max_longitude),
+    ]
+    prefixes = covering_geohashes(box)
+    if prefixes:
+        # Each prefix is an index range scan on ix_listing_geohash; the
+        # latitude/longitude bounds then trim the cells' overshoot
+        conditions.append(or_(*(Listing.geohash.startswith(prefix) for prefix in prefixes)))
+    return and_(*conditions)
+
+
+def listing_distance_km(latitude: float, longitude: float) -> Any:
+    """Great-circle (haversine) distance between each listing and the point."""
+    lat1, lat2 = func.radians(latitude), func.radians(Listing.latitude)
+    half_dlat = (lat2 - lat1) / 2
+    half_dlon = (func.radians(Listing.longitude) - func.radians(longitude)) / 2
+    a = func.power(func.sin(half_dlat), 2) + func.cos(lat1) * func.cos(lat2) * func.power(
+        func.sin(half_dlon), 2
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.least(1.0, func.sqrt(a)))
+
+
+_EMPTY_CALENDAR = "0" * CALENDAR_DAYS
+
+
+def _calendar_bits(bits: str) -> Any:
+    return cast(literal(bits), BIT(CALENDAR_DAYS))
+
+
+def _calendar_masks(start: date, end: date) -> dict[int, str]:
+    """Per-year day bitmaps with a bit set for every day in [start, end)."""
+    masks: dict[int, bytearray] = {}
+    day = start
+    while day < end:
+        mask = masks.setdefault(day.year, bytearray(_EMPTY_CALENDAR.encode()))
+        mask[day.timetuple().tm_yday - 1] = ord("1")
+        day += timedelta(days=1)
+    return {year: mask.decode() for year, mask in masks.items()}
+
+
+def listing_search_conditions(search: ListingSearch) -> List[Any]:
+    """WHERE clauses for every filter set on `search` (paging and order aside)."""
+    conditions: List[Any] = []
+    if search.q:
+        # websearch_to_tsquery accepts free user input ("tent -family", quoted
+        # phrases, or) without raising on syntax errors
+        ts_query = func.websearch_to_tsquery(LISTING_SEARCH_CONFIG, search.q)
+        conditions.append(Listing.search_vector.op("@@")(ts_query))
+    if search.title:
+        conditions.append(Listing.title.contains(search.title))
+    if search.category:
+        conditions.append(Listing.category == search.category)
+    if search.location:
+        conditions.append(Listing.location == search.location)
+    if search.min_price is not None:
+        conditions.append(Listing.price >= search.min_price)
+    if search.max_price is not None:
+        conditions.append(Listing.price <= search.max_price)
+    if search.min_latitude is not None:
+        box = BoundingBox(
+            search.min_latitude, search.min_longitude, search.max_latitude, search.max_longitude  # type: ignore[arg-type]
+        )
+        conditions.append(or_(*(_box_conditions(part) for part in split_antimeridian(box))))
+    if search.radius_km is not None:
+        boxes = radius_bounding_boxes(search.latitude, search.longitude, search.radius_km)  # type: ignore[arg-type]
+        conditions.append(or_(*(_box_conditions(box) for box in boxes)))
+        conditions.append(
+            listing_distance_km(search.latitude, search.longitude) <= search.radius_km  # type: ignore[arg-type]
+        )
+    if search.available_from is not None:
+        # One anti-join against the day bitmaps of the window's years
+        booked = or_(
+            *(
+                and_(
+                    ListingCalendar.year == year,
+                    ListingCalendar.booked.op("&")(_calendar_bits(mask))
+                    != _calendar_bits(_EMPTY_CALENDAR),
+                )
+                for year, mask in _calendar_masks(
+                    search.available_from, search.available_to  # type: ignore[arg-type]
+                ).items()
+            )
+        )
+        conditions.append(
+            ~exists().where(ListingCalendar.listing_id == Listing.id, booked)
+        )
+    return conditions
+
+
+def search_listings(db: Session, search: ListingSearch) -> List[Listing]:
+    statement = select(Listing).where(*listing_search_conditions(search))
+    if search.latitude is not None and search.longitude is not None:
+        statement = statement.where(Listing.latitude.is_not(None)).order_by(
+            listing_distance_km(search.latitude, search.longitude), Listing.id
+        )
+    elif search.q:
+        ts_query = func.websearch_to_tsquery(LISTING_SEARCH_CONFIG, search.q)
+        statement = statement.order_by(
+            func.ts_rank_cd(Listing.search_vector, ts_query).desc(), Listing.id
+        )
+    else:
+        statement = statement.order_by(Listing.id)
+    statement = statement.offset(search.skip).limit(search.limit)
+    return db.exec(statement).all()
+
+listing_cache: TTLCache[ListingPublic] = TTLCache(
+    maxsize=settings.LISTING_CACHE_SIZE, ttl=settings.LISTING_CACHE_TTL_SECONDS
+)
+listing_facets_cache: TTLCache[ListingFacets] = TTLCache(
+    maxsize=settings.LISTING_FACETS_CACHE_SIZE,
+    ttl=settings.LISTING_FACETS_CACHE_TTL_SECONDS,
+)
+# Bounded by the total number of listings held across all cached pages
+listing_search_cache: TTLCache[List[ListingPublic]] = TTLCache(
+    maxsize=settings.LISTING_SEARCH_CACHE_MAX_ROWS,
+    ttl=settings.LISTING_SEARCH_CACHE_TTL_SECONDS,
+    weigh=len,
+)
+
+# Bumped on every listing write. Search results are cached under the version
+# they were read at, so a write makes every older entry unreachable at once;
+# those entries then age out of the LRU.
+listings_version = 0
+# Bumped on every booking write; only part of the key of searches with an
+# availability window, so bookings don't flush the other cached searches
+bookings_version = 0
+_listings_version_lock = threading.Lock()
+
+
+def invalidate_listing_caches(listing_id: uuid.UUID | None = None) -> None:
+    """
+    Call after committing any listing insert, update or delete, passing the
+    listing's id for updates and deletes.
+    """
+    global listings_version
+    with _listings_version_lock:
+        listings_version += 1
+    if listing_id is not None:
+        listing_cache.delete(listing_id)
+    listing_facets_cache.clear()
+
+
+def _listing_autocomplete_terms(bind: Any) -> Iterable[tuple[str, int]]:
+    # Each distinct title and category, weighted by how many listings use it
+    with Session(bind) as session:
+        for column in (Listing.title, Listing.category):
+            statement = (
+                select(column, func.count())
+                .where(column.is_not(None))
+                .group_by(column)
+                .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+            )
+            yield from session.exec(statement)
+
+
+listing_autocomplete_index: PrefixIndex | None = None
+_listing_autocomplete_lock = threading.Lock()
+
+
+def get_listing_autocomplete_index(db: Session) -> PrefixIndex:
+    global listing_autocomplete_index
+    with _listing_autocomplete_lock:
+        if listing_autocomplete_index is None:
+            bind = db.get_bind()
+            listing_autocomplete_index = PrefixIndex(
+                load=lambda: _listing_autocomplete_terms(bind),
+                max_age=settings.LISTING_AUTOCOMPLETE_REFRESH_SECONDS,
+            )
+    return listing_autocomplete_index
+
+
+def update_listing_autocomplete(
+    *, added: Sequence[ListingBase] = (), removed: Sequence[ListingBase] = ()
+) -> None:
+    """
+    Call after committing listing writes: `added` are created listings and
+    the new version of updated ones, `removed` are deleted listings and the
+    previous version of updated ones.
+    """
+    index = listing_autocomplete_index
+    if index is None:
+        return
+    for listing in added:
+        index.add(listing.title)
+        index.add(listing.category)
+    for listing in removed:
+        index.remove(listing.title)
+        index.remove(listing.category)
+
+
+def invalidate_availability_caches() -> None:
+    """Call after committing any transaction insert, update or delete."""
+    global bookings_version
+    with _listings_version_lock:
+        bookings_version += 1
+
+
+def _search_cache_version(search: ListingSearch) -> tuple[int, int | None]:
+    return (
+        listings_version,
+        bookings_version if search.available_from is not None else None,
+    )
+
+
+def normalize_listing_search(search: ListingSearch) -> ListingSearch:
+    """
+    Trim text filters, drop empty ones and lower-case `q`, so equivalent
+    searches share a cache entry.
+
+    Only `q` is lower-cased: full-text matching ignores case anyway, while
+    title, category and location are matched case-sensitively.
+    """
+    updates: dict[str, Any] = {}
+    for field in ("q", "title", "category", "location"):
+        value = getattr(search, field)
+        if value is not None:
+            value = value.strip() or None
+            if field == "q" and value is not None:
+                value = value.lower()
+            updates[field] = value
+    return search.model_copy(update=updates)
+
+
+def search_listings_cached(db: Session, search: ListingSearch) -> List[ListingPublic]:
+    """
+    Cached search_listings, keyed by the search and its page. Call with a
+    normalized search (normalize_listing_search), like get_listing_facets.
+    """
+    # model_dump_json writes fields in declaration order, so the key doesn't
+    # depend on the order they were sent in
+    key = (_search_cache_version(search), search.model_dump_json(exclude={"facets"}))
+    listings = listing_search_cache.get(key)
+    if listings is None:
+        listings = [
+            ListingPublic.model_validate(listing)
+            for listing in search_listings(db, search)
+        ]
+        listing_search_cache.set(key, listings)
+    return listings
+
+
+def get_listing_cached(db: Session, listing_id: uuid.UUID) -> ListingPublic | None:
+    """Read-through cached get_listing for the hot single-listing read path."""
+    listing = listing_cache.get(listing_id)
+    if listing is None:
+        db_listing = db.get(Listing, listing_id)
+        if db_listing is None:
+            return None
+        listing = ListingPublic.model_validate(db_listing)
+        listing_cache.set(listing_id, listing)
+    return listing
+
+
+def get_listing_facets(db: Session, search: ListingSearch) -> ListingFacets:
+    """
+    Category counts, location counts and a price histogram for every listing
+    matching `search`, computed in a single GROUP BY GROUPING SETS query.
+    Cached like search_listings_cached, with a normalized search.
+    """
+    key = (
+        _search_cache_version(search),
+        search.model_dump_json(exclude={"skip", "limit", "facets"}),
+    )
+    cached = listing_facets_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Inlined rather than bound: Postgres only matches grouping expressions
+    # that are textually identical, and each bind would get its own $n
+    bucket_size = literal_column(repr(float(search.price_bucket_size)))
+    bucket = func.floor(Listing.price / bucket_size)
+    # grouping() sets a bit for each argument that is *not* part of the
+    # row's grouping set: 0b011 is the category set, 0b101 location, 0b110
+    # price bucket
+    grouping = func.grouping(Listing.category, Listing.location, bucket)
+    statement = (
+        select(grouping, Listing.category, Listing.location, bucket, func.count())
+        .where(*listing_search_conditions(search))
+        .group_by(
+            func.grouping_sets(
+                tuple_(Listing.category), tuple_(Listing.location), tuple_(bucket)
+            )
+        )
+        .order_by(func.count().desc())
+    )
+    categories = []
+    locations = []
+    price_buckets = []
+    for group, category, location, price_bucket, count in db.exec(statement):
+        if group == 0b011 and category is not None:
+            categories.append(FacetCount(value=category, count=count))
+        elif group == 0b101 and location is not None:
+            locations.append(FacetCount(value=location, count=count))
+        elif group == 0b110 and price_bucket is not None:
+            min_price = price_bucket * search.price_bucket_size
+            price_buckets.append(
+                PriceBucket(
+                    min_price=min_price,
+                    max_price=min_price + search.price_bucket_size,
+                    count=count,
+                )
+            )
+    price_buckets.sort(key=lambda price_bucket: price_bucket.min_price)
+    facets = ListingFacets(
+        categories=categories, locations=locations, price_buckets=price_buckets
+    )
+    listing_facets_cache.set(key, facets)
+    return facets
+
 def create_listing(db: Session, listing: ListingCreate, owner_id: uuid.UUID) -> Listing:
-    db_listing = Listing.from_orm(listing)
-    db_listing.owner_id = owner_id
+    db_listing = Listing.model_validate(listing, update={"owner_id": owner_id})
     db.add(db_listing)
+    update_user_stats(session=db, user_id=owner_id, listing_count=1)
     db.commit()
+    invalidate_listing_caches()
+    update_listing_autocomplete(added=[listing])
     db.refresh(db_listing)
     return db_listing
 
+LISTING_IMPORT_COLUMNS = (
+    "id", "owner_id", "title", "description", "price", "category", "location",
+    "latitude", "longitude", "images", "geohash",
+)
+
+
+def _copy_listings(db: Session, listings: List[ListingCreate], owner_id: uuid.UUID) -> None:
+    # COPY bypasses the ORM, so the geohash mapper event doesn't run: derive
+    # it here the same way. search_vector is generated by Postgres.
+    cursor = db.connection().connection.driver_connection.cursor()
+    columns = ", ".join(LISTING_IMPORT_COLUMNS)
+    with cursor.copy(f"COPY listing ({columns}) FROM STDIN") as copy:
+        for listing in listings:
+            has_point = listing.latitude is not None and listing.longitude is not None
+            copy.write_row(
+                (
+                    uuid.uuid4(),
+                    owner_id,
+                    listing.title,
+                    listing.description,
+                    listing.price,
+                    listing.category,
+                    listing.location,
+                    listing.latitude,
+                    listing.longitude,
+                    json.dumps([str(url) for url in listing.images])
+                    if listing.images is not None
+                    else None,
+                    geohash_encode(listing.latitude, listing.longitude)  # type: ignore[arg-type]
+                    if has_point
+                    else None,
+                )
+            )
+
+
+def import_listings(
+    db: Session, rows: Iterable[Any], owner_id: uuid.UUID
+) -> ListingImportReport:
+    """
+    Validate `rows` against ListingCreate and load the valid ones with COPY.
+
+    Rows are consumed lazily, LISTING_IMPORT_CHUNK_SIZE at a time, and each
+    chunk is committed on its own, so memory use doesn't depend on the
+    number of rows. Invalid rows are skipped and reported by position.
+    """
+    report = ListingImportReport(imported=0, failed=0, errors=[])
+    numbered_rows = enumerate(rows, start=1)
+    while chunk := list(islice(numbered_rows, settings.LISTING_IMPORT_CHUNK_SIZE)):
+        valid = []
+        for row_number, row in chunk:
+            try:
+                valid.append(ListingCreate.model_validate(row))
+            except ValidationError as e:
+                report.failed += 1
+                if len(report.errors) < settings.LISTING_IMPORT_MAX_ERRORS:
+                    messages = [
+                        f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+                        for error in e.errors()
+                    ]
+                    report.errors.append(ListingImportError(row=row_number, errors=messages))
+        if valid:
+            _copy_listings(db, valid, owner_id)
+            update_user_stats(session=db, user_id=owner_id, listing_count=len(valid))
+            db.commit()
+            update_listing_autocomplete(added=valid)
+            report.imported += len(valid)
+    if report.imported:
+        invalidate_listing_caches()
+    return report
+
 def update_listing(db: Session, listing_id: uuid.UUID, listing: ListingUpdate) -> Listing:
     db_listing = db.get(Listing, listing_id)
     if not db_listing:
         return None
+    previous = ListingPublic.model_validate(db_listing)
     for key, value in listing.dict(exclude_unset=True).items():
         setattr(db_listing, key, value)
     db.add(db_listing)
     db.commit()
+    invalidate_listing_caches(listing_id)
     db.refresh(db_listing)
+    update_listing_autocomplete(added=[db_listing], removed=[previous])
     return db_listing
 
 def delete_listing(db: Session, listing_id: uuid.UUID) -> Listing:
     db_listing = db.get(Listing, listing_id)
     if not db_listing:
         return None
+    previous = ListingPublic.model_validate(db_listing)
     db.delete(db_listing)
+    update_user_stats(session=db, user_id=db_listing.owner_id, listing_count=-1)
     db.commit()
+    invalidate_listing_caches(listing_id)
+    update_listing_autocomplete(removed=[previous])
     return db_listing
 
+def lock_listing(db: Session, listing_id: uuid.UUID) -> uuid.UUID | None:
+    """
+    Lock the listing's row until the end of the transaction, serializing
+    concurrent bookings of it. Returns its owner_id, or None if the listing
+    doesn't exist.
+    """
+    statement = select(Listing.owner_id).where(Listing.id == listing_id).with_for_update()
+    # A pending change to the booking itself is flushed with the commit,
+    # after the checks
+    with db.no_autoflush:
+        return db.exec(statement).first()
+
+
+def find_booking_conflict(db: Session, transaction: Transaction) -> Transaction | None:
+    """
+    Another active booking of the same listing whose dates overlap
+    `transaction`'s, if there is one. Bookings are half-open, so one may
+    start the moment another ends.
+
+    Call with the listing locked (lock_listing), and commit in the same
+    transaction, so no conflicting booking can be committed in between.
+    """
+    if transaction.status not in ACTIVE_BOOKING_STATUSES:
+        return None
+    statement = select(Transaction).where(
+        Transaction.listing_id == transaction.listing_id,
+        Transaction.status.in_(ACTIVE_BOOKING_STATUSES),
+        Transaction.end_date > transaction.start_date,
+        Transaction.start_date < transaction.end_date,
+    )
+    if transaction.id is not None:
+        statement = statement.where(Transaction.id != transaction.id)
+    with db.no_autoflush:
+        return db.exec(statement.limit(1)).first()
+
+def refresh_listing_calendar(
+    db: Session, listing_id: uuid.UUID, start_date: datetime, end_date: datetime
+) -> None:
+    """
+    Rebuild the listing's day bitmaps for every year [start_date, end_date)
+    touches, from its active bookings.
+
+    Call after adding, changing or deleting a booking, with its dates (for
+    a change, with both its old and new dates), before the commit. The
+    listing must be locked (lock_listing) so concurrent bookings don't race.
+    A day counts as booked if any part of it is.
+    """
+    if end_date <= start_date:
+        return
+    first_year = start_date.year
+    last_year = (end_date - timedelta(microseconds=1)).year
+    period_start = datetime(first_year, 1, 1)
+    period_end = datetime(last_year + 1, 1, 1)
+    statement = select(Transaction.start_date, Transaction.end_date).where(
+        Transaction.listing_id == listing_id,
+        Transaction.status.in_(ACTIVE_BOOKING_STATUSES),
+        Transaction.end_date > period_start,
+        Transaction.start_date < period_end,
+    )
+    booked = {
+        year: bytearray(_EMPTY_CALENDAR.encode())
+        for year in range(first_year, last_year + 1)
+    }
+    for booking_start, booking_end in db.exec(statement):
+        day = max(booking_start, period_start).date()
+        # The day holding the booking's last instant
+        last_day = (min(booking_end, period_end) - timedelta(microseconds=1)).date()
+        while day <= last_day:
+            booked[day.year][day.timetuple().tm_yday - 1] = ord("1")
+            day += timedelta(days=1)
+
+    for year, bits in booked.items():
+        if bits.decode() == _EMPTY_CALENDAR:
+            db.execute(
+                delete(ListingCalendar).where(
+                    ListingCalendar.listing_id == listing_id,
+                    ListingCalendar.year == year,
+                )
+            )
+            continue
+        statement = insert(ListingCalendar).values(
+            listing_id=listing_id, year=year, booked=_calendar_bits(bits.decode())
+        )
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[ListingCalendar.listing_id, ListingCalendar.year],
+                set_={"booked": statement.excluded.booked},
+            )
+        )
+
+
+def update_lender_earnings(db: Session, transaction: TransactionBase, sign: int = 1) -> None:
+    """
+    Add (sign=1) or take back (sign=-1) the transaction's share of its
+    lender's LenderEarnings row, if it is completed or canceled. It counts
+    on the day of its last instant, like refresh_listing_calendar.
+
+    Does not commit, like update_user_stats. An update calls it with the
+    transaction as it was before with sign=-1, then as it is after.
+    """
+    if transaction.status == "completed":
+        deltas = {"completed_count": sign, "earnings": sign * transaction.total_price}
+    elif transaction.status == "canceled":
+        deltas = {"canceled_count": sign}
+    else:
+        return
+    day = (transaction.end_date - timedelta(microseconds=1)).date()
+    statement = (
+        insert(LenderEarnings)
+        .values(lender_id=transaction.lender_id, day=day, **deltas)
+        .on_conflict_do_update(
+            index_elements=[LenderEarnings.lender_id, LenderEarnings.day],
+            set_={
+                field: getattr(LenderEarnings, field) + delta
+                for field, delta in deltas.items()
+            },
+        )
+    )
+    db.execute(statement)
+
+
+def get_lender_earnings(
+    db: Session, lender_id: uuid.UUID, start: date, end: date, period: EarningsPeriod = "day"
+) -> TransactionStats:
+    """
+    The lender's completed and canceled counts and earnings per day or
+    month from `start` up to, not including, `end`, plus their totals.
+
+    Reads one LenderEarnings row per day with activity in the range,
+    however many transactions the lender has.
+    """
+    if period == "day":
+        bucket = LenderEarnings.day
+    else:
+        bucket = cast(func.date_trunc(period, LenderEarnings.day), Date)
+    statement = (
+        select(
+            bucket,
+            func.sum(LenderEarnings.completed_count),
+            func.sum(LenderEarnings.canceled_count),
+            func.sum(LenderEarnings.earnings),
+        )
+        .where(
+            LenderEarnings.lender_id == lender_id,
+            LenderEarnings.day >= start,
+            LenderEarnings.day < end,
+        )
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    buckets = [
+        EarningsBucket(
+            start=bucket_start,
+            completed_count=completed_count,
+            canceled_count=canceled_count,
+            earnings=earnings,
+        )
+        for bucket_start, completed_count, canceled_count, earnings in db.exec(statement)
+    ]
+    return TransactionStats(
+        data=buckets,
+        completed_count=sum(bucket.completed_count for bucket in buckets),
+        canceled_count=sum(bucket.canceled_count for bucket in buckets),
+        earnings=sum(bucket.earnings for bucket in buckets),
+    )
+
+
 def get_transaction(db: Session, transaction_id: uuid.UUID) -> Transaction:
     return db.get(Transaction, transaction_id)
 
-def get_transactions(db: Session, user_id: uuid.UUID, skip: int = 0, limit: int = 10) -> List[Transaction]:
+def participant_conditions(
+    user_id: uuid.UUID, role: TransactionRole = "both", status: str | None = None
+) -> List[List[Any]]:
+    """
+    WHERE clauses of the user's transactions in `role`, as one branch per
+    role to be combined with UNION ALL.
+
+    Each branch matches one of the (renter_id | lender_id, created_at, id)
+    indexes, where `renter_id = :user OR lender_id = :user` would need a
+    bitmap OR of both and a sort. The branches never overlap: a transaction
+    the user both rents and lends is only in the renter branch.
+    """
+    branches = []
+    if role in ("renter", "both"):
+        branches.append([Transaction.renter_id == user_id])
+    if role in ("lender", "both"):
+        lender = [Transaction.lender_id == user_id]
+        if role == "both":
+            lender.append(Transaction.renter_id != user_id)
+        branches.append(lender)
+    if status is not None:
+        for conditions in branches:
+            conditions.append(Transaction.status == status)
+    return branches
+
+
+def count_participant_transactions(
+    db: Session, user_id: uuid.UUID, role: TransactionRole = "both", status: str | None = None
+) -> int:
+    return sum(
+        db.exec(select(func.count()).select_from(Transaction).where(*conditions)).one()
+        for conditions in participant_conditions(user_id, role, status)
+    )
+
+
+def get_transactions(
+    db: Session,
+    user_id: uuid.UUID,
+    skip: int = 0,
+    limit: int = 10,
+    role: TransactionRole = "both",
+    status: str | None = None,
+) -> List[Transaction]:
+    """The user's transactions in `role`, newest first."""
+    order_by = [Transaction.created_at.desc(), Transaction.id.desc()]
+    union = union_all(
+        *(
+            select(Transaction).where(*conditions).order_by(*order_by).limit(skip + limit)
+            for conditions in participant_conditions(user_id, role, status)
+        )
+    ).subquery()
+    entity = aliased(Transaction, union)
     statement = (
-        select(Transaction)
-        .where((Transaction.renter_id == user_id) | (Transaction.lender_id == user_id))
+        select(entity)
+        .order_by(entity.created_at.desc(), entity.id.desc())
         .offset(skip)
         .limit(limit)
     )
     return db.exec(statement).all()
 
+class TransactionError(Exception):
+    """A rejected transaction write. Nothing was written."""
+
+
+class ListingNotFound(TransactionError):
+    pass
+
+
+class BookingConflict(TransactionError):
+    """An active booking of the listing overlaps the dates."""
+
+
+class LenderMismatch(TransactionError):
+    def __init__(self) -> None:
+        super().__init__("lender_id must be the listing's owner")
+
+
+class InvalidStatusChange(TransactionError):
+    def __init__(self, current: str, new: str) -> None:
+        super().__init__(f"Cannot change status from {current} to {new}")
+
+
+class InvalidBookingDates(TransactionError):
+    def __init__(self) -> None:
+        super().__init__("end_date must be after start_date")
+
+
+class TransactionModified(TransactionError):
+    """The transaction was changed concurrently since it was read."""
+
+
+def _check_booking(
+    db: Session, transaction: Transaction, *, check_lender: bool = False
+) -> None:
+    # Holds the listing's row lock until the caller commits, so a concurrent
+    # booking of the same listing waits and then sees this one, and its
+    # owner can't change in between
+    owner_id = lock_listing(db, transaction.listing_id)
+    if owner_id is None:
+        db.rollback()
+        raise ListingNotFound()
+    if check_lender and transaction.lender_id != owner_id:
+        db.rollback()
+        raise LenderMismatch()
+    if find_booking_conflict(db, transaction) is not None:
+        db.rollback()
+        raise BookingConflict()
+
+
 def create_transaction(db: Session, transaction: TransactionCreate) -> Transaction:
-    db_transaction = Transaction.from_orm(transaction)
+    """
+    Raises ListingNotFound, LenderMismatch if lender_id isn't the listing's
+    owner, or BookingConflict if the listing is already booked for the dates.
+    """
+    db_transaction = Transaction.model_validate(transaction)
+    _check_booking(db, db_transaction, check_lender=True)
     db.add(db_transaction)
+    for user_id in transaction_participants(db_transaction):
+        update_user_stats(session=db, user_id=user_id, transaction_count=1)
+    update_lender_earnings(db, db_transaction)
+    refresh_listing_calendar(
+        db, db_transaction.listing_id, db_transaction.start_date, db_transaction.end_date
+    )
     db.commit()
+    invalidate_availability_caches()
     db.refresh(db_transaction)
     return db_transaction
 
-def update_transaction(db: Session, transaction_id: uuid.UUID, transaction: TransactionUpdate) -> Transaction:
+def can_change_status(current: str, new: str) -> bool:
+    return new == current or new in TRANSACTION_STATUS_TRANSITIONS.get(current, ())
+
+def booking_changed(
+    previous: tuple[uuid.UUID, datetime, datetime, str], transaction: Transaction
+) -> bool:
+    """
+    Whether an update moved the dates a booking holds: changed its listing
+    or dates, or made it active or inactive. `previous` is the listing_id,
+    start_date, end_date and status before the update.
+
+    Only such updates need the listing lock, the overlap check and a
+    calendar refresh; others rely on the transaction's version alone.
+    """
+    listing_id, start_date, end_date, status = previous
+    return (
+        (listing_id, start_date, end_date)
+        != (transaction.listing_id, transaction.start_date, transaction.end_date)
+        or (status in ACTIVE_BOOKING_STATUSES)
+        != (transaction.status in ACTIVE_BOOKING_STATUSES)
+    )
+
+def update_transaction(db: Session, transaction_id: uuid.UUID, transaction: TransactionUpdate) -> Transaction | None:
+    """
+    None if there's no such transaction. Raises InvalidStatusChange,
+    InvalidBookingDates, ListingNotFound if an active booking's listing was
+    deleted, BookingConflict if the update would double-book, or
+    TransactionModified if the transaction was changed concurrently.
+    """
     db_transaction = db.get(Transaction, transaction_id)
     if not db_transaction:
         return None
-    for key, value in transaction.dict(exclude_unset=True).items():
-        setattr(db_transaction, key, value)
-    db.add(db_transaction)
-    db.commit()
+    previous = (
+        db_transaction.listing_id,
+        db_transaction.start_date,
+        db_transaction.end_date,
+        db_transaction.status,
+    )
+    updated = transaction.model_dump(exclude_unset=True)
+    status = updated.get("status", db_transaction.status)
+    if not can_change_status(db_transaction.status, status):
+        raise InvalidStatusChange(db_transaction.status, status)
+    before = TransactionPublic.model_validate(db_transaction)
+    db_transaction.sqlmodel_update(updated)
+    if db_transaction.end_date <= db_transaction.start_date:
+        db.rollback()
+        raise InvalidBookingDates()
+    changed = booking_changed(previous, db_transaction)
+    try:
+        if changed:
+            # The listing may have been deleted since: a booking of it can
+            # still be canceled, but not made or kept active
+            listing_exists = lock_listing(db, previous[0]) is not None
+            if db_transaction.status in ACTIVE_BOOKING_STATUSES:
+                _check_booking(db, db_transaction)
+        db.add(db_transaction)
+        update_lender_earnings(db, before, -1)
+        update_lender_earnings(db, db_transaction)
+        if changed and listing_exists:
+            refresh_listing_calendar(db, *previous[:3])
+            refresh_listing_calendar(
+                db, db_transaction.listing_id, db_transaction.start_date, db_transaction.end_date
+            )
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise TransactionModified()
+    if changed:
+        invalidate_availability_caches()
     db.refresh(db_transaction)
     return db_transaction
 
-def delete_transaction(db: Session, transaction_id: uuid.UUID) -> Transaction:
+def delete_transaction(db: Session, transaction_id: uuid.UUID) -> Transaction | None:
+    """
+    None if there's no such transaction. Raises TransactionModified if it
+    was changed concurrently.
+    """
     db_transaction = db.get(Transaction, transaction_id)
     if not db_transaction:
         return None
-    db.delete(db_transaction)
+    # The listing may have been deleted since, taking its calendar with it
+    listing_exists = lock_listing(db, db_transaction.listing_id) is not None
+    try:
+        db.delete(db_transaction)
+        for user_id in transaction_participants(db_transaction):
+            update_user_stats(session=db, user_id=user_id, transaction_count=-1)
+        update_lender_earnings(db, db_transaction, -1)
+        if listing_exists:
+            refresh_listing_calendar(
+                db, db_transaction.listing_id, db_transaction.start_date, db_transaction.end_date
+            )
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise TransactionModified()
+    invalidate_availability_caches()
+    return db_transaction
+
+
+def conversation_conditions(user_id: uuid.UUID, other_id: uuid.UUID) -> List[Any]:
+    """
+    WHERE clauses of the messages between two users, whichever sent them.
+
+    Match ix_message_conversation_timestamp_id, so a page of a conversation
+    is one index range scan, where an OR of the two sender/receiver pairs
+    would have to read and sort every message of the conversation.
+    """
+    # uuid ordering is the same in Python and Postgres
+    user_a, user_b = sorted((user_id, other_id))
+    return [
+        func.least(Message.sender_id, Message.receiver_id) == user_a,
+        func.greatest(Message.sender_id, Message.receiver_id) == user_b,
+    ]
+
+
+def update_conversations(db: Session, message: Message) -> None:
+    """
+    Make `message` the last one of the sender's and the receiver's
+    Conversation rows, and count it as unread for the receiver.
+
+    Does not commit, like update_user_stats. A message that was committed
+    later but is older than the current last one only counts as unread.
+    """
+    preview = message.content[:CONVERSATION_PREVIEW_LENGTH]
+    rows = [
+        {
+            "user_id": user_id,
+            "other_id": other_id,
+            "last_message_id": message.id,
+            "last_sender_id": message.sender_id,
+            "last_message": preview,
+            "last_timestamp": message.timestamp,
+            "unread_count": int(user_id == message.receiver_id),
+        }
+        for user_id, other_id in {
+            (message.sender_id, message.receiver_id),
+            (message.receiver_id, message.sender_id),
+        }
+    ]
+    # Both rows in one statement, in key order, so concurrent messages in
+    # both directions lock them in the same order
+    rows.sort(key=lambda row: (row["user_id"], row["other_id"]))
+    statement = insert(Conversation).values(rows)
+    newer = statement.excluded.last_timestamp >= Conversation.last_timestamp
+    statement = statement.on_conflict_do_update(
+        index_elements=[Conversation.user_id, Conversation.other_id],
+        set_={
+            **{
+                field: case((newer, getattr(statement.excluded, field)), else_=getattr(Conversation, field))
+                for field in ("last_message_id", "last_sender_id", "last_message", "last_timestamp")
+            },
+            "unread_count": Conversation.unread_count + statement.excluded.unread_count,
+        },
+    )
+    db.execute(statement)
+
+
+def create_message(db: Session, message: MessageCreate, sender_id: uuid.UUID) -> Message:
+    """Raises MissingPartition if there's no partition for its timestamp."""
+    db_message = Message.model_validate(message, update={"sender_id": sender_id})
+    try:
+        db.add(db_message)
+        update_conversations(db, db_message)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_missing_partition(e):
+            raise MissingPartition() from e
+        raise
+    db.refresh(db_message)
+    return db_message
+
+
+def create_notification(db: Session, notification: NotificationCreate) -> Notification:
+    """Raises MissingPartition if there's no partition for its timestamp."""
+    db_notification = Notification.model_validate(notification)
+    try:
+        db.add(db_notification)
+        if not db_notification.is_read:
+            update_user_stats(
+                session=db, user_id=db_notification.user_id, unread_notification_count=1
+            )
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_missing_partition(e):
+            raise MissingPartition() from e
+        raise
+    db.refresh(db_notification)
+    return db_notification
+
+
+def mark_notification_read(db: Session, notification: Notification) -> Notification:
+    """
+    Only the transaction that actually flips is_read decrements the unread
+    count: a concurrent one blocks on the row lock, then matches no row.
+    """
+    result = db.execute(
+        update(Notification)
+        .where(
+            Notification.id == notification.id,
+            Notification.timestamp == notification.timestamp,
+            Notification.is_read.is_(False),
+        )
+        .values(is_read=True)
+    )
+    if result.rowcount:
+        update_user_stats(
+            session=db, user_id=notification.user_id, unread_notification_count=-1
+        )
+    db.commit()
+    db.refresh(notification)
+    return notification
+
+
+def notification_selection_conditions(
+    user_id: uuid.UUID, selection: NotificationSelection
+) -> List[Any]:
+    conditions = [Notification.user_id == user_id]
+    if selection.ids is not None:
+        conditions.append(Notification.id.in_(selection.ids))
+    if selection.before is not None:
+        conditions.append(Notification.timestamp < selection.before)
+    return conditions
+
+
+def mark_notifications_read(
+    db: Session, user_id: uuid.UUID, selection: NotificationSelection
+) -> int:
+    """
+    Mark the selected notifications of the user as read in one UPDATE.
+    Returns how many were unread, see mark_notification_read.
+    """
+    result = db.execute(
+        update(Notification)
+        .where(
+            *notification_selection_conditions(user_id, selection),
+            Notification.is_read.is_(False),
+        )
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        update_user_stats(
+            session=db, user_id=user_id, unread_notification_count=-result.rowcount
+        )
+    db.commit()
+    return result.rowcount
+
+
+def dismiss_notifications(
+    db: Session, user_id: uuid.UUID, selection: NotificationSelection
+) -> int:
+    """Delete the selected notifications of the user in one DELETE."""
+    result = db.execute(
+        delete(Notification)
+        .where(*notification_selection_conditions(user_id, selection))
+        .returning(Notification.is_read)
+        .execution_options(synchronize_session=False)
+    )
+    is_read = result.scalars().all()
+    unread = is_read.count(False)
+    if unread:
+        update_user_stats(
+            session=db, user_id=user_id, unread_notification_count=-unread
+        )
     db.commit()
-    return db_transaction
\ No newline at end of file
+    return len(is_read)
@@ -0,0 +1,232 @@
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Any
+
+from sqlalchemy import Engine, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app import utils
+from app.core.config import settings
+from app.models import NotificationDigest
+
+logger = logging.getLogger(__name__)
+
+# Held while digests are sent, so overlapping runs (e.g. a slow one and the
+# next cron tick) never email the same user twice
+ADVISORY_LOCK_KEY = 0x64696765
+
+# Users whose digests are loaded, sent and recorded together
+BATCH_SIZE = 500
+
+
+@dataclass
+class Digest:
+    user_id: uuid.UUID
+    email: str
+    # The newest of the user's pending notifications, up to
+    # NOTIFICATION_DIGEST_MAX_ITEMS, and how many are pending in all
+    notifications: list[Any]
+    count: int
+
+
+# The digests of the users with ids in (:after, :until], with their newest
+# notifications. A notification is pending when it is unread, created by
+# the cutoff, within the max age and after the user's last digest; a user
+# is due when their last digest was sent a window ago or more.
+# Both n."timestamp" > :oldest conditions are also there to prune the
+# notification partitions.
+DUE_DIGESTS = text(
+    """
+    WITH due AS (
+        SELECT u.id, u.email, greatest(:oldest, d.sent_until) AS since
+        FROM "user" u
+        LEFT JOIN notificationdigest d ON d.user_id = u.id
+        WHERE u.id > :after
+          AND u.id <= :until
+          AND u.is_active
+          AND (d.sent_at IS NULL OR d.sent_at <= :sent_before)
+          AND EXISTS (
+              SELECT 1 FROM notification n
+              WHERE n.user_id = u.id
+                AND NOT n.is_read
+                AND n."timestamp" > :oldest
+                AND n."timestamp" > greatest(:oldest, d.sent_until)
+                AND n."timestamp" <= :cutoff
+          )
+    )
+    SELECT due.id, due.email, latest.title, latest.message, pending.count AS pending
+    FROM due
+    CROSS JOIN LATERAL (
+        SELECT count(*) FROM notification n
+        WHERE n.user_id = due.id
+          AND NOT n.is_read
+          AND n."timestamp" > :oldest
+          AND n."timestamp" > due.since
+          AND n."timestamp" <= :cutoff
+    ) AS pending(count)
+    CROSS JOIN LATERAL (
+        SELECT n.title, n.message, n."timestamp" FROM notification n
+        WHERE n.user_id = due.id
+          AND NOT n.is_read
+          AND n."timestamp" > :oldest
+          AND n."timestamp" > due.since
+          AND n."timestamp" <= :cutoff
+        ORDER BY n."timestamp" DESC
+        LIMIT :max_items
+    ) AS latest
+    ORDER BY due.id, latest."timestamp" DESC
+    """
+)
+
+
+def due_digests(
+    engine: Engine, cutoff: datetime, after: uuid.UUID, batch_size: int
+) -> tuple[list[Digest], uuid.UUID | None]:
+    """
+    The digests due at `cutoff` among the next `batch_size` users after
+    `after` in id order, and the id of the last of those users, None when
+    there are no users left.
+
+    Batches are ranges of user ids rather than of due users, so each user
+    is looked at once per run however few are due.
+    """
+    with engine.connect() as connection:
+        until = connection.execute(
+            text(
+                """
+                SELECT id FROM (
+                    SELECT id FROM "user" WHERE id > :after ORDER BY id LIMIT :batch_size
+                ) AS batch
+                ORDER BY id DESC
+                LIMIT 1
+                """
+            ),
+            {"after": after, "batch_size": batch_size},
+        ).scalar()
+        if until is None:
+            return [], None
+        rows = connection.execute(
+            DUE_DIGESTS,
+            {
+                "after": after,
+                "until": until,
+                "cutoff": cutoff,
+                "oldest": cutoff
+                - timedelta(hours=settings.NOTIFICATION_DIGEST_MAX_AGE_HOURS),
+                "sent_before": cutoff
+                - timedelta(minutes=settings.NOTIFICATION_DIGEST_WINDOW_MINUTES),
+                "max_items": settings.NOTIFICATION_DIGEST_MAX_ITEMS,
+            },
+        ).all()
+    digests = []
+    for user_id, group in groupby(rows, key=lambda row: row.id):
+        notifications = list(group)
+        digests.append(
+            Digest(
+                user_id, notifications[0].email, notifications, notifications[0].pending
+            )
+        )
+    return digests, until
+
+
+def send_digest(digest: Digest, smtp: Any) -> bool:
+    """Email one digest through `smtp`. Returns whether it was sent."""
+    email_data = utils.generate_notification_digest_email(
+        email_to=digest.email,
+        notifications=digest.notifications,
+        count=digest.count,
+    )
+    try:
+        response = utils.send_email(
+            email_to=digest.email,
+            subject=email_data.subject,
+            html_content=email_data.html_content,
+            smtp=smtp,
+        )
+    except Exception:
+        logger.exception("Failed to send the notification digest of %s", digest.user_id)
+        return False
+    if not response.success:
+        logger.error(
+            "Failed to send the notification digest of %s: %s", digest.user_id, response
+        )
+        return False
+    return True
+
+
+def record_digests(engine: Engine, user_ids: list[uuid.UUID], cutoff: datetime) -> None:
+    if not user_ids:
+        return
+    with engine.begin() as connection:
+        statement = insert(NotificationDigest).values(
+            [
+                {"user_id": user_id, "sent_at": cutoff, "sent_until": cutoff}
+                for user_id in user_ids
+            ]
+        )
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={
+                    "sent_at": statement.excluded.sent_at,
+                    "sent_until": statement.excluded.sent_until,
+                },
+            )
+        )
+
+
+def send_digests(
+    engine: Engine, now: datetime | None = None, batch_size: int = BATCH_SIZE
+) -> int:
+    """
+    Email every due user one digest of their pending notifications, see
+    DUE_DIGESTS. Returns how many were sent.
+
+    Users are paged through in id order, so memory holds one batch whatever
+    the number of users and notifications, and no transaction stays open
+    while emails go out. All of them go through one SMTP connection. A
+    digest that fails to send is retried on the next run.
+    """
+    cutoff = now or datetime.utcnow()
+    sent = 0
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        if not lock.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}
+        ).scalar_one():
+            logger.info("Notification digests are already being sent")
+            return 0
+        smtp = utils.smtp_backend()
+        try:
+            after: uuid.UUID | None = uuid.UUID(int=0)
+            while after is not None:
+                digests, after = due_digests(engine, cutoff, after, batch_size)
+                delivered = [
+                    digest.user_id for digest in digests if send_digest(digest, smtp)
+                ]
+                record_digests(engine, delivered, cutoff)
+                sent += len(delivered)
+        finally:
+            smtp.close()
+            lock.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY}
+            )
+    return sent
+
+
+def main() -> None:
+    from app.core.db import engine
+
+    logging.basicConfig(level=logging.INFO)
+    if not settings.emails_enabled:
+        logger.info("Emails are not configured, no notification digests sent")
+        return
+    logger.info("Sending notification digests")
+    sent = send_digests(engine)
+    logger.info("Sent %d notification digests", sent)
+
+
+if __name__ == "__main__":
+    main()
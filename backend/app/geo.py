@@ -0,0 +1,117 @@
+import math
+from dataclasses import dataclass
+
+EARTH_RADIUS_KM = 6371.0088
+
+GEOHASH_PRECISION = 9
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Upper bound on the number of geohash cells used to cover a search area.
+# More cells means a tighter fit (fewer rows to recheck) but a longer OR list
+# of index range scans.
+MAX_COVERING_CELLS = 16
+
+
+@dataclass
+class BoundingBox:
+    min_latitude: float
+    min_longitude: float
+    max_latitude: float
+    max_longitude: float
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        interval, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def _cell_size(precision: int) -> tuple[float, float]:
+    """Height (degrees latitude) and width (degrees longitude) of a geohash cell."""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = math.floor(5 * precision / 2)
+    return 180.0 / 2**lat_bits, 360.0 / 2**lon_bits
+
+
+def _cell_range(low: float, high: float, origin: float, size: float, limit: int) -> range:
+    first = int((low - origin) // size)
+    last = min(int((high - origin) // size), limit - 1)
+    return range(first, last + 1)
+
+
+def covering_geohashes(box: BoundingBox) -> list[str]:
+    """
+    Geohash prefixes whose cells together cover `box`.
+
+    Picks the longest prefix length that needs at most MAX_COVERING_CELLS
+    cells. Returns an empty list when even single-character cells would
+    exceed that, in which case the box is too large for the index to help.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _cell_size(precision)
+        lat_cells = _cell_range(box.min_latitude, box.max_latitude, -90.0, height, round(180 / height))
+        lon_cells = _cell_range(box.min_longitude, box.max_longitude, -180.0, width, round(360 / width))
+        if len(lat_cells) * len(lon_cells) <= MAX_COVERING_CELLS:
+            return sorted(
+                {
+                    geohash_encode(
+                        -90.0 + (lat_cell + 0.5) * height,
+                        -180.0 + (lon_cell + 0.5) * width,
+                        precision,
+                    )
+                    for lat_cell in lat_cells
+                    for lon_cell in lon_cells
+                }
+            )
+    return []
+
+
+def split_antimeridian(box: BoundingBox) -> list[BoundingBox]:
+    """A box whose min_longitude is east of its max_longitude wraps around ±180."""
+    if box.min_longitude <= box.max_longitude:
+        return [box]
+    return [
+        BoundingBox(box.min_latitude, box.min_longitude, box.max_latitude, 180.0),
+        BoundingBox(box.min_latitude, -180.0, box.max_latitude, box.max_longitude),
+    ]
+
+
+def radius_bounding_boxes(latitude: float, longitude: float, radius_km: float) -> list[BoundingBox]:
+    """Boxes (one, or two across the antimeridian) enclosing a circle on the sphere."""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_latitude = latitude - lat_delta
+    max_latitude = latitude + lat_delta
+    if min_latitude <= -90.0 or max_latitude >= 90.0:
+        # The circle contains a pole: every longitude is in range
+        return [BoundingBox(max(min_latitude, -90.0), -180.0, min(max_latitude, 90.0), 180.0)]
+    lon_delta = math.degrees(
+        math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))))
+    )
+    min_longitude = longitude - lon_delta
+    max_longitude = longitude + lon_delta
+    if lon_delta >= 180.0 or max_longitude - min_longitude >= 360.0:
+        return [BoundingBox(min_latitude, -180.0, max_latitude, 180.0)]
+    if min_longitude < -180.0:
+        min_longitude += 360.0
+    if max_longitude > 180.0:
+        max_longitude -= 360.0
+    return split_antimeridian(BoundingBox(min_latitude, min_longitude, max_latitude, max_longitude))
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+# Accepted upload formats, told apart by their leading bytes so the request
+# path never has to decode an image
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "jpg",
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+}
+MEDIA_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+# Names of the files kept for an image: original.<ext>, a full-size WebP
+# re-encode and one WebP thumbnail per IMAGE_THUMBNAIL_SIZES entry
+VARIANT_NAME = re.compile(r"^(original\.(jpg|png|gif|webp)|full\.webp|w\d+\.webp)$")
+DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+def detect_format(head: bytes) -> str | None:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, extension in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def image_dir(digest: str) -> Path:
+    # Two levels of fan-out keep directory listings short
+    return Path(settings.IMAGE_STORAGE_DIR) / digest[:2] / digest
+
+
+def original_name(extension: str) -> str:
+    return f"original.{extension}"
+
+
+def variant_names() -> list[str]:
+    return ["full.webp", *(f"w{size}.webp" for size in settings.IMAGE_THUMBNAIL_SIZES)]
+
+
+def find_original(digest: str) -> str | None:
+    directory = image_dir(digest)
+    if not directory.is_dir():
+        return None
+    for entry in directory.iterdir():
+        if entry.name.startswith("original."):
+            return entry.name
+    return None
+
+
+def spool_upload(source: BinaryIO) -> tuple[Path, str, str]:
+    """
+    Copy `source` to a temporary file under IMAGE_STORAGE_DIR, hashing it on
+    the way.
+
+    Returns the temporary path, the SHA-256 hex digest and the detected
+    extension. Raises ImageTooLarge past IMAGE_MAX_UPLOAD_BYTES and
+    UnsupportedImage for anything that isn't a JPEG, PNG, GIF or WebP.
+    """
+    root = Path(settings.IMAGE_STORAGE_DIR)
+    root.mkdir(parents=True, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    head = b""
+    fd, name = tempfile.mkstemp(dir=root, prefix=".upload-")
+    path = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := source.read(_CHUNK_SIZE):
+                if len(head) < 16:
+                    head += chunk[: 16 - len(head)]
+                size += len(chunk)
+                if size > settings.IMAGE_MAX_UPLOAD_BYTES:
+                    raise ImageTooLarge()
+                hasher.update(chunk)
+                spool.write(chunk)
+        extension = detect_format(head)
+        if extension is None:
+            raise UnsupportedImage()
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path, hasher.hexdigest(), extension
+
+
+def render_variants(source: str, target_dir: str, sizes: list[int]) -> None:
+    """
+    Decode `source` and write full.webp plus one w<size>.webp thumbnail per
+    entry of `sizes` (longest side, never upscaled) into `target_dir`.
+
+    CPU-bound: runs in the image process pool, never on a request thread.
+    Raises UnsupportedImage if the file doesn't decode.
+    """
+    try:
+        with Image.open(source) as image:
+            image.load()
+            # Honour camera orientation, since EXIF is dropped from the WebPs
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            target = Path(target_dir)
+            image.save(target / "full.webp", "WEBP", quality=85, method=4)
+            for size in sizes:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+                thumbnail.save(target / f"w{size}.webp", "WEBP", quality=80, method=4)
+    except (OSError, Image.DecompressionBombError, ValueError) as e:
+        raise UnsupportedImage() from e
+
+
+def publish(spooled: Path, digest: str, extension: str) -> None:
+    """
+    Move a spooled upload, whose variants are already rendered into its
+    image directory, to its final content-addressed name.
+
+    The original is written last, so its presence means the image is
+    complete; a concurrent upload of the same bytes just replaces it with
+    identical content.
+    """
+    os.replace(spooled, image_dir(digest) / original_name(extension))
+
+
+def discard(spooled: Path, digest: str | None = None) -> None:
+    spooled.unlink(missing_ok=True)
+    if digest is not None and find_original(digest) is None:
+        shutil.rmtree(image_dir(digest), ignore_errors=True)
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_image_pool() -> ProcessPoolExecutor:
+    # Created lazily so each server worker process gets its own pool after
+    # the fork
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_WORKERS)
+    return _pool
+
+
+def reset_image_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Drop `pool` once it is broken, e.g. by a worker killed mid-render, so
+    the next get_image_pool() starts a fresh one instead of every upload
+    failing until the server restarts.
+    """
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
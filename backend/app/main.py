@@ -1,10 +1,20 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.routing import APIRoute
+from pydantic_core import to_json
+from sqlmodel import Session
 from starlette.middleware.cors import CORSMiddleware
 
+from app import crud
 from app.api.main import api_router
+from app.api.pagination import NEXT_CURSOR_HEADER
 from app.core.config import settings
+from app.core.db import engine
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,8 +24,18 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    # Build the autocomplete index in the background rather than in the
+    # first request that needs it
+    with Session(engine) as session:
+        crud.get_listing_autocomplete_index(session).start_loading()
+    yield
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
+    lifespan=lifespan,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
 )
@@ -30,6 +50,22 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER],
+    )
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(
+    _request: Request, exc: RequestValidationError
+) -> Response:
+    # Request bodies are parsed with json.loads, which accepts Infinity and
+    # NaN; the errors echo those inputs back, and JSONResponse refuses them
+    content = to_json(
+        {"detail": jsonable_encoder(exc.errors())}, inf_nan_mode="strings"
     )
+    return Response(
+        content=content, status_code=422, media_type="application/json"
+    )
+
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
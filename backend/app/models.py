@@ -1,8 +1,14 @@
-from datetime import datetime
+from datetime import date, datetime
 import uuid
-from typing import List, Optional
-from pydantic import AnyUrl, EmailStr
+from typing import Any, List, Literal, Optional
+from pydantic import AnyUrl, EmailStr, model_validator
+from sqlalchemy import Computed, Index, event, text
+from sqlalchemy.orm import declared_attr
+from sqlalchemy.dialects.postgresql import BIT, TSVECTOR
 from sqlmodel import Field, Relationship, SQLModel, JSON, Column
+from typing_extensions import Self
+
+from app.geo import geohash_encode
 
 
 # Shared properties
@@ -47,6 +53,20 @@ class User(UserBase, table=True):
     items: list["Item"] = Relationship(back_populates="owner")
 
 
+# Per-user row counts maintained by the write paths in crud.py and the API
+# routes, so list endpoints don't need a COUNT(*) on every page
+class UserStats(SQLModel, table=True):
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", primary_key=True, ondelete="CASCADE"
+    )
+    item_count: int = 0
+    listing_count: int = 0
+    # Transactions where the user is the renter or the lender
+    transaction_count: int = 0
+    # Notifications with is_read false, for the unread badge
+    unread_notification_count: int = 0
+
+
 # Properties to return via API, id is always required
 class UserPublic(UserBase):
     id: uuid.UUID
@@ -55,6 +75,7 @@ class UserPublic(UserBase):
 class UsersPublic(SQLModel):
     data: list[UserPublic]
     count: int
+    next_cursor: str | None = None
 
 
 # Shared properties
@@ -75,6 +96,8 @@ class ItemUpdate(ItemBase):
 
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    __table_args__ = (Index("ix_item_owner_id_id", "owner_id", "id"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     title: str = Field(max_length=255)
     owner_id: uuid.UUID = Field(foreign_key="user.id", nullable=False)
@@ -90,6 +113,7 @@ class ItemPublic(ItemBase):
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
     count: int
+    next_cursor: str | None = None
 
 
 # Generic message
@@ -108,6 +132,24 @@ class TokenPayload(SQLModel):
     sub: str | None = None
 
 
+class CacheStats(SQLModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+class ImagePublic(SQLModel):
+    digest: str  # SHA-256 of the original's bytes
+    url: str
+    # WebP renditions by name: "full" and "w<size>" thumbnails
+    variants: dict[str, str]
+    # The same bytes had been uploaded before
+    duplicate: bool
+
+
 class NewPassword(SQLModel):
     token: str
     new_password: str = Field(min_length=8, max_length=40)
@@ -118,6 +160,8 @@ class ListingBase(SQLModel):
     price: Optional[float] = Field(default=None)
     category: Optional[str] = Field(default=None, max_length=255)
     location: Optional[str] = Field(default=None, max_length=255)
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
     images: Optional[List[AnyUrl]] = Field(default=None, sa_column=Column(JSON))  # Use JSON type for images
     class Config:
         arbitrary_types_allowed = True
@@ -131,13 +175,50 @@ class ListingUpdate(SQLModel):
     price: Optional[float] = Field(default=None)
     category: Optional[str] = Field(default=None, max_length=255)
     location: Optional[str] = Field(default=None, max_length=255)
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
     images: Optional[List[AnyUrl]] = Field(default=None, sa_column=Column(JSON))
     class Config:
         arbitrary_types_allowed = True
 
+# Weighted full-text document for listings: title ranks above category, which
+# ranks above description. Postgres keeps the generated column up to date on
+# every INSERT/UPDATE, so there is nothing for the application to maintain.
+LISTING_SEARCH_CONFIG = "english"
+LISTING_SEARCH_VECTOR = (
+    f"setweight(to_tsvector('{LISTING_SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{LISTING_SEARCH_CONFIG}', coalesce(category, '')), 'B') || "
+    f"setweight(to_tsvector('{LISTING_SEARCH_CONFIG}', coalesce(description, '')), 'C')"
+)
+
 class Listing(ListingBase, table=True):
+    __table_args__ = (
+        Index("ix_listing_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_listing_owner_id_id", "owner_id", "id"),
+        Index(
+            "ix_listing_geohash",
+            "geohash",
+            postgresql_ops={"geohash": "varchar_pattern_ops"},
+        ),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     owner_id: uuid.UUID = Field(foreign_key="user.id", nullable=False)
+    search_vector: Optional[str] = Field(
+        default=None,
+        sa_column=Column(TSVECTOR, Computed(LISTING_SEARCH_VECTOR, persisted=True)),
+    )
+    # Derived from latitude/longitude on every flush, see _set_listing_geohash
+    geohash: Optional[str] = Field(default=None, max_length=12)
+
+
+@event.listens_for(Listing, "before_insert")
+@event.listens_for(Listing, "before_update")
+def _set_listing_geohash(_mapper: Any, _connection: Any, listing: Listing) -> None:
+    if listing.latitude is None or listing.longitude is None:
+        listing.geohash = None
+    else:
+        listing.geohash = geohash_encode(listing.latitude, listing.longitude)
 
 class ListingPublic(ListingBase):
     id: uuid.UUID
@@ -146,6 +227,7 @@ class ListingPublic(ListingBase):
 class ListingsPublic(SQLModel):
     data: List[ListingPublic]
     count: int
+    next_cursor: Optional[str] = None
 
 
 class TransactionBase(SQLModel):
@@ -158,7 +240,15 @@ class TransactionBase(SQLModel):
     status: str  # e.g., "pending", "approved", "completed", "canceled"
 
 class TransactionCreate(TransactionBase):
-    pass
+    # Every booking starts out pending and moves on through updates, see
+    # TRANSACTION_STATUS_TRANSITIONS
+    status: Literal["pending"] = "pending"
+
+    @model_validator(mode="after")
+    def _check_dates(self) -> Self:
+        if self.end_date <= self.start_date:
+            raise ValueError("end_date must be after start_date")
+        return self
 
 class TransactionUpdate(SQLModel):
     status: Optional[str] = None
@@ -166,22 +256,187 @@ class TransactionUpdate(SQLModel):
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
 
+# Bookings in these states hold their dates: no other active booking of the
+# same listing may overlap them
+ACTIVE_BOOKING_STATUSES = ("pending", "approved")
+
+# The statuses a transaction may move to from each status. Completed and
+# canceled transactions are final.
+TRANSACTION_STATUS_TRANSITIONS: dict[str, tuple[str, ...]] = {
+    "pending": ("approved", "canceled"),
+    "approved": ("completed", "canceled"),
+    "completed": (),
+    "canceled": (),
+}
+
+# Which side of a transaction to list a user's transactions from
+TransactionRole = Literal["renter", "lender", "both"]
+
 class Transaction(TransactionBase, table=True):
+    __table_args__ = (
+        # One per participant role, matching the newest-first listing order
+        Index("ix_transaction_renter_id_created_at_id", "renter_id", "created_at", "id"),
+        Index("ix_transaction_lender_id_created_at_id", "lender_id", "created_at", "id"),
+        # Overlap checks only look at a listing's active bookings that end
+        # after the new start, however long its history gets
+        Index(
+            "ix_transaction_listing_id_end_date_active",
+            "listing_id",
+            "end_date",
+            postgresql_where=text("status IN ('pending', 'approved')"),
+        ),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Bumped on every UPDATE, which only applies if the row still has the
+    # version it was read with (SQLAlchemy raises StaleDataError otherwise)
+    version: int = Field(default=1)
+
+    @declared_attr
+    def __mapper_args__(cls) -> dict[str, Any]:
+        return {"version_id_col": cls.__table__.c.version}
+
+# One row per listing and calendar year with any active booking. Bit n
+# (0-based, from the left) is set when the listing is booked on day n of
+# the year. Rebuilt from the listing's bookings on every transaction write,
+# see crud.refresh_listing_calendar.
+CALENDAR_DAYS = 366
+
+class ListingCalendar(SQLModel, table=True):
+    listing_id: uuid.UUID = Field(
+        foreign_key="listing.id", primary_key=True, ondelete="CASCADE"
+    )
+    year: int = Field(primary_key=True)
+    booked: str = Field(sa_column=Column(BIT(CALENDAR_DAYS), nullable=False))
 
 class TransactionPublic(TransactionBase):
     id: uuid.UUID
+    created_at: datetime
+    version: int
 
 class TransactionsPublic(SQLModel):
     data: list[TransactionPublic]
     count: int
+    next_cursor: Optional[str] = None
+
+# Per lender and day, the completed and canceled transactions ending that
+# day and the total_price of the completed ones. Kept up to date by every
+# transaction write (crud.update_lender_earnings), so a lender's stats
+# are read from at most one row per day instead of their whole history.
+class LenderEarnings(SQLModel, table=True):
+    # Not a foreign key, like Transaction.lender_id
+    lender_id: uuid.UUID = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+    completed_count: int = 0
+    canceled_count: int = 0
+    earnings: float = 0
+
+EarningsPeriod = Literal["day", "month"]
+
+class EarningsBucket(SQLModel):
+    # First day of the day or month
+    start: date
+    completed_count: int
+    canceled_count: int
+    earnings: float
+
+class TransactionStats(SQLModel):
+    data: list[EarningsBucket]
+    completed_count: int
+    canceled_count: int
+    earnings: float
 
 class ListingSearch(SQLModel):
+    # Full-text query over title, category and description; results are
+    # ranked by relevance when set
+    q: Optional[str] = Field(default=None, max_length=255)
     title: Optional[str] = None
     category: Optional[str] = None
     location: Optional[str] = None
     min_price: Optional[float] = None
     max_price: Optional[float] = None
+    # Radius search around a point; results are ordered by distance
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+    radius_km: Optional[float] = Field(default=None, gt=0, le=1000)
+    # Bounding-box search; min_longitude > max_longitude crosses the antimeridian
+    min_latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    max_latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    min_longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+    max_longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+    # Only listings with no pending or approved booking on any day from
+    # available_from up to, not including, available_to
+    available_from: Optional[date] = None
+    available_to: Optional[date] = None
+    skip: int = Field(default=0, ge=0)
+    limit: int = Field(default=100, ge=1, le=100)
+    # Also return category/location counts and a price histogram for the
+    # whole result set, not just the page
+    facets: bool = False
+    # Inlined into the facet query's SQL, so kept to finite, sane sizes
+    price_bucket_size: float = Field(
+        default=50, ge=0.01, le=1_000_000, schema_extra={"allow_inf_nan": False}
+    )
+
+    @model_validator(mode="after")
+    def _check_geo_filters(self) -> Self:
+        point = (self.latitude, self.longitude)
+        if self.radius_km is not None and None in point:
+            raise ValueError("radius_km requires latitude and longitude")
+        if any(value is not None for value in point) and None in point:
+            raise ValueError("latitude and longitude must be given together")
+        box = (self.min_latitude, self.max_latitude, self.min_longitude, self.max_longitude)
+        if any(value is not None for value in box):
+            if None in box:
+                raise ValueError(
+                    "min_latitude, max_latitude, min_longitude and max_longitude "
+                    "must be given together"
+                )
+            if self.min_latitude > self.max_latitude:  # type: ignore[operator]
+                raise ValueError("min_latitude must not exceed max_latitude")
+        window = (self.available_from, self.available_to)
+        if any(value is not None for value in window):
+            if None in window:
+                raise ValueError("available_from and available_to must be given together")
+            if self.available_to <= self.available_from:  # type: ignore[operator]
+                raise ValueError("available_to must be after available_from")
+            if (self.available_to - self.available_from).days > CALENDAR_DAYS:  # type: ignore[operator]
+                raise ValueError(f"The availability window is limited to {CALENDAR_DAYS} days")
+        return self
+
+class ListingSuggestion(SQLModel):
+    text: str
+    # Listings with this title or category
+    count: int
+
+class ListingImportError(SQLModel):
+    row: int  # 1-based data row, not counting the CSV header
+    errors: list[str]
+
+class ListingImportReport(SQLModel):
+    imported: int
+    failed: int
+    # Capped at LISTING_IMPORT_MAX_ERRORS; `failed` has the full count
+    errors: list[ListingImportError]
+
+class FacetCount(SQLModel):
+    value: str
+    count: int
+
+class PriceBucket(SQLModel):
+    min_price: float
+    max_price: float
+    count: int
+
+class ListingFacets(SQLModel):
+    categories: list[FacetCount]
+    locations: list[FacetCount]
+    price_buckets: list[PriceBucket]
+
+class ListingSearchResults(SQLModel):
+    data: List[ListingPublic]
+    facets: ListingFacets
 
 class MessageBase(SQLModel):
     sender_id: uuid.UUID
@@ -193,11 +448,64 @@ class MessageCreate(MessageBase):
     pass
 
 class Message(MessageBase, table=True):
+    __table_args__ = (
+        # A conversation's messages in order, keyed on the two users sorted
+        # so both directions share one range (crud.conversation_conditions)
+        Index(
+            "ix_message_conversation_timestamp_id",
+            text("LEAST(sender_id, receiver_id)"),
+            text("GREATEST(sender_id, receiver_id)"),
+            "timestamp",
+            "id",
+        ),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # Partitioned by month, see app/partitions.py. A primary key has to
+    # include the partition key, but id alone identifies a message.
+    timestamp: datetime = Field(default_factory=datetime.utcnow, primary_key=True)
+
+    @declared_attr
+    def __mapper_args__(cls) -> dict[str, Any]:
+        return {"primary_key": [cls.__table__.c.id]}
 
 class MessagePublic(MessageBase):
     id: uuid.UUID
 
+CONVERSATION_PREVIEW_LENGTH = 255
+
+# One row per user and conversation partner, with the latest message between
+# them and how many the user hasn't read. Upserted with every message sent
+# (crud.update_conversations), so the inbox is one index range scan rather
+# than a GROUP BY over all of the user's messages.
+class Conversation(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_conversation_user_id_last_timestamp_other_id",
+            "user_id",
+            "last_timestamp",
+            "other_id",
+        ),
+    )
+
+    user_id: uuid.UUID = Field(primary_key=True)
+    other_id: uuid.UUID = Field(primary_key=True)
+    last_message_id: uuid.UUID
+    last_sender_id: uuid.UUID
+    # Start of the message's content
+    last_message: str = Field(max_length=CONVERSATION_PREVIEW_LENGTH)
+    last_timestamp: datetime
+    unread_count: int = 0
+
+class ConversationPublic(SQLModel):
+    other_id: uuid.UUID
+    last_message_id: uuid.UUID
+    last_sender_id: uuid.UUID
+    last_message: str
+    last_timestamp: datetime
+    unread_count: int
+
 class ReviewBase(SQLModel):
     reviewer_id: uuid.UUID
     reviewee_id: uuid.UUID
@@ -210,6 +518,11 @@ class ReviewCreate(ReviewBase):
     pass
 
 class Review(ReviewBase, table=True):
+    __table_args__ = (
+        Index("ix_review_listing_id_timestamp_id", "listing_id", "timestamp", "id"),
+        Index("ix_review_reviewee_id_timestamp_id", "reviewee_id", "timestamp", "id"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
 
 class ReviewPublic(ReviewBase):
@@ -226,7 +539,18 @@ class NotificationCreate(NotificationBase):
     pass
 
 class Notification(NotificationBase, table=True):
+    __table_args__ = (
+        Index("ix_notification_user_id_timestamp_id", "user_id", "timestamp", "id"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # Partitioned by month like Message
+    timestamp: datetime = Field(default_factory=datetime.utcnow, primary_key=True)
+
+    @declared_attr
+    def __mapper_args__(cls) -> dict[str, Any]:
+        return {"primary_key": [cls.__table__.c.id]}
 
 class NotificationPublic(NotificationBase):
     id: uuid.UUID
@@ -235,6 +559,81 @@ class NotificationsPublic(SQLModel):
     data: list[NotificationPublic]
     count: int
 
+class UnreadNotificationCount(SQLModel):
+    count: int
+
+# Most notification ids one bulk operation takes
+MAX_BULK_NOTIFICATIONS = 1000
+
+class NotificationSelection(SQLModel):
+    # The current user's notifications with these ids, created before
+    # `before`, or both
+    ids: Optional[List[uuid.UUID]] = Field(default=None, max_length=MAX_BULK_NOTIFICATIONS)
+    before: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def _check_selection(self) -> Self:
+        if self.ids is None and self.before is None:
+            raise ValueError("ids or before is required")
+        return self
+
+class NotificationsChanged(SQLModel):
+    count: int
+
+# "all": every active user; "listing_category": active users with a listing
+# in `category`
+BroadcastAudience = Literal["all", "listing_category"]
+
+class NotificationBroadcastBase(SQLModel):
+    title: str
+    message: str
+    category: Optional[str] = Field(default=None, max_length=255)
+
+class NotificationBroadcastCreate(NotificationBroadcastBase):
+    audience: BroadcastAudience = "all"
+
+    @model_validator(mode="after")
+    def _check_audience(self) -> Self:
+        if (self.audience == "listing_category") != (self.category is not None):
+            raise ValueError("category is required for, and only for, the listing_category audience")
+        return self
+
+# A notification sent to every user of an audience by app/broadcasts.py, in
+# chunks of users ordered by id
+class NotificationBroadcast(NotificationBroadcastBase, table=True):
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    audience: str
+    created_by: uuid.UUID
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    status: str = Field(default="pending")  # "pending", "running", "completed" or "failed"
+    # Audience size when the broadcast was created, and notifications
+    # inserted so far
+    total: int = 0
+    sent: int = 0
+    # Last user of the last chunk sent, where a resumed broadcast continues
+    last_user_id: Optional[uuid.UUID] = None
+
+class NotificationBroadcastPublic(NotificationBroadcastBase):
+    id: uuid.UUID
+    audience: str
+    created_by: uuid.UUID
+    created_at: datetime
+    finished_at: Optional[datetime]
+    status: str
+    total: int
+    sent: int
+
+# Where the notification digest emails of a user stand, see app/digests.py
+class NotificationDigest(SQLModel, table=True):
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", primary_key=True, ondelete="CASCADE"
+    )
+    # When the last digest was sent, and the creation time up to which its
+    # notifications were included
+    sent_at: datetime
+    sent_until: datetime
+
 class ReportBase(SQLModel):
     reporter_id: uuid.UUID
     reported_user_id: uuid.UUID
@@ -250,6 +649,16 @@ class ReportUpdate(SQLModel):
     status: Optional[str] = None
 
 class Report(ReportBase, table=True):
+    __table_args__ = (
+        Index("ix_report_reporter_id_timestamp_id", "reporter_id", "timestamp", "id"),
+        Index(
+            "ix_report_reported_user_id_timestamp_id",
+            "reported_user_id",
+            "timestamp",
+            "id",
+        ),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
 
 class ReportPublic(ReportBase):
@@ -0,0 +1,206 @@
+import logging
+import re
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from psycopg.errors import CheckViolation
+from sqlalchemy import Connection, Engine, text
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Held while partitions are created or dropped, so concurrent runs (e.g. the
+# prestart of several containers) take turns
+ADVISORY_LOCK_KEY = 0x70617274
+
+PARTITION_NAME = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+class MissingPartition(Exception):
+    """A row falls in a month its table has no partition for."""
+
+
+TIMESTAMP_OUT_OF_RANGE = "timestamp is outside the months that can be stored"
+
+
+def is_missing_partition(error: DBAPIError) -> bool:
+    # Postgres reports it as a check violation, but unlike a failed CHECK
+    # constraint it names none
+    return (
+        isinstance(error.orig, CheckViolation)
+        and error.orig.diag.constraint_name is None
+    )
+
+
+@dataclass
+class PartitionedTable:
+    """
+    A table range-partitioned by month on `column`, see the migration that
+    partitions it. Partitions are named <name>_y<YYYY>m<MM>.
+    """
+
+    name: str
+    column: str
+    retention_months: int | None
+    # Runs in the transaction that drops a partition, after it is detached
+    before_drop: Callable[[Connection, str], None] | None = None
+
+
+def _forget_notifications(connection: Connection, partition: str) -> None:
+    # Keep UserStats.unread_notification_count equal to the unread ones left
+    connection.execute(
+        text(
+            f"""
+            UPDATE userstats
+            SET unread_notification_count =
+                userstats.unread_notification_count - dropped.count
+            FROM (
+                SELECT user_id, count(*) AS count
+                FROM "{partition}"
+                WHERE NOT is_read
+                GROUP BY user_id
+            ) AS dropped
+            WHERE userstats.user_id = dropped.user_id
+            """
+        )
+    )
+
+
+def partitioned_tables() -> list[PartitionedTable]:
+    return [
+        PartitionedTable("message", "timestamp", settings.MESSAGE_RETENTION_MONTHS),
+        PartitionedTable(
+            "notification",
+            "timestamp",
+            settings.NOTIFICATION_RETENTION_MONTHS,
+            before_drop=_forget_notifications,
+        ),
+    ]
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def create_partition(connection: Connection, table: str, month: date) -> None:
+    """Create the partition of `table` holding the month starting `month`."""
+    connection.execute(
+        text(
+            f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" '
+            f'PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+        )
+    )
+
+
+def list_partitions(connection: Connection, table: str) -> list[tuple[str, date, bool]]:
+    """
+    The monthly partitions of `table`: their name, first day and whether a
+    concurrent detach of them was interrupted.
+    """
+    rows = connection.execute(
+        text(
+            """
+            SELECT c.relname, i.inhdetachpending
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(:table)
+            ORDER BY c.relname
+            """
+        ),
+        {"table": f'"{table}"'},
+    )
+    partitions = []
+    for name, detach_pending in rows:
+        match = PARTITION_NAME.search(name)
+        if match:
+            month = date(int(match[1]), int(match[2]), 1)
+            partitions.append((name, month, detach_pending))
+    return partitions
+
+
+def drop_partition(
+    engine: Engine, table: PartitionedTable, name: str, detach_pending: bool = False
+) -> None:
+    """
+    Detach a partition without blocking reads and writes of the rest of the
+    table, then drop it. Much cheaper than a DELETE of its rows, and leaves
+    no dead tuples behind.
+    """
+    # DETACH ... CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        mode = "FINALIZE" if detach_pending else "CONCURRENTLY"
+        connection.execute(
+            text(f'ALTER TABLE "{table.name}" DETACH PARTITION "{name}" {mode}')
+        )
+    with engine.begin() as connection:
+        if table.before_drop is not None:
+            table.before_drop(connection, name)
+        connection.execute(text(f'DROP TABLE "{name}"'))
+
+
+def create_partitions(engine: Engine, today: date | None = None) -> None:
+    """
+    Make sure the partitions from the current month through
+    PARTITION_PREMAKE_MONTHS months ahead exist, so inserts never miss one.
+    """
+    current = (today or datetime.utcnow().date()).replace(day=1)
+    with engine.begin() as connection:
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY}
+        )
+        for table in partitioned_tables():
+            for months in range(settings.PARTITION_PREMAKE_MONTHS + 1):
+                create_partition(connection, table.name, add_months(current, months))
+
+
+def drop_expired_partitions(engine: Engine, today: date | None = None) -> list[str]:
+    """
+    Drop the partitions whose whole month is older than their table's
+    retention, counted from the start of the current month. Returns their
+    names.
+    """
+    current = (today or datetime.utcnow().date()).replace(day=1)
+    dropped = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        try:
+            for table in partitioned_tables():
+                if table.retention_months is None:
+                    continue
+                cutoff = add_months(current, -table.retention_months)
+                for name, month, detach_pending in list_partitions(lock, table.name):
+                    if add_months(month, 1) <= cutoff:
+                        drop_partition(engine, table, name, detach_pending)
+                        dropped.append(name)
+        finally:
+            lock.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY}
+            )
+    return dropped
+
+
+def maintain_partitions(engine: Engine, today: date | None = None) -> None:
+    create_partitions(engine, today)
+    for name in drop_expired_partitions(engine, today):
+        logger.info("Dropped expired partition %s", name)
+
+
+def main() -> None:
+    from app.core.db import engine
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Maintaining partitions")
+    maintain_partitions(engine)
+    logger.info("Partitions maintained")
+
+
+if __name__ == "__main__":
+    main()
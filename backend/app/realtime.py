@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections.abc import Callable, Iterable, Sequence
+from typing import Any, Protocol
+
+import psycopg
+from sqlalchemy import Engine, text
+
+from app.core.config import settings
+from app.models import (
+    CONVERSATION_PREVIEW_LENGTH,
+    Message,
+    MessagePublic,
+    Notification,
+    NotificationPublic,
+)
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel the events of every topic go through
+CHANNEL = "realtime"
+# NOTIFY payloads are limited to 8000 bytes, topic included
+MAX_EVENT_BYTES = 7000
+
+Deliver = Callable[[str, str], None]
+
+
+class Subscription:
+    """
+    The events of one topic for one consumer, buffered up to `maxsize`.
+
+    A consumer that falls further behind neither holds up publishers nor
+    grows memory without bound: its backlog is dropped, `overflowed` is set
+    and get() returns None from then on.
+    """
+
+    def __init__(self, topic: str, maxsize: int) -> None:
+        self.topic = topic
+        self.overflowed = asyncio.Event()
+        # One more slot for the None telling the consumer it overflowed
+        self._queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize + 1)
+        self._maxsize = maxsize
+
+    def put(self, payload: str) -> None:
+        if self.overflowed.is_set():
+            return
+        if self._queue.qsize() < self._maxsize:
+            self._queue.put_nowait(payload)
+            return
+        self.overflowed.set()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def get(self) -> str | None:
+        return await self._queue.get()
+
+
+class Backend(Protocol):
+    """Carries published events to the hubs of every worker, see Hub."""
+
+    async def start(self, deliver: Deliver) -> None: ...
+
+    def publish(self, topic: str, payload: str) -> None: ...
+
+    def publish_many(self, events: Sequence[tuple[str, str]]) -> None: ...
+
+
+class LocalBackend:
+    """Delivers events to this worker only, for single worker deployments."""
+
+    def __init__(self) -> None:
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._deliver: Deliver | None = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._deliver = deliver
+
+    def publish(self, topic: str, payload: str) -> None:
+        if self._loop is None or self._deliver is None or self._loop.is_closed():
+            return  # nobody subscribed yet
+        self._loop.call_soon_threadsafe(self._deliver, topic, payload)
+
+    def publish_many(self, events: Sequence[tuple[str, str]]) -> None:
+        for topic, payload in events:
+            self.publish(topic, payload)
+
+
+class PostgresBackend:
+    """
+    Relays events between workers with NOTIFY, which the database sends to
+    one LISTEN connection per worker that has subscribers.
+
+    Events published while the listener reconnects are lost; clients catch
+    up from the message history when they reconnect.
+    """
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+        self._task: asyncio.Task[None] | None = None
+
+    async def start(self, deliver: Deliver) -> None:
+        listening = asyncio.Event()
+        self._task = asyncio.create_task(self._listen(deliver, listening))
+        await listening.wait()
+
+    async def _listen(self, deliver: Deliver, listening: asyncio.Event) -> None:
+        conninfo = self.engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    conninfo, autocommit=True
+                ) as connection:
+                    await connection.execute(f"LISTEN {CHANNEL}")
+                    listening.set()
+                    async for notify in connection.notifies():
+                        topic, _, payload = notify.payload.partition(" ")
+                        deliver(topic, payload)
+            except psycopg.OperationalError:
+                logger.exception("Lost the %s listener connection", CHANNEL)
+                await asyncio.sleep(1)
+
+    def publish(self, topic: str, payload: str) -> None:
+        self.publish_many([(topic, payload)])
+
+    def publish_many(self, events: Sequence[tuple[str, str]]) -> None:
+        # One round trip for all of them. The events go as one JSON array:
+        # as a text[] parameter, psycopg escapes the quotes of every payload
+        # in Python, which costs more than the round trip
+        if not events:
+            return
+        with self.engine.connect() as connection:
+            connection.execute(
+                text(
+                    "SELECT pg_notify(:channel, event) "
+                    "FROM json_array_elements_text(CAST(:events AS json)) AS event"
+                ),
+                {
+                    "channel": CHANNEL,
+                    "events": json.dumps(
+                        [f"{topic} {payload}" for topic, payload in events]
+                    ),
+                },
+            )
+            connection.commit()
+
+
+class Hub:
+    """
+    In-process pub/sub between request handlers and the WebSocket
+    connections of this worker. Each connection subscribes to a topic, and
+    publish() reaches the subscribers of that topic on every worker through
+    the backend.
+
+    The backend starts with the first subscription, on the event loop of
+    the worker serving it. publish() may be called from any thread.
+    """
+
+    def __init__(self, backend: Backend, queue_size: int) -> None:
+        self.backend = backend
+        self.queue_size = queue_size
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._started: asyncio.Task[None] | None = None
+
+    async def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._started is None or self._loop is not loop:
+            self._loop = loop
+            self._started = loop.create_task(self.backend.start(self.deliver))
+        await asyncio.shield(self._started)
+
+    async def subscribe(self, topic: str) -> Subscription:
+        await self._ensure_started()
+        subscription = Subscription(topic, self.queue_size)
+        self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.topic)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.topic]
+
+    def deliver(self, topic: str, payload: str) -> None:
+        for subscription in list(self._subscriptions.get(topic, ())):
+            subscription.put(payload)
+
+    def publish(self, topic: str, payload: str) -> None:
+        # Best-effort: callers publish what they already committed, and
+        # clients catch up from the history when they reconnect
+        try:
+            self.backend.publish(topic, payload)
+        except Exception:
+            logger.exception("Could not publish an event to %s", topic)
+
+    def publish_many(self, events: Sequence[tuple[str, str]]) -> None:
+        """Like publish() for each event, in one go where the backend can."""
+        try:
+            self.backend.publish_many(events)
+        except Exception:
+            logger.exception("Could not publish %d events", len(events))
+
+
+def message_topic(user_id: uuid.UUID) -> str:
+    return f"messages:{user_id}"
+
+
+def notification_topic(user_id: uuid.UUID) -> str:
+    return f"notifications:{user_id}"
+
+
+def _create_hub() -> Hub:
+    backend: Backend
+    if settings.REALTIME_BACKEND == "postgres":
+        from app.core.db import engine
+
+        backend = PostgresBackend(engine)
+    else:
+        backend = LocalBackend()
+    return Hub(backend, settings.REALTIME_QUEUE_SIZE)
+
+
+hub = _create_hub()
+
+
+def publish_message(message: Message) -> None:
+    """
+    Push a committed message to its sender's and receiver's connections.
+    Content too long for one event is cut to a preview and the event marked
+    `truncated`; the full message is in the conversation history.
+    """
+    event: dict[str, Any] = {
+        "type": "message",
+        "message": MessagePublic.model_validate(message).model_dump(mode="json"),
+    }
+    payload = json.dumps(event)
+    if len(payload.encode()) > MAX_EVENT_BYTES:
+        event["message"]["content"] = message.content[:CONVERSATION_PREVIEW_LENGTH]
+        event["truncated"] = True
+        payload = json.dumps(event)
+    for user_id in {message.sender_id, message.receiver_id}:
+        hub.publish(message_topic(user_id), payload)
+
+
+def _notification_payload(notification: Notification | NotificationPublic) -> str:
+    if not isinstance(notification, NotificationPublic):
+        notification = NotificationPublic.model_validate(notification)
+    # Serialized by pydantic rather than through a dict and json.dumps,
+    # which is several times slower for the thousands of a broadcast chunk
+    payload = (
+        f'{{"type":"notification","notification":{notification.model_dump_json()}}}'
+    )
+    if len(payload.encode()) <= MAX_EVENT_BYTES:
+        return payload
+    event: dict[str, Any] = {
+        "type": "notification",
+        "notification": notification.model_dump(mode="json"),
+        "truncated": True,
+    }
+    for field in ("title", "message"):
+        event["notification"][field] = getattr(notification, field)[
+            :CONVERSATION_PREVIEW_LENGTH
+        ]
+    return json.dumps(event)
+
+
+def publish_notification(notification: Notification) -> None:
+    """
+    Push a committed notification to its user's event streams, with a long
+    `title` and `message` cut like publish_message does.
+    """
+    hub.publish(
+        notification_topic(notification.user_id), _notification_payload(notification)
+    )
+
+
+def publish_notifications(notifications: Iterable[NotificationPublic]) -> None:
+    """
+    publish_notification for many notifications at once, e.g. a broadcast.
+    Takes NotificationPublic, which is much cheaper to build in bulk than
+    the Notification table model.
+    """
+    hub.publish_many(
+        [
+            (notification_topic(notification.user_id), _notification_payload(notification))
+            for notification in notifications
+        ]
+    )
@@ -0,0 +1,119 @@
+import io
+import os
+import random
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import images
+from app.core.config import settings
+
+
+def random_png(width: int = 1600, height: int = 900) -> bytes:
+    image = Image.new("RGB", (width, height), tuple(random.randbytes(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_upload_image_renders_variants(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/images/",
+        headers=normal_user_token_headers,
+        files={"file": ("photo.png", random_png(), "image/png")},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["duplicate"] is False
+    assert content["url"].endswith(f"/images/{content['digest']}/original.png")
+    assert set(content["variants"]) == {"full", "w256", "w1024"}
+
+    response = client.get(content["variants"]["w256"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "immutable" in response.headers["cache-control"]
+    assert Image.open(io.BytesIO(response.content)).size == (256, 144)
+
+
+def test_upload_image_duplicate_stored_once(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    body = random_png(64, 64)
+    first = client.post(
+        f"{settings.API_V1_STR}/images/",
+        headers=normal_user_token_headers,
+        files={"file": ("a.png", body, "image/png")},
+    ).json()
+    second = client.post(
+        f"{settings.API_V1_STR}/images/",
+        headers=normal_user_token_headers,
+        files={"file": ("b.png", body, "image/png")},
+    ).json()
+    assert second["digest"] == first["digest"]
+    assert second["duplicate"] is True
+
+
+def test_read_image_not_modified(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    content = client.post(
+        f"{settings.API_V1_STR}/images/",
+        headers=normal_user_token_headers,
+        files={"file": ("photo.png", random_png(64, 64), "image/png")},
+    ).json()
+    response = client.get(content["url"])
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert not etag.startswith("W/")
+
+    response = client.get(content["url"], headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_upload_image_unsupported(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/images/",
+        headers=normal_user_token_headers,
+        files={"file": ("notes.txt", b"not an image", "text/plain")},
+    )
+    assert response.status_code == 415
+
+
+def test_upload_image_corrupt(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    body = random_png(64, 64)[:40]
+    response = client.post(
+        f"{settings.API_V1_STR}/images/",
+        headers=normal_user_token_headers,
+        files={"file": ("broken.png", body, "image/png")},
+    )
+    assert response.status_code == 415
+
+
+def test_read_image_not_found(client: TestClient) -> None:
+    response = client.get(f"{settings.API_V1_STR}/images/{'0' * 64}/full.webp")
+    assert response.status_code == 404
+
+
+def test_upload_image_recovers_from_broken_pool(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    # A worker dying mid-render breaks the whole pool
+    pool = images.get_image_pool()
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+
+    url = f"{settings.API_V1_STR}/images/"
+    files = {"file": ("photo.png", random_png(64, 64), "image/png")}
+    response = client.post(url, headers=normal_user_token_headers, files=files)
+    assert response.status_code == 503
+    response = client.post(url, headers=normal_user_token_headers, files=files)
+    assert response.status_code == 200
+    assert response.json()["duplicate"] is False
@@ -3,6 +3,7 @@ import uuid
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
+from app.api.pagination import encode_cursor
 from app.core.config import settings
 from app.tests.utils.item import create_random_item
 
@@ -79,6 +80,76 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
+def test_read_items_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"limit": 2},
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page["data"]) == 2
+    assert first_page["next_cursor"]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert second_page["data"]
+    first_ids = [item["id"] for item in first_page["data"]]
+    second_ids = [item["id"] for item in second_page["data"]]
+    assert not set(first_ids) & set(second_ids)
+    assert max(first_ids) < min(second_ids)
+
+
+def test_read_items_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    # Not a cursor, and a well-formed one whose id isn't a string
+    for cursor in ("not-a-cursor", encode_cursor([1])):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            params={"cursor": cursor},
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_items_count_matches_exact_count(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    for title in ("Foo", "Bar"):
+        response = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"title": title},
+        )
+        assert response.status_code == 200
+    item_id = response.json()["id"]
+    response = client.delete(
+        f"{settings.API_V1_STR}/items/{item_id}",
+        headers=normal_user_token_headers,
+    )
+
+    stored = client.get(
+        f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers
+    ).json()
+    exact = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"exact_count": True},
+    ).json()
+    assert stored["count"] == exact["count"] >= 1
+
+
 def test_update_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
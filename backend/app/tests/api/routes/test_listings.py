@@ -0,0 +1,496 @@
+import csv
+import io
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import crud
+from app.autocomplete import PrefixIndex
+from app.core.config import settings
+from app.models import ListingCreate
+from app.tests.utils.listing import create_random_listing
+from app.tests.utils.transaction import create_random_transaction
+from app.tests.utils.utils import random_lower_string
+
+
+def test_search_listings_full_text_ranked(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    word = random_lower_string()
+    in_description = create_random_listing(db, description=f"a {word} for hire")
+    in_title = create_random_listing(db, title=f"Camping {word}")
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={"q": word},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert [listing["id"] for listing in content] == [
+        str(in_title.id),
+        str(in_description.id),
+    ]
+
+
+def test_search_listings_full_text_with_filters(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    word = random_lower_string()
+    cheap = create_random_listing(db, title=word, price=5.0)
+    create_random_listing(db, title=word, price=50.0)
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={"q": word, "max_price": 10},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert [listing["id"] for listing in content] == [str(cheap.id)]
+
+
+def test_search_listings_paginated(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    category = random_lower_string()
+    for _ in range(3):
+        create_random_listing(db, category=category)
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={"category": category, "skip": 1, "limit": 10},
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+
+def test_search_listings_limit_is_bounded(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={"limit": 100000},
+    )
+    assert response.status_code == 422
+
+
+def test_search_listings_not_found(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={"q": random_lower_string()},
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "No listings found"
+
+
+def test_search_listings_radius_sorted_by_distance(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    category = random_lower_string()
+    # Berlin Mitte, Potsdam (~27 km) and Hamburg (~255 km)
+    near = create_random_listing(db, category=category, latitude=52.52, longitude=13.405)
+    farther = create_random_listing(db, category=category, latitude=52.39, longitude=13.065)
+    create_random_listing(db, category=category, latitude=53.55, longitude=9.993)
+    create_random_listing(db, category=category)
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={
+            "category": category,
+            "latitude": 52.40,
+            "longitude": 13.07,
+            "radius_km": 50,
+        },
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert [listing["id"] for listing in content] == [str(farther.id), str(near.id)]
+
+
+def test_search_listings_bounding_box_across_antimeridian(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    category = random_lower_string()
+    east = create_random_listing(db, category=category, latitude=-17.7, longitude=178.0)
+    west = create_random_listing(db, category=category, latitude=-14.3, longitude=-170.7)
+    create_random_listing(db, category=category, latitude=-17.7, longitude=150.0)
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={
+            "category": category,
+            "min_latitude": -20,
+            "max_latitude": -10,
+            "min_longitude": 175,
+            "max_longitude": -165,
+        },
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert {listing["id"] for listing in content} == {str(east.id), str(west.id)}
+
+
+def test_search_listings_radius_requires_point(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={"radius_km": 10},
+    )
+    assert response.status_code == 422
+
+
+def test_search_listings_facets(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    word = random_lower_string()
+    create_random_listing(db, title=word, category="tents", location="berlin", price=10)
+    create_random_listing(db, title=word, category="tents", location="paris", price=20)
+    create_random_listing(db, title=word, category="bikes", location="berlin", price=120)
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={"q": word, "limit": 1, "facets": True, "price_bucket_size": 100},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert len(content["data"]) == 1
+    facets = content["facets"]
+    assert facets["categories"] == [
+        {"value": "tents", "count": 2},
+        {"value": "bikes", "count": 1},
+    ]
+    assert facets["locations"] == [
+        {"value": "berlin", "count": 2},
+        {"value": "paris", "count": 1},
+    ]
+    assert facets["price_buckets"] == [
+        {"min_price": 0, "max_price": 100, "count": 2},
+        {"min_price": 100, "max_price": 200, "count": 1},
+    ]
+
+
+def test_search_listings_invalid_price_bucket_size(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    for size in ("Infinity", "NaN", "1e9", "0"):
+        response = client.post(
+            f"{settings.API_V1_STR}/listings/search",
+            headers={**normal_user_token_headers, "Content-Type": "application/json"},
+            content=f'{{"facets": true, "price_bucket_size": {size}}}',
+        )
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"] == ["body", "price_bucket_size"]
+
+
+def test_search_listings_facets_invalidated_on_write(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    word = random_lower_string()
+    create_random_listing(db, title=word, category="tents")
+    query = {"q": word, "facets": True}
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json=query,
+    )
+    assert response.json()["facets"]["categories"] == [{"value": "tents", "count": 1}]
+
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/",
+        headers=normal_user_token_headers,
+        json={"title": word, "category": "tents"},
+    )
+    assert response.status_code == 200
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json=query,
+    )
+    assert response.json()["facets"]["categories"] == [{"value": "tents", "count": 2}]
+
+
+def test_read_listing_cached_and_invalidated_on_update(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    url = f"{settings.API_V1_STR}/listings/{listing.id}"
+    stats_url = f"{settings.API_V1_STR}/utils/cache-stats/"
+    hits = client.get(stats_url, headers=superuser_token_headers).json()["listing"][
+        "hits"
+    ]
+    for _ in range(2):
+        response = client.get(url, headers=superuser_token_headers)
+        assert response.status_code == 200
+        assert response.json()["title"] == listing.title
+    stats = client.get(stats_url, headers=superuser_token_headers).json()["listing"]
+    assert stats["hits"] == hits + 1
+
+    response = client.put(
+        url, headers=superuser_token_headers, json={"title": "Updated title"}
+    )
+    assert response.status_code == 200
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.json()["title"] == "Updated title"
+
+
+def test_search_listings_cached_by_normalized_query(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    word = random_lower_string()
+    listing = create_random_listing(db, title=f"Camping {word}")
+    url = f"{settings.API_V1_STR}/listings/search"
+    stats_url = f"{settings.API_V1_STR}/utils/cache-stats/"
+    stats = client.get(stats_url, headers=superuser_token_headers).json()
+    hits = stats["listing_search"]["hits"]
+    facet_hits = stats["listing_facets"]["hits"]
+    for q in (word, f"  {word.upper()} "):
+        response = client.post(
+            url, headers=normal_user_token_headers, json={"q": q, "facets": True}
+        )
+        assert [found["id"] for found in response.json()["data"]] == [str(listing.id)]
+    stats = client.get(stats_url, headers=superuser_token_headers).json()
+    assert stats["listing_search"]["hits"] == hits + 1
+    assert stats["listing_facets"]["hits"] == facet_hits + 1
+
+    response = client.put(
+        f"{settings.API_V1_STR}/listings/{listing.id}",
+        headers=superuser_token_headers,
+        json={"title": "Updated title"},
+    )
+    assert response.status_code == 200
+    response = client.post(url, headers=normal_user_token_headers, json={"q": word})
+    assert response.status_code == 404
+
+
+def test_import_listings_csv(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    category = random_lower_string()
+    body = (
+        "title,price,category,latitude,longitude,images\n"
+        f"Tent,12.5,{category},52.52,13.405,https://example.com/tent.jpg\n"
+        f"Kayak,not-a-price,{category},,,\n"
+        f'"Bike, blue",30,{category},,,"[""https://example.com/bike.jpg""]"\n'
+    )
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/import",
+        headers=normal_user_token_headers,
+        files={"file": ("listings.csv", body, "text/csv")},
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 2
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 2
+    assert report["errors"][0]["errors"][0].startswith("price:")
+
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/search",
+        headers=normal_user_token_headers,
+        json={"category": category, "latitude": 52.5, "longitude": 13.4, "radius_km": 5},
+    )
+    assert response.status_code == 200
+    [tent] = response.json()
+    assert tent["title"] == "Tent"
+    assert tent["images"] == ["https://example.com/tent.jpg"]
+
+
+def test_import_listings_ndjson(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    category = random_lower_string()
+    body = (
+        f'{{"title": "Drill", "category": "{category}", "price": 5}}\n'
+        "\n"
+        "{not json\n"
+    )
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/import",
+        headers=normal_user_token_headers,
+        files={"file": ("listings.ndjson", body, "application/x-ndjson")},
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["row"] == 2
+
+
+def test_import_listings_for_other_owner_requires_superuser(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/import",
+        headers=normal_user_token_headers,
+        params={"owner_id": str(listing.owner_id)},
+        files={"file": ("listings.csv", "title\nTent\n", "text/csv")},
+    )
+    assert response.status_code == 403
+
+
+def test_export_listings(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    category = random_lower_string()
+    listings = [create_random_listing(db, category=category) for _ in range(3)]
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/export",
+        headers=superuser_token_headers,
+        params={"format": "ndjson"},
+        json={"category": category},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(row["id"] for row in rows) == sorted(
+        str(listing.id) for listing in listings
+    )
+
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/export",
+        headers=superuser_token_headers,
+        json={"category": category},
+    )
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 3
+    assert {row["category"] for row in rows} == {category}
+
+
+def test_export_listings_only_own(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    category = random_lower_string()
+    create_random_listing(db, category=category)
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    own = crud.create_listing(
+        db,
+        ListingCreate(
+            title=random_lower_string(),
+            description="",
+            price=10.0,
+            category=category,
+            location=random_lower_string(),
+        ),
+        user.id,
+    )
+    response = client.post(
+        f"{settings.API_V1_STR}/listings/export",
+        headers=normal_user_token_headers,
+        params={"format": "ndjson"},
+        json={"category": category},
+    )
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [str(own.id)]
+
+
+def test_autocomplete_listings(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    word = random_lower_string()
+    url = f"{settings.API_V1_STR}/listings/autocomplete"
+    # Builds the index before the writes below, so they go through the
+    # incremental path
+    client.get(url, params={"q": word})
+    create_random_listing(db, title=f"{word} tent")
+    for _ in range(2):
+        create_random_listing(db, title=f"{word.upper()} Stove")
+    create_random_listing(db, category=f"{word} gear")
+    response = client.get(url, params={"q": word[:10]})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"text": f"{word.upper()} Stove", "count": 2},
+        {"text": f"{word} gear", "count": 1},
+        {"text": f"{word} tent", "count": 1},
+    ]
+
+    listing = create_random_listing(db, title=f"{word} x")
+    response = client.put(
+        f"{settings.API_V1_STR}/listings/{listing.id}",
+        headers=superuser_token_headers,
+        json={"title": "Renamed"},
+    )
+    assert response.status_code == 200
+    response = client.get(url, params={"q": f"{word} x"})
+    assert response.json() == []
+
+
+def test_autocomplete_index_keeps_top_terms_current() -> None:
+    weights = {f"tent {i}": i % 7 + 1 for i in range(50)}
+    index = PrefixIndex(
+        load=lambda: list(weights.items()), max_age=3600, scan_limit=8, top_size=3
+    )
+    index.start_loading()
+    assert index.search("tent", 3) == [("tent 13", 7), ("tent 20", 7), ("tent 27", 7)]
+
+    # Entering the top list and moving within it don't rank "tent" again
+    with patch("heapq.nlargest", side_effect=AssertionError):
+        index.add("tent new", 9)
+        index.add("tent 13", 3)
+        assert index.search("tent", 3) == [
+            ("tent 13", 10),
+            ("tent new", 9),
+            ("tent 20", 7),
+        ]
+    # Leaving it does
+    index.remove("tent new", 9)
+    assert index.search("tent", 3) == [("tent 13", 10), ("tent 20", 7), ("tent 27", 7)]
+
+
+def test_search_listings_available_window(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    category = random_lower_string()
+    free = create_random_listing(db, category=category, price=20)
+    booked = create_random_listing(db, category=category, price=20)
+    create_random_listing(db, category=category, price=500)
+    # Across the new year, ending at noon on the window's first day
+    transaction = create_random_transaction(
+        db, booked, datetime(2030, 12, 30), datetime(2031, 1, 2, 12)
+    )
+    assert transaction is not None
+    url = f"{settings.API_V1_STR}/listings/search"
+    query = {
+        "category": category,
+        "max_price": 100,
+        "available_from": "2031-01-02",
+        "available_to": "2031-01-05",
+    }
+    response = client.post(url, headers=normal_user_token_headers, json=query)
+    assert [listing["id"] for listing in response.json()] == [str(free.id)]
+
+    response = client.post(
+        url,
+        headers=normal_user_token_headers,
+        json={**query, "available_from": "2031-01-03"},
+    )
+    assert {listing["id"] for listing in response.json()} == {
+        str(free.id),
+        str(booked.id),
+    }
+
+    # Canceling the booking frees the dates, and isn't served from the cache
+    response = client.put(
+        f"{settings.API_V1_STR}/transactions/{transaction.id}",
+        headers=superuser_token_headers,
+        json={"status": "canceled"},
+    )
+    assert response.status_code == 200
+    response = client.post(url, headers=normal_user_token_headers, json=query)
+    assert len(response.json()) == 2
@@ -0,0 +1,198 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import crud, realtime
+from app.api.pagination import NEXT_CURSOR_HEADER
+from app.core.config import settings
+from app.models import Message
+from app.tests.utils.user import authentication_token_from_email, create_random_user
+
+
+def test_get_conversation_newest_first(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    other = create_random_user(db)
+    third = create_random_user(db)
+    start = datetime(2026, 10, 1)
+    messages = [
+        Message(
+            sender_id=user.id if i % 2 else other.id,
+            receiver_id=other.id if i % 2 else user.id,
+            content=f"message {i}",
+            timestamp=start + timedelta(minutes=i),
+        )
+        for i in range(5)
+    ]
+    messages.append(
+        Message(
+            sender_id=user.id,
+            receiver_id=third.id,
+            content="elsewhere",
+            timestamp=start,
+        )
+    )
+    db.add_all(messages)
+    db.commit()
+
+    url = f"{settings.API_V1_STR}/messages/conversation/{other.id}"
+    contents = []
+    params: dict[str, str | int] = {"limit": 2}
+    while True:
+        response = client.get(url, headers=normal_user_token_headers, params=params)
+        assert response.status_code == 200
+        contents += [message["content"] for message in response.json()]
+        if NEXT_CURSOR_HEADER not in response.headers:
+            break
+        params["cursor"] = response.headers[NEXT_CURSOR_HEADER]
+    assert contents == [f"message {i}" for i in reversed(range(5))]
+
+
+def test_get_conversation_not_found(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    other = create_random_user(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/messages/conversation/{other.id}",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 404
+
+
+def test_inbox_tracks_last_message_and_unread(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    other = create_random_user(db)
+    other_headers = authentication_token_from_email(
+        client=client, email=other.email, db=db
+    )
+    for content in ("hello", "are you there?"):
+        response = client.post(
+            f"{settings.API_V1_STR}/messages/",
+            headers=normal_user_token_headers,
+            json={
+                "sender_id": str(user.id),
+                "receiver_id": str(other.id),
+                "content": content,
+            },
+        )
+        assert response.status_code == 200
+
+    response = client.get(
+        f"{settings.API_V1_STR}/messages/inbox", headers=other_headers
+    )
+    assert response.status_code == 200
+    [conversation] = response.json()
+    assert conversation["other_id"] == str(user.id)
+    assert conversation["last_message"] == "are you there?"
+    assert conversation["last_sender_id"] == str(user.id)
+    assert conversation["unread_count"] == 2
+
+    response = client.post(
+        f"{settings.API_V1_STR}/messages/conversation/{user.id}/read",
+        headers=other_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["unread_count"] == 0
+
+    # Sent messages aren't unread for the sender
+    response = client.get(
+        f"{settings.API_V1_STR}/messages/inbox",
+        headers=normal_user_token_headers,
+        params={"limit": 100},
+    )
+    conversations = {item["other_id"]: item for item in response.json()}
+    assert conversations[str(other.id)]["unread_count"] == 0
+    assert conversations[str(other.id)]["last_message"] == "are you there?"
+
+
+def test_mark_conversation_read_not_found(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    other = create_random_user(db)
+    response = client.post(
+        f"{settings.API_V1_STR}/messages/conversation/{other.id}/read",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 404
+
+
+def test_send_message_timestamp_without_partition(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    other = create_random_user(db)
+    response = client.post(
+        f"{settings.API_V1_STR}/messages/",
+        headers=normal_user_token_headers,
+        json={
+            "sender_id": str(user.id),
+            "receiver_id": str(other.id),
+            "content": "from the past",
+            "timestamp": "2019-05-01T00:00:00",
+        },
+    )
+    assert response.status_code == 422
+    response = client.get(
+        f"{settings.API_V1_STR}/messages/inbox", headers=normal_user_token_headers
+    )
+    assert str(other.id) not in [c["other_id"] for c in response.json()]
+
+
+def test_message_stream_pushes_new_messages(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    other = create_random_user(db)
+    other_headers = authentication_token_from_email(
+        client=client, email=other.email, db=db
+    )
+    token = normal_user_token_headers["Authorization"].removeprefix("Bearer ")
+
+    with client.websocket_connect(
+        f"{settings.API_V1_STR}/messages/ws?token={token}"
+    ) as websocket:
+        response = client.post(
+            f"{settings.API_V1_STR}/messages/",
+            headers=other_headers,
+            json={
+                "sender_id": str(other.id),
+                "receiver_id": str(user.id),
+                "content": "live",
+            },
+        )
+        assert response.status_code == 200
+        event = websocket.receive_json()
+    assert event["type"] == "message"
+    assert event["message"]["id"] == response.json()["id"]
+    assert event["message"]["content"] == "live"
+    assert event["message"]["sender_id"] == str(other.id)
+
+
+def test_message_stream_invalid_token(client: TestClient) -> None:
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect(f"{settings.API_V1_STR}/messages/ws?token=bad"):
+            pass
+    assert exc_info.value.code == 1008
+
+
+def test_slow_subscriber_is_dropped() -> None:
+    async def run() -> None:
+        hub = realtime.Hub(realtime.LocalBackend(), queue_size=2)
+        slow = await hub.subscribe("user")
+        fast = await hub.subscribe("user")
+        for i in range(3):
+            hub.publish("user", str(i))
+            await asyncio.sleep(0)
+            assert await fast.get() == str(i)
+        assert slow.overflowed.is_set()
+        assert await slow.get() is None
+
+    asyncio.run(run())
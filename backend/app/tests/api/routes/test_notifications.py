@@ -0,0 +1,406 @@
+import asyncio
+import json
+import threading
+import uuid
+from collections.abc import AsyncGenerator
+from datetime import datetime, timedelta
+from typing import cast
+from unittest.mock import patch
+
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import broadcasts, crud, realtime
+from app.api.pagination import encode_cursor
+from app.api.routes.notifications import stream_notifications
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Notification, NotificationBroadcast, NotificationCreate
+from app.tests.utils.listing import create_random_listing
+from app.tests.utils.user import authentication_token_from_email, create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def test_notification_stream_resumes_and_pushes(
+    client: TestClient, db: Session
+) -> None:
+    user = create_random_user(db)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    token = headers["Authorization"].removeprefix("Bearer ")
+    start = datetime(2026, 10, 1)
+    notifications = [
+        Notification(
+            user_id=user.id,
+            title=f"notification {i}",
+            message="",
+            timestamp=start + timedelta(minutes=i),
+        )
+        for i in range(3)
+    ]
+    db.add_all(notifications)
+    db.commit()
+    last_event_id = encode_cursor([notifications[0].timestamp, notifications[0].id])
+
+    # The stream never ends, so it is read in the client's event loop rather
+    # than through a request
+    assert client.portal is not None
+    portal = client.portal
+
+    async def open_stream() -> StreamingResponse:
+        return await stream_notifications(
+            token=token, last_event_id=None, last_event_id_header=last_event_id
+        )
+
+    async def next_event(events: AsyncGenerator[str, None]) -> str:
+        return await asyncio.wait_for(anext(events), 5)
+
+    stream = portal.call(open_stream)
+    assert stream.media_type == "text/event-stream"
+    events = cast(AsyncGenerator[str, None], stream.body_iterator)
+    try:
+        assert '"title":"notification 1"' in portal.call(next_event, events)
+        assert '"title":"notification 2"' in portal.call(next_event, events)
+
+        response = client.post(
+            f"{settings.API_V1_STR}/notifications/",
+            json={"user_id": str(user.id), "title": "live", "message": "now"},
+        )
+        assert response.status_code == 200
+        event = portal.call(next_event, events)
+        assert event.startswith("id: ")
+        assert '"title":"live"' in event
+    finally:
+        portal.call(events.aclose)
+        assert stream.background is not None
+        portal.call(stream.background)
+
+
+def test_notification_stream_flags_truncated(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    token = headers["Authorization"].removeprefix("Bearer ")
+    assert client.portal is not None
+    portal = client.portal
+
+    async def open_stream() -> StreamingResponse:
+        return await stream_notifications(
+            token=token, last_event_id=None, last_event_id_header=None
+        )
+
+    async def next_event(events: AsyncGenerator[str, None]) -> str:
+        return await asyncio.wait_for(anext(events), 5)
+
+    stream = portal.call(open_stream)
+    events = cast(AsyncGenerator[str, None], stream.body_iterator)
+    try:
+        response = client.post(
+            f"{settings.API_V1_STR}/notifications/",
+            json={"user_id": str(user.id), "title": "t" * 10000, "message": "m" * 10000},
+        )
+        assert response.status_code == 200
+        event = portal.call(next_event, events)
+        data = json.loads(event.split("data: ", 1)[1])
+        assert data["id"] == response.json()["id"]
+        assert data["truncated"] is True
+        assert len(data["title"]) < 10000
+    finally:
+        portal.call(events.aclose)
+        assert stream.background is not None
+        portal.call(stream.background)
+
+
+def test_notification_stream_invalid_token(client: TestClient) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/notifications/stream", params={"token": "bad"}
+    )
+    assert response.status_code == 403
+
+
+def test_create_notification_publishes_best_effort(
+    client: TestClient, db: Session
+) -> None:
+    user = create_random_user(db)
+    url = f"{settings.API_V1_STR}/notifications/"
+    data = {"user_id": str(user.id), "title": "t" * 10000, "message": "m" * 10000}
+    published: list[str] = []
+
+    with patch.object(
+        realtime.hub.backend,
+        "publish",
+        side_effect=lambda topic, payload: published.append(payload),
+    ):
+        response = client.post(url, json=data)
+    assert response.status_code == 200
+    assert len(published[0].encode()) <= realtime.MAX_EVENT_BYTES
+    event = json.loads(published[0])
+    assert event["truncated"]
+    assert len(event["notification"]["title"]) < 10000
+
+    with patch.object(
+        realtime.hub.backend, "publish", side_effect=RuntimeError("payload too long")
+    ):
+        response = client.post(url, json=data)
+    assert response.status_code == 200
+
+
+def test_unread_notification_count(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    ids = []
+    for title in ["first", "second"]:
+        response = client.post(
+            f"{settings.API_V1_STR}/notifications/",
+            json={"user_id": str(user.id), "title": title, "message": ""},
+        )
+        assert response.status_code == 200
+        ids.append(response.json()["id"])
+
+    url = f"{settings.API_V1_STR}/notifications/unread-count"
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"count": 2}
+    assert "private" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    for _ in range(2):
+        response = client.patch(
+            f"{settings.API_V1_STR}/notifications/{ids[0]}", headers=headers
+        )
+        assert response.status_code == 200
+        assert response.json()["is_read"] is True
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == {"count": 1}
+
+
+def test_mark_notification_read_concurrently(db: Session) -> None:
+    user = create_random_user(db)
+    notification = crud.create_notification(
+        db, NotificationCreate(user_id=user.id, title="race", message="")
+    )
+    barrier = threading.Barrier(4)
+
+    def mark_read() -> None:
+        with Session(engine) as session:
+            db_notification = session.get(Notification, notification.id)
+            assert db_notification is not None
+            barrier.wait()
+            crud.mark_notification_read(session, db_notification)
+
+    threads = [threading.Thread(target=mark_read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.expire_all()
+    assert crud.get_user_stats(session=db, user_id=user.id).unread_notification_count == 0
+
+
+def test_create_notification_unknown_user(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/notifications/",
+        json={"user_id": str(uuid.uuid4()), "title": "lost", "message": ""},
+    )
+    assert response.status_code == 404
+
+
+def test_create_notification_timestamp_without_partition(
+    client: TestClient, db: Session
+) -> None:
+    user = create_random_user(db)
+    response = client.post(
+        f"{settings.API_V1_STR}/notifications/",
+        json={
+            "user_id": str(user.id),
+            "title": "from the future",
+            "message": "",
+            "timestamp": "2030-05-01T00:00:00",
+        },
+    )
+    assert response.status_code == 422
+    db.expire_all()
+    assert crud.get_user_stats(session=db, user_id=user.id).unread_notification_count == 0
+
+
+def test_bulk_read_and_dismiss_notifications(
+    client: TestClient, db: Session
+) -> None:
+    user = create_random_user(db)
+    other = create_random_user(db)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    start = datetime(2026, 10, 1)
+    notifications = [
+        crud.create_notification(
+            db,
+            NotificationCreate(
+                user_id=user.id,
+                title=f"notification {i}",
+                message="",
+                timestamp=start + timedelta(minutes=i),
+            ),
+        )
+        for i in range(4)
+    ]
+    foreign = crud.create_notification(
+        db, NotificationCreate(user_id=other.id, title="not mine", message="")
+    )
+
+    url = f"{settings.API_V1_STR}/notifications"
+    response = client.post(
+        f"{url}/read",
+        headers=headers,
+        json={"ids": [str(notifications[0].id), str(foreign.id)]},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 1}
+
+    # The first one is already read
+    response = client.post(
+        f"{url}/read",
+        headers=headers,
+        json={"before": (start + timedelta(minutes=2)).isoformat()},
+    )
+    assert response.json() == {"count": 1}
+    response = client.get(f"{url}/unread-count", headers=headers)
+    assert response.json() == {"count": 2}
+
+    response = client.post(
+        f"{url}/dismiss",
+        headers=headers,
+        json={"ids": [str(notification.id) for notification in notifications[1:]]},
+    )
+    assert response.json() == {"count": 3}
+    response = client.get(f"{url}/unread-count", headers=headers)
+    assert response.json() == {"count": 0}
+    response = client.get(f"{url}/", headers=headers)
+    assert [notification["title"] for notification in response.json()] == [
+        "notification 0"
+    ]
+
+    db.expire_all()
+    assert crud.get_user_stats(session=db, user_id=other.id).unread_notification_count == 1
+
+
+def test_bulk_read_notifications_requires_selection(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/notifications/read",
+        headers=normal_user_token_headers,
+        json={},
+    )
+    assert response.status_code == 422
+
+
+def test_broadcast_to_listing_category(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    category = random_lower_string()
+    owners = {create_random_listing(db, category=category).owner_id for _ in range(3)}
+    outsider = create_random_listing(db).owner_id
+
+    url = f"{settings.API_V1_STR}/notifications/broadcasts"
+    response = client.post(
+        url,
+        headers=superuser_token_headers,
+        json={
+            "title": "Sale",
+            "message": "Everything half off",
+            "audience": "listing_category",
+            "category": category,
+        },
+    )
+    assert response.status_code == 202
+    assert response.json()["total"] == 3
+    # Broadcasts run one at a time, so this returns once it is done
+    broadcasts.get_broadcast_executor().submit(lambda: None).result()
+
+    response = client.get(f"{url}/{response.json()['id']}", headers=superuser_token_headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert response.json()["sent"] == 3
+    db.expire_all()
+    for owner_id in owners:
+        assert crud.get_user_stats(session=db, user_id=owner_id).unread_notification_count == 1
+    assert crud.get_user_stats(session=db, user_id=outsider).unread_notification_count == 0
+
+
+def test_broadcast_in_chunks_resumes(db: Session) -> None:
+    category = random_lower_string()
+    owners = sorted(
+        create_random_listing(db, category=category).owner_id for _ in range(3)
+    )
+    title = random_lower_string()
+    broadcast = NotificationBroadcast(
+        title=title,
+        message="",
+        audience="listing_category",
+        category=category,
+        created_by=owners[0],
+    )
+    db.add(broadcast)
+    db.commit()
+
+    assert broadcasts.send_chunk(engine, broadcast.id, chunk_size=2)
+    db.refresh(broadcast)
+    assert (broadcast.status, broadcast.sent) == ("running", 2)
+    assert broadcast.last_user_id == owners[1]
+
+    broadcasts.run_broadcast(engine, broadcast.id, chunk_size=2)
+    broadcasts.run_broadcast(engine, broadcast.id, chunk_size=2)
+    db.refresh(broadcast)
+    assert (broadcast.status, broadcast.sent) == ("completed", 3)
+    notifications = db.exec(
+        select(Notification).where(Notification.title == title)
+    ).all()
+    assert sorted(notification.user_id for notification in notifications) == owners
+
+
+def test_broadcast_chunks_are_stamped_and_published(db: Session) -> None:
+    category = random_lower_string()
+    owners = {create_random_listing(db, category=category).owner_id for _ in range(2)}
+    broadcast = NotificationBroadcast(
+        title=random_lower_string(),
+        message="",
+        audience="listing_category",
+        category=category,
+        created_by=next(iter(owners)),
+        created_at=datetime.utcnow() - timedelta(minutes=5),
+    )
+    db.add(broadcast)
+    db.commit()
+    published: list[tuple[str, str]] = []
+
+    started = datetime.utcnow()
+    # One publish per chunk, not per recipient
+    with patch.object(
+        realtime.hub.backend, "publish_many", side_effect=published.extend
+    ) as publish_many:
+        broadcasts.run_broadcast(engine, broadcast.id, chunk_size=1)
+    assert [len(call.args[0]) for call in publish_many.call_args_list] == [1, 1, 0]
+
+    assert {topic for topic, _ in published} == {
+        realtime.notification_topic(owner_id) for owner_id in owners
+    }
+    notifications = db.exec(
+        select(Notification).where(Notification.title == broadcast.title)
+    ).all()
+    # Later than any event a stream received before the chunk was sent
+    assert all(notification.timestamp >= started for notification in notifications)
+    assert {json.loads(payload)["notification"]["id"] for _, payload in published} == {
+        str(notification.id) for notification in notifications
+    }
+
+
+def test_broadcast_requires_superuser(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/notifications/broadcasts",
+        headers=normal_user_token_headers,
+        json={"title": "Hi", "message": ""},
+    )
+    assert response.status_code == 403
@@ -0,0 +1,513 @@
+import threading
+from datetime import datetime
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm.exc import StaleDataError
+from sqlmodel import Session, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Transaction, TransactionCreate, TransactionUpdate, User
+from app.tests.utils.listing import create_random_listing
+from app.tests.utils.transaction import (
+    create_random_transaction,
+    set_transaction_status,
+)
+from app.tests.utils.user import authentication_token_from_email, create_random_user
+
+
+def booking(
+    listing_id: str, lender_id: str, renter_id: str, start: str, end: str
+) -> dict[str, object]:
+    return {
+        "listing_id": listing_id,
+        "renter_id": renter_id,
+        "lender_id": lender_id,
+        "start_date": start,
+        "end_date": end,
+        "total_price": 30.0,
+        "status": "pending",
+    }
+
+
+def test_create_transaction_rejects_overlap(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    renter = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert renter is not None
+    create_random_transaction(db, listing, datetime(2030, 6, 5), datetime(2030, 6, 8))
+    url = f"{settings.API_V1_STR}/transactions/"
+    args = (str(listing.id), str(listing.owner_id), str(renter.id))
+
+    response = client.post(
+        url,
+        headers=normal_user_token_headers,
+        json=booking(*args, "2030-06-07T00:00:00", "2030-06-10T00:00:00"),
+    )
+    assert response.status_code == 409
+
+    # Back-to-back bookings don't overlap
+    response = client.post(
+        url,
+        headers=normal_user_token_headers,
+        json=booking(*args, "2030-06-08T00:00:00", "2030-06-10T00:00:00"),
+    )
+    assert response.status_code == 200
+
+
+def test_create_transaction_ignores_canceled_bookings(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    renter = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert renter is not None
+    create_random_transaction(
+        db, listing, datetime(2030, 6, 5), datetime(2030, 6, 8), status="canceled"
+    )
+    response = client.post(
+        f"{settings.API_V1_STR}/transactions/",
+        headers=normal_user_token_headers,
+        json=booking(
+            str(listing.id),
+            str(listing.owner_id),
+            str(renter.id),
+            "2030-06-06T00:00:00",
+            "2030-06-07T00:00:00",
+        ),
+    )
+    assert response.status_code == 200
+
+
+def test_create_transaction_for_others_refused(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user is not None
+    other = create_random_user(db)
+    url = f"{settings.API_V1_STR}/transactions/"
+    start, end = "2030-06-20T00:00:00", "2030-06-22T00:00:00"
+
+    # Booking in someone else's name
+    response = client.post(
+        url,
+        headers=normal_user_token_headers,
+        json=booking(str(listing.id), str(listing.owner_id), str(other.id), start, end),
+    )
+    assert response.status_code == 403
+    # Crediting someone other than the listing's owner
+    response = client.post(
+        url,
+        headers=normal_user_token_headers,
+        json=booking(str(listing.id), str(other.id), str(user.id), start, end),
+    )
+    assert response.status_code == 422
+    assert crud.get_user_stats(session=db, user_id=other.id).transaction_count == 0
+
+    response = client.post(
+        url,
+        headers=normal_user_token_headers,
+        json=booking(str(listing.id), str(listing.owner_id), str(user.id), start, end),
+    )
+    assert response.status_code == 200
+
+
+def test_create_transaction_invalid_dates(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    renter = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert renter is not None
+    response = client.post(
+        f"{settings.API_V1_STR}/transactions/",
+        headers=normal_user_token_headers,
+        json=booking(
+            str(listing.id),
+            str(listing.owner_id),
+            str(renter.id),
+            "2030-06-08T00:00:00",
+            "2030-06-05T00:00:00",
+        ),
+    )
+    assert response.status_code == 422
+
+
+def test_create_transaction_only_pending(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    renter = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert renter is not None
+    data = booking(
+        str(listing.id),
+        str(listing.owner_id),
+        str(renter.id),
+        "2030-06-12T00:00:00",
+        "2030-06-14T00:00:00",
+    )
+    url = f"{settings.API_V1_STR}/transactions/"
+    for status in ("completed", "bogus"):
+        response = client.post(
+            url, headers=normal_user_token_headers, json={**data, "status": status}
+        )
+        assert response.status_code == 422
+
+    del data["status"]
+    response = client.post(url, headers=normal_user_token_headers, json=data)
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+
+
+def test_concurrent_overlapping_bookings(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    renter = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert renter is not None
+    args = (str(listing.id), str(listing.owner_id), str(renter.id))
+
+    statuses = []
+    with Session(engine) as first:
+        # Hold the listing lock with an uncommitted booking while a request
+        # tries to book overlapping dates
+        crud.lock_listing(first, listing.id)
+        first.add(
+            Transaction.model_validate(
+                booking(*args, "2030-07-01T00:00:00", "2030-07-04T00:00:00")
+            )
+        )
+        first.flush()
+
+        def book() -> None:
+            response = client.post(
+                f"{settings.API_V1_STR}/transactions/",
+                headers=normal_user_token_headers,
+                json=booking(*args, "2030-07-02T00:00:00", "2030-07-05T00:00:00"),
+            )
+            statuses.append(response.status_code)
+
+        thread = threading.Thread(target=book)
+        thread.start()
+        thread.join(timeout=0.5)
+        assert thread.is_alive()
+        first.commit()
+        thread.join()
+    assert statuses == [409]
+
+
+def test_update_transaction_rejects_overlap(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    create_random_transaction(db, listing, datetime(2030, 7, 20), datetime(2030, 7, 23))
+    transaction = create_random_transaction(
+        db, listing, datetime(2030, 7, 25), datetime(2030, 7, 27)
+    )
+    response = client.put(
+        f"{settings.API_V1_STR}/transactions/{transaction.id}",
+        headers=superuser_token_headers,
+        json={"start_date": "2030-07-22T00:00:00"},
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Listing is already booked for these dates"
+
+
+def test_update_transaction_stale_write(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    transaction = create_random_transaction(
+        db, listing, datetime(2030, 7, 28), datetime(2030, 7, 30), status="pending"
+    )
+    update_lender_earnings = crud.update_lender_earnings
+
+    def update_concurrently(*args: Any, **kwargs: Any) -> None:
+        # Another request commits its update after this one read version 1
+        with Session(engine) as other:
+            concurrent = other.get(Transaction, transaction.id)
+            if concurrent.version == 1:
+                concurrent.total_price = 99.0
+                other.add(concurrent)
+                other.commit()
+        update_lender_earnings(*args, **kwargs)
+
+    url = f"{settings.API_V1_STR}/transactions/{transaction.id}"
+    with patch("app.crud.update_lender_earnings", side_effect=update_concurrently):
+        response = client.put(
+            url, headers=superuser_token_headers, json={"status": "approved"}
+        )
+    assert response.status_code == 409
+    content = client.get(url, headers=superuser_token_headers).json()
+    assert (content["status"], content["total_price"], content["version"]) == (
+        "pending",
+        99.0,
+        2,
+    )
+
+
+def test_read_transactions_by_role_newest_first(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user is not None
+    other = create_random_user(db)
+    own_listing = create_random_listing(db, owner_id=user.id)
+    rented = []
+    for day in (1, 10):
+        transaction = crud.create_transaction(
+            db,
+            TransactionCreate(
+                listing_id=create_random_listing(db, owner_id=other.id).id,
+                renter_id=user.id,
+                lender_id=other.id,
+                start_date=datetime(2031, 3, day),
+                end_date=datetime(2031, 3, day + 2),
+                total_price=10.0,
+            ),
+        )
+        rented.append(set_transaction_status(db, transaction, "completed"))
+    lent = crud.create_transaction(
+        db,
+        TransactionCreate(
+            listing_id=own_listing.id,
+            renter_id=other.id,
+            lender_id=user.id,
+            start_date=datetime(2031, 3, 5),
+            end_date=datetime(2031, 3, 7),
+            total_price=10.0,
+        ),
+    )
+    url = f"{settings.API_V1_STR}/transactions/"
+
+    response = client.get(
+        url, headers=normal_user_token_headers, params={"role": "lender"}
+    )
+    content = response.json()
+    assert [t["id"] for t in content["data"]] == [str(lent.id)]
+    assert content["count"] == 1
+
+    response = client.get(
+        url,
+        headers=normal_user_token_headers,
+        params={"role": "both", "status": "completed", "limit": 1},
+    )
+    content = response.json()
+    assert content["count"] == 2
+    assert [t["id"] for t in content["data"]] == [str(rented[1].id)]
+    response = client.get(
+        url,
+        headers=normal_user_token_headers,
+        params={"status": "completed", "limit": 1, "cursor": content["next_cursor"]},
+    )
+    assert [t["id"] for t in response.json()["data"]] == [str(rented[0].id)]
+
+
+def test_update_transaction_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    transaction = create_random_transaction(
+        db, listing, datetime(2030, 7, 1), datetime(2030, 7, 3), status="pending"
+    )
+    url = f"{settings.API_V1_STR}/transactions/{transaction.id}"
+    etag = client.get(url, headers=superuser_token_headers).headers["etag"]
+
+    response = client.put(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"status": "approved"},
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["etag"] != etag
+
+    # Another client still holding the first version
+    response = client.put(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"status": "canceled"},
+    )
+    assert response.status_code == 409
+    response = client.delete(url, headers={**superuser_token_headers, "If-Match": etag})
+    assert response.status_code == 409
+    assert (
+        client.get(url, headers=superuser_token_headers).json()["status"] == "approved"
+    )
+
+
+def test_update_transaction_status_transitions(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    transaction = create_random_transaction(
+        db, listing, datetime(2030, 7, 5), datetime(2030, 7, 7), status="pending"
+    )
+    url = f"{settings.API_V1_STR}/transactions/{transaction.id}"
+
+    response = client.put(
+        url, headers=superuser_token_headers, json={"status": "completed"}
+    )
+    assert response.status_code == 409
+    response = client.put(
+        url, headers=superuser_token_headers, json={"status": "canceled"}
+    )
+    assert response.status_code == 200
+    response = client.put(
+        url, headers=superuser_token_headers, json={"status": "pending"}
+    )
+    assert response.status_code == 409
+
+
+def test_update_transaction_concurrent_modification(db: Session) -> None:
+    listing = create_random_listing(db)
+    transaction = create_random_transaction(
+        db, listing, datetime(2030, 7, 9), datetime(2030, 7, 11), status="pending"
+    )
+    with Session(engine) as first, Session(engine) as second:
+        stale = second.get(Transaction, transaction.id)
+        assert crud.update_transaction(
+            first, transaction.id, TransactionUpdate(status="approved")
+        )
+        # second read version 1 before first's update committed
+        stale.total_price = 99.0
+        second.add(stale)
+        with pytest.raises(StaleDataError):
+            second.commit()
+
+
+def test_read_transaction_stats(client: TestClient, db: Session) -> None:
+    listing = create_random_listing(db)
+    lender = db.get(User, listing.owner_id)
+    headers = authentication_token_from_email(client=client, email=lender.email, db=db)
+    pending = create_random_transaction(
+        db, listing, datetime(2030, 8, 1), datetime(2030, 8, 3), status="pending"
+    )
+    completed = create_random_transaction(
+        db,
+        listing,
+        datetime(2030, 8, 3, 12),
+        datetime(2030, 8, 3, 18),
+        status="completed",
+    )
+    approved = create_random_transaction(
+        db, listing, datetime(2030, 9, 9), datetime(2030, 9, 11)
+    )
+    for status in ("approved", "completed"):
+        response = client.put(
+            f"{settings.API_V1_STR}/transactions/{pending.id}",
+            headers=headers,
+            json={"status": status},
+        )
+        assert response.status_code == 200
+    assert crud.update_transaction(
+        db, approved.id, TransactionUpdate(status="canceled")
+    )
+
+    url = f"{settings.API_V1_STR}/transactions/stats"
+    params = {"start_date": "2030-08-01", "end_date": "2030-10-01"}
+    response = client.get(url, headers=headers, params=params)
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [
+            # A booking counts on its last day, so 2030-08-01 to 08-03 on 08-02
+            {
+                "start": "2030-08-02",
+                "completed_count": 1,
+                "canceled_count": 0,
+                "earnings": 10.0,
+            },
+            {
+                "start": "2030-08-03",
+                "completed_count": 1,
+                "canceled_count": 0,
+                "earnings": 10.0,
+            },
+            {
+                "start": "2030-09-10",
+                "completed_count": 0,
+                "canceled_count": 1,
+                "earnings": 0.0,
+            },
+        ],
+        "completed_count": 2,
+        "canceled_count": 1,
+        "earnings": 20.0,
+    }
+
+    crud.delete_transaction(db, completed.id)
+    response = client.get(url, headers=headers, params={**params, "period": "month"})
+    assert response.json()["data"] == [
+        {
+            "start": "2030-08-01",
+            "completed_count": 1,
+            "canceled_count": 0,
+            "earnings": 10.0,
+        },
+        {
+            "start": "2030-09-01",
+            "completed_count": 0,
+            "canceled_count": 1,
+            "earnings": 0.0,
+        },
+    ]
+
+    response = client.get(
+        url,
+        headers=headers,
+        params={"start_date": "2030-01-01", "end_date": "2031-06-01"},
+    )
+    assert response.status_code == 422
+
+
+def test_delete_transaction_of_deleted_listing(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    transaction = create_random_transaction(
+        db, listing, datetime(2030, 10, 1), datetime(2030, 10, 3)
+    )
+    other = create_random_transaction(
+        db, listing, datetime(2030, 10, 5), datetime(2030, 10, 7)
+    )
+    crud.delete_listing(db, listing.id)
+
+    response = client.delete(
+        f"{settings.API_V1_STR}/transactions/{transaction.id}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["id"] == str(transaction.id)
+    listing_id, other_id = listing.id, other.id
+    db.expire_all()
+    assert db.exec(
+        select(Transaction.id).where(Transaction.listing_id == listing_id)
+    ).all() == [other_id]
+
+
+def test_update_transaction_of_deleted_listing(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    listing = create_random_listing(db)
+    transaction = create_random_transaction(
+        db, listing, datetime(2030, 10, 10), datetime(2030, 10, 12), status="pending"
+    )
+    create_random_transaction(db, listing, datetime(2030, 10, 14), datetime(2030, 10, 16))
+    crud.delete_listing(db, listing.id)
+    url = f"{settings.API_V1_STR}/transactions/{transaction.id}"
+
+    response = client.put(
+        url,
+        headers=superuser_token_headers,
+        json={"end_date": datetime(2030, 10, 13).isoformat()},
+    )
+    assert response.status_code == 404
+    response = client.put(
+        url, headers=superuser_token_headers, json={"status": "canceled"}
+    )
+    assert response.status_code == 200
+    assert response.json()["status"] == "canceled"
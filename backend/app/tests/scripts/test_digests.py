@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.db import engine
+from app.digests import send_digests
+from app.models import NotificationCreate
+from app.tests.utils.user import create_random_user
+
+
+def test_send_digests(db: Session) -> None:
+    user = create_random_user(db)
+    other = create_random_user(db)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    def notify(user_id: Any, title: str, minutes: int) -> None:
+        crud.create_notification(
+            db,
+            NotificationCreate(
+                user_id=user_id,
+                title=title,
+                message=f"{title} <b>message</b>",
+                timestamp=now + timedelta(minutes=minutes),
+            ),
+        )
+
+    for i in range(3):
+        notify(user.id, f"notification {i}", -30 + i)
+    notify(user.id, "too old", -90)
+    notify(other.id, "for other", -5)
+    read = crud.create_notification(
+        db,
+        NotificationCreate(
+            user_id=user.id,
+            title="read",
+            message="",
+            timestamp=now - timedelta(minutes=1),
+        ),
+    )
+    crud.mark_notification_read(db, read)
+
+    # Other tests' notifications may be due too, so only ours are looked at
+    sent: dict[str, list[tuple[str, str]]] = {}
+
+    def send_email(*, email_to: str, subject: str, html_content: str, **_: Any) -> Any:
+        sent.setdefault(email_to, []).append((subject, html_content))
+        return MagicMock(success=True)
+
+    def run(at: datetime) -> None:
+        sent.clear()
+        send_digests(engine, now=at, batch_size=2)
+
+    with (
+        patch("app.utils.send_email", side_effect=send_email),
+        patch("app.utils.smtp_backend"),
+        patch("app.core.config.settings.NOTIFICATION_DIGEST_MAX_AGE_HOURS", 1),
+        patch("app.core.config.settings.NOTIFICATION_DIGEST_MAX_ITEMS", 2),
+    ):
+        run(now)
+        [(subject, html)] = sent[user.email]
+        assert "3 new notifications" in subject
+        assert "notification 2" in html and "notification 1" in html
+        assert "notification 0" not in html
+        assert "And 1 more" in html
+        assert "too old" not in html and ">read<" not in html
+        assert "&lt;b&gt;message&lt;/b&gt;" in html
+        [(subject, html)] = sent[other.email]
+        assert "1 new notification" in subject
+        assert "for other" in html
+
+        # At most one digest per window, and only of what came since
+        notify(user.id, "later", 5)
+        run(now + timedelta(minutes=10))
+        assert user.email not in sent and other.email not in sent
+        run(now + timedelta(minutes=60))
+        [(subject, html)] = sent[user.email]
+        assert "1 new notification" in subject
+        assert "later" in html and "notification 2" not in html
+        assert other.email not in sent
+
+
+def test_send_digests_retries_failures(db: Session) -> None:
+    user = create_random_user(db)
+    now = datetime.utcnow().replace(microsecond=0)
+    crud.create_notification(
+        db,
+        NotificationCreate(
+            user_id=user.id,
+            title="retry",
+            message="",
+            timestamp=now - timedelta(minutes=1),
+        ),
+    )
+    attempts: list[str] = []
+
+    def send_email(*, email_to: str, **_: Any) -> Any:
+        attempts.append(email_to)
+        # The first attempt for the user fails
+        return MagicMock(success=email_to != user.email or attempts.count(email_to) > 1)
+
+    with (
+        patch("app.utils.send_email", side_effect=send_email),
+        patch("app.utils.smtp_backend"),
+    ):
+        send_digests(engine, now=now)
+        send_digests(engine, now=now + timedelta(minutes=1))
+        send_digests(engine, now=now + timedelta(minutes=2))
+    assert attempts.count(user.email) == 2
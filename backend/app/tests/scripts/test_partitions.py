@@ -0,0 +1,50 @@
+from datetime import date, datetime
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.db import engine
+from app.models import Notification, NotificationCreate
+from app.partitions import (
+    create_partition,
+    drop_partition,
+    partition_name,
+    partitioned_tables,
+)
+from app.tests.utils.user import create_random_user
+
+
+def test_drop_notification_partition(db: Session) -> None:
+    month = date(2099, 2, 1)
+    name = partition_name("notification", month)
+    # Attaching a partition locks the parent table, so it would wait for
+    # the session's open transaction if earlier tests left one
+    db.commit()
+    with engine.begin() as connection:
+        create_partition(connection, "notification", month)
+
+    user = create_random_user(db)
+    crud.create_notification(
+        db,
+        NotificationCreate(
+            user_id=user.id, title="old", message="", timestamp=datetime(2099, 2, 3)
+        ),
+    )
+    read = crud.create_notification(
+        db,
+        NotificationCreate(
+            user_id=user.id, title="old", message="", timestamp=datetime(2099, 2, 4)
+        ),
+    )
+    crud.mark_notification_read(db, read)
+    read_id = read.id
+    assert crud.get_user_stats(session=db, user_id=user.id).unread_notification_count == 1
+    # DETACH ... CONCURRENTLY waits for open transactions
+    db.commit()
+
+    table = next(table for table in partitioned_tables() if table.name == "notification")
+    drop_partition(engine, table, name)
+
+    db.expire_all()
+    assert db.get(Notification, read_id) is None
+    assert crud.get_user_stats(session=db, user_id=user.id).unread_notification_count == 0
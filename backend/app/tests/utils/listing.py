@@ -0,0 +1,26 @@
+import uuid
+
+from sqlmodel import Session
+
+from app import crud
+from app.models import Listing, ListingCreate
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_listing(
+    db: Session, owner_id: uuid.UUID | None = None, **fields: object
+) -> Listing:
+    if owner_id is None:
+        owner_id = create_random_user(db).id
+    assert owner_id is not None
+    data = {
+        "title": random_lower_string(),
+        "description": random_lower_string(),
+        "price": 10.0,
+        "category": random_lower_string(),
+        "location": random_lower_string(),
+    }
+    data.update(fields)
+    listing_in = ListingCreate(**data)
+    return crud.create_listing(db, listing_in, owner_id)
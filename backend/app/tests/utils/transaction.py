@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from sqlmodel import Session
+
+from app import crud
+from app.models import Listing, Transaction, TransactionCreate, TransactionUpdate
+from app.tests.utils.user import create_random_user
+
+# The status changes taking a new, pending transaction to each status
+STATUS_CHANGES = {
+    "pending": [],
+    "approved": ["approved"],
+    "completed": ["approved", "completed"],
+    "canceled": ["canceled"],
+}
+
+
+def set_transaction_status(
+    db: Session, transaction: Transaction, status: str
+) -> Transaction:
+    for change in STATUS_CHANGES[status]:
+        updated = crud.update_transaction(
+            db, transaction.id, TransactionUpdate(status=change)
+        )
+        assert updated is not None
+        transaction = updated
+    return transaction
+
+
+def create_random_transaction(
+    db: Session,
+    listing: Listing,
+    start_date: datetime,
+    end_date: datetime,
+    status: str = "approved",
+) -> Transaction:
+    renter = create_random_user(db)
+    transaction_in = TransactionCreate(
+        listing_id=listing.id,
+        renter_id=renter.id,
+        lender_id=listing.owner_id,
+        start_date=start_date,
+        end_date=end_date,
+        total_price=10.0,
+    )
+    transaction = crud.create_transaction(db, transaction_in)
+    return set_transaction_status(db, transaction, status)
@@ -1,11 +1,14 @@
 import logging
+from collections.abc import Sequence
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
 import emails  # type: ignore
 import jwt
+from emails.backend.smtp import SMTPBackend  # type: ignore
 from jinja2 import Template
 from jwt.exceptions import InvalidTokenError
 
@@ -18,37 +21,59 @@ class EmailData:
     subject: str
 
 
-def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
+@lru_cache
+def _email_template(template_name: str) -> Template:
     template_str = (
         Path(__file__).parent / "email-templates" / "build" / template_name
     ).read_text()
-    html_content = Template(template_str).render(context)
+    return Template(template_str)
+
+
+def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
+    html_content = _email_template(template_name).render(context)
     return html_content
 
 
+def _smtp_options() -> dict[str, Any]:
+    smtp_options: dict[str, Any] = {
+        "host": settings.SMTP_HOST,
+        "port": settings.SMTP_PORT,
+    }
+    if settings.SMTP_TLS:
+        smtp_options["tls"] = True
+    elif settings.SMTP_SSL:
+        smtp_options["ssl"] = True
+    if settings.SMTP_USER:
+        smtp_options["user"] = settings.SMTP_USER
+    if settings.SMTP_PASSWORD:
+        smtp_options["password"] = settings.SMTP_PASSWORD
+    return smtp_options
+
+
+def smtp_backend() -> SMTPBackend:
+    """
+    One SMTP connection to send many emails through with send_email,
+    instead of a connection per email. close() it when done.
+    """
+    return SMTPBackend(**_smtp_options())
+
+
 def send_email(
     *,
     email_to: str,
     subject: str = "",
     html_content: str = "",
-) -> None:
+    smtp: SMTPBackend | None = None,
+) -> Any:
     assert settings.emails_enabled, "no provided configuration for email variables"
     message = emails.Message(
         subject=subject,
         html=html_content,
         mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
     )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
-    if settings.SMTP_TLS:
-        smtp_options["tls"] = True
-    elif settings.SMTP_SSL:
-        smtp_options["ssl"] = True
-    if settings.SMTP_USER:
-        smtp_options["user"] = settings.SMTP_USER
-    if settings.SMTP_PASSWORD:
-        smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
+    response = message.send(to=email_to, smtp=smtp or _smtp_options())
     logging.info(f"send email result: {response}")
+    return response
 
 
 def generate_test_email(email_to: str) -> EmailData:
@@ -96,6 +121,29 @@ def generate_new_account_email(
     return EmailData(html_content=html_content, subject=subject)
 
 
+def generate_notification_digest_email(
+    email_to: str, notifications: Sequence[Any], count: int
+) -> EmailData:
+    """
+    One email for `count` unread notifications, listing `notifications`
+    (objects with a title and a message) and how many more there are.
+    """
+    project_name = settings.PROJECT_NAME
+    subject = f"{project_name} - {count} new notification{'s' if count != 1 else ''}"
+    html_content = render_email_template(
+        template_name="notification_digest.html",
+        context={
+            "project_name": settings.PROJECT_NAME,
+            "email": email_to,
+            "notifications": notifications,
+            "count": count,
+            "more": count - len(notifications),
+            "link": settings.server_host,
+        },
+    )
+    return EmailData(html_content=html_content, subject=subject)
+
+
 def generate_password_reset_token(email: str) -> str:
     delta = timedelta(hours=settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS)
     now = datetime.now(timezone.utc)
@@ -6,5 +6,8 @@ python /app/app/backend_pre_start.py
 # Run migrations
 alembic upgrade head
 
+# Create upcoming partitions and drop expired ones
+python /app/app/partitions.py
+
 # Create initial data in DB
 python /app/app/initial_data.py